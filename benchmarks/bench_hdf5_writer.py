@@ -0,0 +1,93 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Compare BIOM HDF5 writers on a synthetic AG-sized table
+
+Reports write time, read time and file size for biom.Table.to_hdf5 and for
+q2_american_gut's chunked writer under each available codec.
+
+    python benchmarks/bench_hdf5_writer.py --samples 30000 --features 50000
+"""
+import argparse
+import os
+import tempfile
+import time
+import warnings
+
+import biom
+import h5py
+import numpy as np
+import scipy.sparse as ss
+
+from q2_american_gut._hdf5 import COMPRESSIONS, write_table
+
+
+def synthetic_table(n_features, n_samples, density, seed):
+    """Sparse, long-tailed counts resembling a deblurred AG table"""
+    rng = np.random.RandomState(seed)
+    nnz = int(n_features * n_samples * density)
+    # feature prevalence is heavily skewed, so draw rows from a power law
+    rows = np.minimum((rng.pareto(1.2, nnz) * n_features / 50).astype(int),
+                      n_features - 1)
+    cols = rng.randint(0, n_samples, nnz)
+    data = np.ceil(rng.lognormal(1.5, 1.5, nnz))
+    matrix = ss.csr_matrix((data, (rows, cols)),
+                           shape=(n_features, n_samples))
+    return biom.Table(matrix, ['F%d' % i for i in range(n_features)],
+                      ['10317.%09d' % i for i in range(n_samples)])
+
+
+def _time(func):
+    start = time.time()
+    func()
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--features', type=int, default=20000)
+    parser.add_argument('--samples', type=int, default=10000)
+    parser.add_argument('--density', type=float, default=0.005)
+    parser.add_argument('--chunk-size', type=int, default=2 ** 16)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    table = synthetic_table(args.features, args.samples, args.density,
+                            args.seed)
+    print('table: %d features x %d samples, %d nonzero'
+          % (table.shape[0], table.shape[1], table.nnz))
+    print('%-20s %10s %10s %12s' % ('writer', 'write (s)', 'read (s)',
+                                    'size (MB)'))
+
+    writers = [('biom.to_hdf5',
+                lambda h5: table.to_hdf5(h5, 'benchmark'))]
+    for codec in COMPRESSIONS:
+        writers.append(
+            ('chunked-%s' % codec,
+             lambda h5, codec=codec: write_table(table, h5, 'benchmark',
+                                                 args.chunk_size, codec)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, writer in writers:
+            path = os.path.join(tmp, '%s.biom' % name)
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+
+                def write():
+                    with h5py.File(path, 'w') as h5:
+                        writer(h5)
+                write_time = _time(write)
+            if caught:
+                name += ' (gzip fallback)'
+            read_time = _time(lambda: biom.load_table(path))
+            print('%-20s %10.2f %10.2f %12.1f'
+                  % (name, write_time, read_time,
+                     os.path.getsize(path) / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Compare MinHash LSH pair detection with brute force on synthetic households
+
+Samples come in households whose members share most of their features.
+Reports the time of each method and the recall, relative to brute force, of
+pairs at or above the threshold under several banding schemes.
+
+    python benchmarks/bench_minhash.py --households 15000 --threshold 0.5
+"""
+import argparse
+import time
+
+import biom
+import numpy as np
+import scipy.sparse as ss
+
+from q2_american_gut._minhash import similar_pairs
+
+
+def synthetic_households(n_households, n_features, richness, shared, seed):
+    """Pairs of samples keeping ``shared`` of a household's features"""
+    rng = np.random.RandomState(seed)
+    rows = []
+    for _ in range(n_households):
+        base = rng.choice(n_features, richness, replace=False)
+        for _ in range(2):
+            own = base[rng.rand(richness) < shared]
+            noise = rng.randint(0, n_features, richness // 5)
+            rows.append(np.unique(np.concatenate([own, noise])))
+    indptr = np.concatenate([[0], np.cumsum([len(r) for r in rows])])
+    presence = ss.csr_matrix((np.ones(indptr[-1]), np.concatenate(rows),
+                              indptr), shape=(len(rows), n_features))
+    return biom.Table(presence.T.tocsr(),
+                      ['F%d' % i for i in range(n_features)],
+                      ['10317.%09d' % i for i in range(len(rows))])
+
+
+def brute_force(table, threshold, block_size=2000):
+    """Every pair at or above the threshold, from blocked sparse products"""
+    presence = ss.csr_matrix(table.matrix_data.T)
+    presence.data[:] = 1
+    sizes = np.diff(presence.indptr)
+    pairs = set()
+    for lo in range(0, presence.shape[0], block_size):
+        hi = min(lo + block_size, presence.shape[0])
+        shared = (presence[lo:hi] @ presence.T).tocoo()
+        i, j = shared.row + lo, shared.col
+        jaccard = shared.data / (sizes[i] + sizes[j] - shared.data)
+        keep = (i < j) & (jaccard >= threshold)
+        pairs.update(zip(i[keep], j[keep]))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--households', type=int, default=2500)
+    parser.add_argument('--features', type=int, default=20000)
+    parser.add_argument('--richness', type=int, default=150)
+    parser.add_argument('--shared', type=float, default=0.8)
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    table = synthetic_households(args.households, args.features,
+                                 args.richness, args.shared, args.seed)
+    print('table: %d features x %d samples, %d nonzero'
+          % (table.shape[0], table.shape[1], table.nnz))
+
+    start = time.time()
+    truth = brute_force(table, args.threshold)
+    print('brute force: %.2f s, %d pairs' % (time.time() - start,
+                                             len(truth)))
+
+    positions = {s: i for i, s in enumerate(table.ids(axis='sample'))}
+    print('%8s %6s %10s %8s %10s' % ('hashes', 'bands', 'time (s)',
+                                     'recall', 'extra'))
+    for n_hashes, bands in ((64, 16), (128, 32), (128, 64), (256, 64)):
+        start = time.time()
+        found = similar_pairs(table, args.threshold, n_hashes, bands,
+                              seed=args.seed)
+        elapsed = time.time() - start
+        found = {tuple(sorted((positions[a], positions[b])))
+                 for a, b in zip(found.index, found['sample-b'])}
+        recall = len(found & truth) / len(truth) if truth else 1.
+        print('%8d %6d %10.2f %8.3f %10d'
+              % (n_hashes, bands, elapsed, recall, len(found - truth)))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,10 +6,48 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 from ._version import get_versions
+from ._sketch import (FeatureSketch, sketch_quantiles, merge_sketches,
+                      summarize_sketch)
+from ._report import participant_reports
+from ._index import SampleArtifactIndex, index_samples, fetch_samples
+from ._extract import extract_samples
+from ._rechunk import rechunk_table
+from ._rank import rank_test
+from ._permanova import permanova
+from ._training import SparseTrainingSet, training_set
+from ._predict import predict_trait
+from ._trim import trim_and_collapse
+from ._loader import TableLoader, read_table
+from ._network import feature_network
+from ._topk import top_features
+from ._fingerprint import fingerprint_table
+from ._decontam import score_contaminants
+from ._leakage import well_leakage
+from ._qc import qc_gate
+from ._stratify import StratifiedTables, stratify
+from ._longitudinal import host_trajectories
+from ._blockdist import BlockDistances, within_group_distances
+from ._minhash import similar_pairs
+from ._tree import ArrayTree, load_tree, prune_tree
+from ._faith import faith_pd
+from ._packed import (PackedPresence, pack_presence, filter_prevalence,
+                      jaccard_distances)
 
 
 __version__ = get_versions()['version']
 del get_versions
 
 
-__all__ = []
+__all__ = ['FeatureSketch', 'sketch_quantiles', 'merge_sketches',
+           'summarize_sketch', 'participant_reports', 'SampleArtifactIndex',
+           'index_samples', 'fetch_samples', 'extract_samples',
+           'rechunk_table', 'rank_test',
+           'permanova', 'SparseTrainingSet', 'training_set', 'predict_trait',
+           'trim_and_collapse', 'TableLoader', 'read_table',
+           'feature_network', 'top_features', 'fingerprint_table',
+           'score_contaminants', 'well_leakage', 'qc_gate',
+           'StratifiedTables', 'stratify', 'host_trajectories',
+           'BlockDistances', 'within_group_distances', 'similar_pairs',
+           'ArrayTree', 'load_tree', 'prune_tree', 'faith_pd',
+           'PackedPresence', 'pack_presence', 'filter_prevalence',
+           'jaccard_distances']
@@ -0,0 +1,78 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import numpy as np
+import scipy.sparse as ss
+
+
+# the number of set bits of every byte, for numpy without bitwise_count
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def pack_rows(matrix):
+    """Pack the nonzero pattern of each row of a sparse matrix into bits
+
+    Parameters
+    ----------
+    matrix : scipy.sparse matrix
+        An m by n matrix.
+
+    Returns
+    -------
+    np.ndarray of uint8
+        An m by ceil(n / 8) array whose bit j of row i, in the big-endian
+        order of ``np.packbits``, is set where entry (i, j) is nonzero.
+    """
+    matrix = ss.csr_matrix(matrix)
+    matrix.eliminate_zeros()
+    n_rows, n_cols = matrix.shape
+    packed = np.zeros((n_rows, (n_cols + 7) // 8), dtype=np.uint8)
+    rows = np.repeat(np.arange(n_rows), np.diff(matrix.indptr))
+    bits = np.left_shift(1, 7 - matrix.indices % 8).astype(np.uint8)
+    np.bitwise_or.at(packed, (rows, matrix.indices // 8), bits)
+    return packed
+
+
+def unpack_rows(packed, n_cols):
+    """The boolean matrix of an array packed by ``pack_rows``"""
+    return np.unpackbits(packed, axis=1)[:, :n_cols].astype(bool)
+
+
+def popcount(packed, axis=None):
+    """The number of set bits of a packed array, summed along an axis"""
+    if hasattr(np, 'bitwise_count'):
+        counts = np.bitwise_count(packed)
+    else:
+        counts = _POPCOUNT[packed]
+    return counts.sum(axis=axis, dtype=np.int64)
+
+
+def bit_weights(packed, weights, n_cols):
+    """The weighted sum of the rows of a packed array, per bit
+
+    Parameters
+    ----------
+    packed : np.ndarray of uint8
+        An m by ceil(n / 8) packed array.
+    weights : np.ndarray
+        The weight of each of the m rows.
+    n_cols : int
+        The number of bits of each row, n.
+
+    Returns
+    -------
+    np.ndarray
+        The sum, for each of the n bits, of the weights of the rows in
+        which it is set.
+    """
+    sums = np.empty((packed.shape[1], 8))
+    # one bit position at a time keeps the unpacked temporaries to the size
+    # of the packed array
+    for bit in range(8):
+        mask = np.right_shift(packed, 7 - bit) & 1
+        sums[:, bit] = weights @ mask
+    return sums.ravel()[:n_cols]
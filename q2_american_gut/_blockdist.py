@@ -0,0 +1,194 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import biom
+import h5py
+import numpy as np
+import pandas as pd
+import qiime2
+import scipy.sparse as ss
+import skbio
+from scipy.spatial.distance import pdist
+
+from ._longitudinal import METRICS, paired_distances
+from ._parallel import imap_shared, get_shared
+
+
+class BlockDistances:
+    """Distances among the samples of each group, and none across groups
+
+    The samples are ordered by group, and the distances of each group are
+    stored condensed, as by ``scipy.spatial.distance.pdist``, one group
+    after another. Storage is the sum of the squared group sizes rather
+    than the square of the number of samples.
+
+    Parameters
+    ----------
+    ids : iterable of str
+        The samples, grouped.
+    groups : iterable of str
+        The name of each group.
+    offsets : np.ndarray of int
+        The position in ``ids`` at which each group starts, followed by the
+        number of samples.
+    distances : np.ndarray
+        The condensed distances of every group, concatenated.
+    """
+    FORMAT_VERSION = 1
+
+    def __init__(self, ids, groups, offsets, distances):
+        self.ids = np.asarray(list(ids), dtype=object)
+        self.groups = list(groups)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.distances = np.asarray(distances, dtype=float)
+        sizes = np.diff(self.offsets)
+        self.block_offsets = np.concatenate(
+            [[0], np.cumsum(sizes * (sizes - 1) // 2)])
+        if len(self.groups) + 1 != len(self.offsets):
+            raise ValueError("There must be one offset per group and one "
+                             "more for the end.")
+        if self.offsets[-1] != len(self.ids):
+            raise ValueError("The offsets do not span the samples.")
+        if self.block_offsets[-1] != len(self.distances):
+            raise ValueError("Expected %d distances, found %d."
+                             % (self.block_offsets[-1], len(self.distances)))
+        self._position = {s: i for i, s in enumerate(self.ids)}
+        self._group_index = {g: i for i, g in enumerate(self.groups)}
+
+    def group(self, name):
+        """The distance matrix of one group's samples"""
+        i = self._group_index[name]
+        lo, hi = self.block_offsets[i], self.block_offsets[i + 1]
+        ids = self.ids[self.offsets[i]:self.offsets[i + 1]]
+        return skbio.DistanceMatrix(self.distances[lo:hi], ids=list(ids))
+
+    def distance(self, a, b):
+        """The distance between two samples, NaN if in different groups"""
+        i, j = self._position[a], self._position[b]
+        if i == j:
+            return 0.
+        group = np.searchsorted(self.offsets, max(i, j), side='right') - 1
+        start = self.offsets[group]
+        if min(i, j) < start:
+            return np.nan
+        # the offset of pair (i, j), i < j, in a condensed matrix of n
+        i, j = min(i, j) - start, max(i, j) - start
+        n = self.offsets[group + 1] - start
+        k = n * i - i * (i + 1) // 2 + j - i - 1
+        return self.distances[self.block_offsets[group] + k]
+
+    def to_hdf5(self, h5grp):
+        h5grp.attrs['format-version'] = self.FORMAT_VERSION
+        vlen = h5py.special_dtype(vlen=str)
+        h5grp.create_dataset('ids', data=[i.encode('utf8') for i in self.ids],
+                             dtype=vlen)
+        h5grp.create_dataset('groups',
+                             data=[g.encode('utf8') for g in self.groups],
+                             dtype=vlen)
+        h5grp.create_dataset('offsets', data=self.offsets)
+        h5grp.create_dataset('distances', data=self.distances,
+                             compression='gzip')
+
+    @classmethod
+    def from_hdf5(cls, h5grp):
+        def decode(ids):
+            return [i.decode('utf8') if isinstance(i, bytes) else i
+                    for i in ids]
+        return cls(decode(h5grp['ids'][:]), decode(h5grp['groups'][:]),
+                   h5grp['offsets'][:], h5grp['distances'][:])
+
+
+def pair_batches(n, size):
+    """The pairs of a condensed matrix of n items, a batch at a time
+
+    Parameters
+    ----------
+    n : int
+        The number of items.
+    size : int
+        The number of pairs per batch. A batch always holds whole rows of
+        the matrix, so it exceeds ``size`` only to hold a single row.
+
+    Yields
+    ------
+    i, j : np.ndarray of int
+        The items of each pair, i < j, in the order of a condensed matrix.
+    """
+    lengths = np.arange(n - 1, 0, -1)
+    ends = np.cumsum(lengths)
+    start, done = 0, 0
+    while start < n - 1:
+        stop = max(start + 1,
+                   int(np.searchsorted(ends, done + size, side='right')))
+        counts = lengths[start:stop]
+        i = np.repeat(np.arange(start, stop), counts)
+        # the position of each pair within its row gives its second item
+        first = np.repeat(ends[start:stop] - counts - done, counts)
+        j = i + 1 + np.arange(len(i)) - first
+        yield i, j
+        start, done = stop, ends[stop - 1]
+
+
+def _group_distances(bounds):
+    start, stop = bounds
+    shared = get_shared()
+    rows = shared['matrix'][start:stop]
+    n = stop - start
+    present = np.unique(rows.indices)
+
+    # small groups are densified over the features they contain, and
+    # larger ones are computed pair by pair from the sparse rows
+    if n * len(present) <= shared['max_cells']:
+        dense = rows[:, present].toarray()
+        if shared['metric'] == 'jaccard':
+            dense = dense > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            distances = pdist(dense, shared['metric'])
+        if shared['metric'] == 'jaccard':
+            # older SciPy leaves two empty samples NaN apart
+            distances[np.isnan(distances)] = 0
+        return bounds, distances
+
+    distances = np.empty(n * (n - 1) // 2)
+    batch = max(1, shared['max_cells'] // max(1, 2 * len(present)))
+    lo = 0
+    for i, j in pair_batches(n, batch):
+        distances[lo:lo + len(i)] = paired_distances(rows, i, j,
+                                                     shared['metric'])
+        lo += len(i)
+    return bounds, distances
+
+
+def within_group_distances(table: biom.Table, metadata: qiime2.Metadata,
+                           column: str, metric: str = 'braycurtis',
+                           max_memory_mb: int = 256,
+                           n_jobs: int = 1) -> BlockDistances:
+    if metric not in METRICS:
+        raise ValueError("Unknown metric %r." % metric)
+    sample_ids = table.ids(axis='sample')
+    md = metadata.to_dataframe().reindex(sample_ids)
+    if column not in md.columns:
+        raise ValueError("%r is not a metadata column." % column)
+    grouped = md[column].notnull().values
+    if not grouped.any():
+        raise ValueError("No sample of the table has a value for %r."
+                         % column)
+
+    codes, groups = pd.factorize(md[column].values[grouped].astype(str),
+                                 sort=True)
+    positions = np.flatnonzero(grouped)
+    order = positions[np.argsort(codes, kind='mergesort')]
+    offsets = np.searchsorted(np.sort(codes), np.arange(len(groups) + 1))
+
+    matrix = ss.csr_matrix(table.matrix_data.T, dtype=float)[order]
+    shared = {'matrix': matrix, 'metric': metric,
+              'max_cells': max_memory_mb * 2 ** 20 // 8}
+    bounds = list(zip(offsets[:-1], offsets[1:]))
+    blocks = dict(imap_shared(_group_distances, bounds, shared,
+                              n_jobs=n_jobs))
+    distances = np.concatenate([blocks[b] for b in bounds])
+    return BlockDistances(sample_ids[order], groups, offsets, distances)
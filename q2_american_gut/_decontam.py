@@ -0,0 +1,184 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import biom
+import numpy as np
+import pandas as pd
+import qiime2
+import scipy.sparse as ss
+from scipy.stats import f, hypergeom
+
+from ._parallel import imap_shared, get_shared
+
+
+def _sums_of_squares(rows, values, n_rows):
+    """The count and centered sum of squares of values grouped by row"""
+    n = np.bincount(rows, minlength=n_rows)
+    total = np.bincount(rows, weights=values, minlength=n_rows)
+    squares = np.bincount(rows, weights=values ** 2, minlength=n_rows)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return n, squares - total ** 2 / n
+
+
+def frequency_scores(matrix, concentration):
+    """decontam's frequency score of every feature
+
+    Among the samples containing a feature, a contaminant's frequency is
+    inversely proportional to the DNA concentration, log(f) = a - log(c),
+    while a genuine feature's is constant, log(f) = b. The score is the F
+    distribution's CDF at the ratio of the residual sums of squares of the
+    two fits, so low scores favor contamination.
+
+    Parameters
+    ----------
+    matrix : scipy.sparse matrix
+        A features by samples matrix of counts.
+    concentration : np.ndarray
+        The positive DNA concentration of each sample.
+
+    Returns
+    -------
+    np.ndarray
+        The score of each feature, NaN for those in fewer than two samples.
+    """
+    matrix = ss.csc_matrix(matrix, dtype=float)
+    depths = np.asarray(matrix.sum(axis=0)).ravel()
+    depths[depths == 0] = 1
+    relative = ss.csr_matrix(matrix @ ss.diags(1. / depths))
+    relative.eliminate_zeros()
+
+    # both models are fit to every feature at once from per-row sums over
+    # the nonzero values only
+    rows = np.repeat(np.arange(relative.shape[0]), np.diff(relative.indptr))
+    log_frequency = np.log(relative.data)
+    log_concentration = np.log(concentration)[relative.indices]
+    n, constant = _sums_of_squares(rows, log_frequency, relative.shape[0])
+    _, inverse = _sums_of_squares(rows, log_frequency + log_concentration,
+                                  relative.shape[0])
+
+    scores = np.full(relative.shape[0], np.nan)
+    fitted = (n > 1) & (constant > 0)
+    scores[fitted] = f.cdf(inverse[fitted] / constant[fitted],
+                           n[fitted] - 1, n[fitted] - 1)
+    return scores
+
+
+def prevalence_scores(matrix, is_control):
+    """decontam's prevalence score of every feature
+
+    The score is the p-value of a one-sided Fisher's exact test that a
+    feature is more prevalent in negative controls than in samples, so low
+    scores favor contamination.
+
+    Parameters
+    ----------
+    matrix : scipy.sparse matrix
+        A features by samples matrix of counts.
+    is_control : np.ndarray of bool
+        Whether each sample is a negative control.
+
+    Returns
+    -------
+    np.ndarray
+        The score of each feature, NaN for those absent from every sample
+        or when there are no controls or no samples.
+    """
+    present = ss.csr_matrix(matrix)
+    present.eliminate_zeros()
+    present.data[:] = 1
+    n_controls = is_control.sum()
+    n_samples = len(is_control)
+    prevalence = np.diff(present.indptr)
+    in_controls = present @ is_control.astype(float)
+
+    scores = np.full(present.shape[0], np.nan)
+    if n_controls == 0 or n_controls == n_samples:
+        return scores
+    tested = prevalence > 0
+    scores[tested] = hypergeom.sf(in_controls[tested] - 1, n_samples,
+                                  prevalence[tested], n_controls)
+    return scores
+
+
+def _score_plate(positions):
+    shared = get_shared()
+    matrix = shared['matrix'][:, positions]
+    n_features = matrix.shape[0]
+
+    frequency = np.full(n_features, np.nan)
+    concentration = shared['concentration']
+    if concentration is not None:
+        concentration = concentration[positions]
+        usable = np.isfinite(concentration) & (concentration > 0)
+        if shared['is_control'] is not None:
+            usable &= ~shared['is_control'][positions]
+        if usable.any():
+            frequency = frequency_scores(matrix[:, usable],
+                                         concentration[usable])
+
+    prevalence = np.full(n_features, np.nan)
+    if shared['is_control'] is not None:
+        prevalence = prevalence_scores(matrix,
+                                       shared['is_control'][positions])
+    return frequency, prevalence
+
+
+def score_contaminants(table: biom.Table, metadata: qiime2.Metadata,
+                       concentration_column: str = None,
+                       control_column: str = None,
+                       control_value: str = 'true',
+                       plate_column: str = None, threshold: float = 0.1,
+                       n_jobs: int = 1) -> (biom.Table, pd.DataFrame):
+    if concentration_column is None and control_column is None:
+        raise ValueError("A concentration column, a control column or both "
+                         "must be given.")
+    sample_ids = table.ids(axis='sample')
+    md = metadata.to_dataframe().reindex(sample_ids)
+    for column in (concentration_column, control_column, plate_column):
+        if column is not None and column not in md.columns:
+            raise ValueError("%r is not a metadata column." % column)
+
+    concentration = is_control = None
+    if concentration_column is not None:
+        concentration = pd.to_numeric(md[concentration_column],
+                                      errors='coerce').values.astype(float)
+    if control_column is not None:
+        is_control = (md[control_column].astype(str).str.lower() ==
+                      control_value.lower()).values
+
+    # decontam scores batches independently and keeps the lowest score, so
+    # a feature contaminating any one plate is flagged
+    if plate_column is None:
+        plates = [np.arange(len(sample_ids))]
+    else:
+        codes = pd.Categorical(md[plate_column]).codes
+        plates = [np.flatnonzero(codes == code)
+                  for code in np.unique(codes[codes >= 0])]
+
+    shared = {'matrix': table.matrix_data.tocsc(),
+              'concentration': concentration, 'is_control': is_control}
+    n_features = table.shape[0]
+    frequency = np.full(n_features, np.nan)
+    prevalence = np.full(n_features, np.nan)
+    for plate_frequency, plate_prevalence in imap_shared(
+            _score_plate, plates, shared, n_jobs=n_jobs):
+        frequency = np.fmin(frequency, plate_frequency)
+        prevalence = np.fmin(prevalence, plate_prevalence)
+
+    score = np.fmin(frequency, prevalence)
+    contaminant = score < threshold
+    feature_ids = table.ids(axis='observation')
+    scores = pd.DataFrame({'frequency-score': frequency,
+                           'prevalence-score': prevalence,
+                           'score': score, 'contaminant': contaminant},
+                          index=pd.Index(feature_ids, name='feature-id'),
+                          columns=['frequency-score', 'prevalence-score',
+                                   'score', 'contaminant'])
+
+    filtered = table.filter(feature_ids[~contaminant], axis='observation',
+                            inplace=False)
+    return filtered, scores
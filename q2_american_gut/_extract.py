@@ -0,0 +1,61 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import biom
+import h5py
+import numpy as np
+import qiime2
+from q2_types.feature_table import BIOMV210Format
+
+from ._hdf5 import observation_ids, read_columns, sample_ids
+
+
+def read_samples(h5grp, ids, filter_empty_features=True):
+    """Read a subset of samples from a BIOM v2.1 HDF5 group
+
+    Parameters
+    ----------
+    h5grp : h5py.Group or h5py.File
+        An open BIOM v2.1 table.
+    ids : iterable of str
+        The samples to read.
+    filter_empty_features : bool, optional
+        Whether to drop features absent from all of the samples read.
+
+    Returns
+    -------
+    biom.Table
+        The samples, in the order requested.
+
+    Raises
+    ------
+    ValueError
+        If any of the samples are not present in the table.
+    """
+    ids = list(ids)
+    positions = {s: i for i, s in enumerate(sample_ids(h5grp))}
+    missing = [s for s in ids if s not in positions]
+    if missing:
+        raise ValueError("%d samples are not present in the table, "
+                         "including: %s"
+                         % (len(missing), ', '.join(missing[:5])))
+
+    matrix = read_columns(h5grp, [positions[s] for s in ids]).tocsr()
+    obs_ids = observation_ids(h5grp)
+    if filter_empty_features:
+        keep = np.diff(matrix.indptr) > 0
+        matrix = matrix[keep]
+        obs_ids = obs_ids[keep]
+    return biom.Table(matrix, list(obs_ids), ids)
+
+
+def extract_samples(table: BIOMV210Format, metadata: qiime2.Metadata,
+                    filter_empty_features: bool = True) -> biom.Table:
+    # the table is viewed as its file so that only the requested columns are
+    # read, rather than being loaded in full as a biom.Table
+    with h5py.File(str(table), 'r') as h5:
+        return read_samples(h5, metadata.ids, filter_empty_features)
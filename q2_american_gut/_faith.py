@@ -0,0 +1,76 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from ._bitset import bit_weights
+from ._packed import PackedPresence
+from ._tree import ArrayTree
+
+
+class _Propagation:
+    """The order in which presence is passed from children to parents
+
+    Nodes are grouped by height, the longest path down to a tip, so every
+    child of a group's parents has been completed by an earlier group.
+    Within a group, children are sorted by parent so each parent receives
+    the union of its children from one ``np.bitwise_or.reduceat``.
+    """
+    def __init__(self, tree):
+        height = tree.heights()
+        nonroot = np.flatnonzero(tree.parent >= 0)
+        self.steps = []
+        for level in np.unique(height[nonroot]):
+            children = nonroot[height[nonroot] == level]
+            children = children[np.argsort(tree.parent[children],
+                                           kind='mergesort')]
+            parents = tree.parent[children]
+            starts = np.flatnonzero(np.r_[True, parents[1:] != parents[:-1]])
+            self.steps.append((children, starts, parents[starts]))
+
+    def propagate(self, bits):
+        for children, starts, parents in self.steps:
+            bits[parents] |= np.bitwise_or.reduceat(bits[children], starts,
+                                                    axis=0)
+        return bits
+
+
+def faith_pd(table: PackedPresence, phylogeny: ArrayTree,
+             max_memory_mb: int = 1024, n_jobs: int = 1) -> pd.Series:
+    features = table.feature_ids
+    # only the paths from the table's features to the root carry presence
+    tree = phylogeny.induced(features, collapse=False)
+    tips = tree.tips(features)
+    propagation = _Propagation(tree)
+    n_samples = table.shape[1]
+
+    # each block holds one byte per node per eight samples, with a copy
+    # for the reductions and the unpacked bit temporaries
+    per_byte = len(tree) * 3
+    block_bytes = max(1, max_memory_mb * 2 ** 20 // (per_byte * n_jobs))
+    block_size = min(8 * block_bytes, n_samples)
+    block_size = max(8, block_size - block_size % 8)
+
+    def block_pd(start):
+        stop = min(start + block_size, n_samples)
+        bits = np.zeros((len(tree), (stop - start + 7) // 8), dtype=np.uint8)
+        # blocks start on a byte, so each feature's packed row is the bitset
+        # of its tip as stored
+        bits[tips] = table.bits[:, start // 8:(stop + 7) // 8]
+        propagation.propagate(bits)
+        return bit_weights(bits, tree.length, stop - start)
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        blocks = list(executor.map(block_pd,
+                                   range(0, n_samples, block_size)))
+    values = np.concatenate(blocks) if blocks else np.array([])
+    return pd.Series(values, index=pd.Index(list(table.sample_ids),
+                                            name='sample-id'),
+                     name='faith_pd')
@@ -0,0 +1,137 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import hashlib
+
+import biom
+import numpy as np
+import pandas as pd
+
+from ._version import get_versions
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+def _hasher():
+    if xxhash is not None:
+        return 'xxh64', xxhash.xxh64()
+    return 'sha1', hashlib.sha1()
+
+
+def array_fingerprint(arrays, block_size=2 ** 20, max_blocks=None):
+    """A fast hash of the contents of numeric arrays
+
+    Parameters
+    ----------
+    arrays : iterable of np.ndarray
+        The arrays to hash, in order.
+    block_size : int, optional
+        The number of bytes hashed at a time.
+    max_blocks : int, optional
+        If given, at most this many evenly spaced blocks of each array are
+        hashed, always including the first and last. By default every block
+        is hashed.
+
+    Returns
+    -------
+    str
+        The hash, prefixed by the name of the algorithm, such as
+        ``'xxh64:...'``. xxhash is used if it is installed, and sha1
+        otherwise, so fingerprints are only comparable between environments
+        using the same algorithm.
+    int
+        The number of bytes of array data hashed.
+    """
+    if block_size < 1:
+        raise ValueError("block_size must be positive.")
+    algorithm, hasher = _hasher()
+    hashed = 0
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        # the dtype and shape are hashed so equal bytes of different arrays
+        # do not collide
+        hasher.update(('%s%r' % (array.dtype.str, array.shape))
+                      .encode('ascii'))
+        raw = array.reshape(-1).view(np.uint8)
+        n_blocks = -(-len(raw) // block_size)
+        if max_blocks is None or n_blocks <= max_blocks:
+            blocks = range(n_blocks)
+        else:
+            blocks = np.unique(np.linspace(0, n_blocks - 1, max_blocks)
+                               .round().astype(np.int64))
+        for block in blocks:
+            chunk = raw[block * block_size:(block + 1) * block_size]
+            hasher.update(chunk)
+            hashed += len(chunk)
+    return '%s:%s' % (algorithm, hasher.hexdigest()), hashed
+
+
+def table_fingerprint(table, block_size=2 ** 20, max_blocks=64):
+    """A structural hash of a table, cheap enough to compute on every run
+
+    The shape, the feature and sample IDs, and the total of every sample
+    are hashed in full, while the data, indices and index pointer of the
+    sparse matrix are hashed in evenly spaced blocks. A change to any count
+    changes a sample total, so an edit is detected unless it preserves
+    every total and falls between the sampled blocks.
+
+    Parameters
+    ----------
+    table : biom.Table
+        The table.
+    block_size, max_blocks : int, optional
+        As for ``array_fingerprint``. With ``max_blocks=None`` the matrix is
+        hashed in full.
+
+    Returns
+    -------
+    str
+        The fingerprint.
+    int
+        The number of bytes of matrix data hashed.
+    """
+    matrix = table.matrix_data.tocsc()
+    algorithm, ids = _hasher()
+    for axis in ('observation', 'sample'):
+        for i in table.ids(axis=axis):
+            ids.update(i.encode('utf8') + b'\n')
+        ids.update(b'\x00')
+
+    summary, _ = array_fingerprint(
+        [np.array(table.shape, dtype=np.int64),
+         np.frombuffer(ids.digest(), dtype=np.uint8),
+         np.asarray(matrix.sum(axis=0), dtype=np.float64).ravel()])
+    matrix_key, hashed = array_fingerprint(
+        [matrix.data, matrix.indices, matrix.indptr], block_size, max_blocks)
+    combined, _ = array_fingerprint([np.frombuffer(
+        (summary + matrix_key).encode('ascii'), dtype=np.uint8)])
+    return combined, hashed
+
+
+def fingerprint_table(table: biom.Table, block_size: int = 1048576,
+                      max_blocks: int = 64) -> pd.DataFrame:
+    fingerprint, hashed = table_fingerprint(table, block_size,
+                                            max_blocks or None)
+    versions = get_versions()
+    fields = [
+        ('fingerprint', fingerprint),
+        ('n-features', table.shape[0]),
+        ('n-samples', table.shape[1]),
+        ('n-nonzero', table.matrix_data.nnz),
+        ('bytes-hashed', hashed),
+        ('block-size', block_size),
+        ('max-blocks', max_blocks),
+        ('plugin-version', versions['version']),
+        ('plugin-revision', versions['full-revisionid']),
+        ('plugin-dirty', versions['dirty']),
+    ]
+    return pd.DataFrame([str(value) for _, value in fields],
+                        index=pd.Index([f for f, _ in fields], name='field'),
+                        columns=['value'])
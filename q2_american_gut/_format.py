@@ -0,0 +1,242 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import h5py
+import qiime2.plugin.model as model
+from qiime2.plugin import ValidationError
+from q2_types.feature_table import BIOMV210Format
+
+
+class _TSVFormat(model.TextFileFormat):
+    """A tab-separated table whose header must begin with ``HEADER``"""
+    HEADER = ()
+
+    def _validate_(self, level):
+        with self.open() as fh:
+            header = fh.readline().rstrip('\n').split('\t')
+            if tuple(header[:len(self.HEADER)]) != self.HEADER:
+                raise ValidationError(
+                    "Expected a header starting with %r, found %r."
+                    % ('\t'.join(self.HEADER), '\t'.join(header)))
+
+            n_records = {'min': 5, 'max': None}[level]
+            for i, line in enumerate(fh, 2):
+                if n_records is not None and i > n_records + 1:
+                    break
+                if len(line.rstrip('\n').split('\t')) != len(header):
+                    raise ValidationError(
+                        "Line %d does not have %d fields." % (i, len(header)))
+
+
+class _HDF5Format(model.BinaryFileFormat):
+    """An HDF5 file that must carry the ``REQUIRED`` datasets"""
+    REQUIRED = ()
+
+    def _validate_(self, level):
+        try:
+            with h5py.File(str(self), 'r') as h5:
+                missing = [name for name in self.REQUIRED if name not in h5]
+        except OSError:
+            raise ValidationError("Not an HDF5 file.")
+        if missing:
+            raise ValidationError("Missing datasets: %s"
+                                  % ', '.join(missing))
+
+
+class QuantileSketchFormat(_HDF5Format):
+    REQUIRED = ('feature-ids', 'data', 'indices', 'indptr')
+
+
+QuantileSketchDirFmt = model.SingleFileDirectoryFormat(
+    'QuantileSketchDirFmt', 'sketch.h5', QuantileSketchFormat)
+
+
+class BlockDistancesFormat(_HDF5Format):
+    REQUIRED = ('ids', 'groups', 'offsets', 'distances')
+
+
+BlockDistancesDirFmt = model.SingleFileDirectoryFormat(
+    'BlockDistancesDirFmt', 'distances.h5', BlockDistancesFormat)
+
+
+class PackedPresenceFormat(_HDF5Format):
+    REQUIRED = ('feature-ids', 'sample-ids', 'bits')
+
+
+PackedPresenceDirFmt = model.SingleFileDirectoryFormat(
+    'PackedPresenceDirFmt', 'presence.h5', PackedPresenceFormat)
+
+
+class FeatureQuantilesFormat(_TSVFormat):
+    HEADER = ('feature-id', 'prevalence')
+
+
+FeatureQuantilesDirFmt = model.SingleFileDirectoryFormat(
+    'FeatureQuantilesDirFmt', 'feature-quantiles.tsv', FeatureQuantilesFormat)
+
+
+class IndexedSamplesFormat(_TSVFormat):
+    HEADER = ('sample-id', 'artifact-uuid', 'column')
+
+
+class IndexedArtifactsFormat(_TSVFormat):
+    HEADER = ('artifact-uuid', 'path', 'n-samples', 'type', 'offset', 'size')
+
+
+class RankTestResultsFormat(_TSVFormat):
+    HEADER = ('feature-id', 'variable', 'n-groups', 'n-samples', 'statistic',
+              'p-value', 'q-value')
+
+
+RankTestResultsDirFmt = model.SingleFileDirectoryFormat(
+    'RankTestResultsDirFmt', 'rank-tests.tsv', RankTestResultsFormat)
+
+
+class PermanovaResultsFormat(_TSVFormat):
+    HEADER = ('variable', 'sample size', 'number of groups', 'test statistic',
+              'p-value', 'number of permutations', 'q-value')
+
+
+PermanovaResultsDirFmt = model.SingleFileDirectoryFormat(
+    'PermanovaResultsDirFmt', 'permanova.tsv', PermanovaResultsFormat)
+
+
+class TraitPredictionsFormat(_TSVFormat):
+    HEADER = ('sample-id', 'truth', 'prediction', 'fold')
+
+
+TraitPredictionsDirFmt = model.SingleFileDirectoryFormat(
+    'TraitPredictionsDirFmt', 'predictions.tsv', TraitPredictionsFormat)
+
+
+class CrossValidationReportFormat(_TSVFormat):
+    HEADER = ('fold', 'n-train', 'n-test', 'n-features', 'preprocess-seconds',
+              'fit-seconds', 'predict-seconds')
+
+
+CrossValidationReportDirFmt = model.SingleFileDirectoryFormat(
+    'CrossValidationReportDirFmt', 'folds.tsv', CrossValidationReportFormat)
+
+
+class FeatureNetworkFormat(_TSVFormat):
+    HEADER = ('feature-a', 'feature-b', 'association')
+
+
+FeatureNetworkDirFmt = model.SingleFileDirectoryFormat(
+    'FeatureNetworkDirFmt', 'network.tsv', FeatureNetworkFormat)
+
+
+class TopFeaturesFormat(_TSVFormat):
+    HEADER = ('sample-id', 'rank', 'feature-id', 'abundance')
+
+
+TopFeaturesDirFmt = model.SingleFileDirectoryFormat(
+    'TopFeaturesDirFmt', 'top-features.tsv', TopFeaturesFormat)
+
+
+class TableFingerprintFormat(_TSVFormat):
+    HEADER = ('field', 'value')
+
+
+TableFingerprintDirFmt = model.SingleFileDirectoryFormat(
+    'TableFingerprintDirFmt', 'fingerprint.tsv', TableFingerprintFormat)
+
+
+class ContaminantScoresFormat(_TSVFormat):
+    HEADER = ('feature-id', 'frequency-score', 'prevalence-score', 'score',
+              'contaminant')
+
+
+ContaminantScoresDirFmt = model.SingleFileDirectoryFormat(
+    'ContaminantScoresDirFmt', 'contaminant-scores.tsv',
+    ContaminantScoresFormat)
+
+
+class WellLeakageFormat(_TSVFormat):
+    HEADER = ('sample-id', 'plate', 'well', 'n-neighbors',
+              'neighbor-similarity', 'plate-similarity', 'excess', 'flagged')
+
+
+WellLeakageDirFmt = model.SingleFileDirectoryFormat(
+    'WellLeakageDirFmt', 'well-leakage.tsv', WellLeakageFormat)
+
+
+class QCReportFormat(_TSVFormat):
+    HEADER = ('sample-id', 'depth', 'bloom-fraction', 'singleton-ratio',
+              'private-fraction', 'contaminant-fraction', 'passed')
+
+
+QCReportDirFmt = model.SingleFileDirectoryFormat(
+    'QCReportDirFmt', 'qc-report.tsv', QCReportFormat)
+
+
+class ConsecutiveDistancesFormat(_TSVFormat):
+    HEADER = ('host', 'sample-a', 'sample-b', 'time-a', 'time-b', 'distance')
+
+
+ConsecutiveDistancesDirFmt = model.SingleFileDirectoryFormat(
+    'ConsecutiveDistancesDirFmt', 'distances.tsv', ConsecutiveDistancesFormat)
+
+
+class HostVolatilityFormat(_TSVFormat):
+    HEADER = ('host', 'n-timepoints', 'duration', 'mean-distance',
+              'sd-distance', 'max-distance', 'distance-per-time')
+
+
+HostVolatilityDirFmt = model.SingleFileDirectoryFormat(
+    'HostVolatilityDirFmt', 'volatility.tsv', HostVolatilityFormat)
+
+
+class SimilarSamplePairsFormat(_TSVFormat):
+    HEADER = ('sample-a', 'sample-b', 'estimated-similarity', 'similarity')
+
+
+SimilarSamplePairsDirFmt = model.SingleFileDirectoryFormat(
+    'SimilarSamplePairsDirFmt', 'pairs.tsv', SimilarSamplePairsFormat)
+
+
+class SampleIndexDirFmt(model.DirectoryFormat):
+    samples = model.File('samples.tsv', format=IndexedSamplesFormat)
+    artifacts = model.File('artifacts.tsv', format=IndexedArtifactsFormat)
+
+
+class StrataFormat(_TSVFormat):
+    HEADER = ('stratum', 'file', 'n-samples', 'n-features')
+
+
+class StratifiedFeatureTablesDirFmt(model.DirectoryFormat):
+    strata = model.File('strata.tsv', format=StrataFormat)
+    tables = model.FileCollection(r'table-\d+\.biom', format=BIOMV210Format)
+
+    @tables.set_path_maker
+    def tables_path_maker(self, index):
+        return 'table-%d.biom' % index
+
+
+class NPYFormat(model.BinaryFileFormat):
+    def _validate_(self, level):
+        with self.open() as fh:
+            if fh.read(6) != b'\x93NUMPY':
+                raise ValidationError("Not a .npy file.")
+
+
+class IDListFormat(model.TextFileFormat):
+    def _validate_(self, level):
+        with self.open() as fh:
+            for i, line in enumerate(fh, 1):
+                if not line.rstrip('\n'):
+                    raise ValidationError("Line %d is empty." % i)
+
+
+class TrainingMatrixDirFmt(model.DirectoryFormat):
+    data = model.File('data.npy', format=NPYFormat)
+    indices = model.File('indices.npy', format=NPYFormat)
+    indptr = model.File('indptr.npy', format=NPYFormat)
+    target = model.File('target.npy', format=NPYFormat)
+    samples = model.File('samples.txt', format=IDListFormat)
+    features = model.File('features.txt', format=IDListFormat)
+    classes = model.File('classes.txt', format=IDListFormat, optional=True)
@@ -0,0 +1,223 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import warnings
+
+import biom
+import h5py
+import numpy as np
+import scipy.sparse as ss
+
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
+
+COMPRESSIONS = ('gzip', 'lzf', 'blosc-lz4', 'lz4', 'none')
+
+# the codecs any reader of a FeatureTable can decode with h5py alone
+PORTABLE_COMPRESSIONS = ('gzip', 'lzf', 'none')
+
+
+def _decode(ids):
+    return np.array([i.decode('utf8') if isinstance(i, bytes) else i
+                     for i in ids], dtype=object)
+
+
+def table_shape(h5grp):
+    """The (observations, samples) shape of a BIOM v2.1 HDF5 group"""
+    n_obs, n_samp = h5grp.attrs['shape']
+    return int(n_obs), int(n_samp)
+
+
+def observation_ids(h5grp):
+    return _decode(h5grp['observation/ids'][:])
+
+
+def sample_ids(h5grp):
+    return _decode(h5grp['sample/ids'][:])
+
+
+def iter_sample_blocks(h5grp, block_size=1000):
+    """Iterate over a BIOM v2.1 HDF5 group in blocks of samples
+
+    Parameters
+    ----------
+    h5grp : h5py.Group or h5py.File
+        An open BIOM v2.1 table.
+    block_size : int, optional
+        The number of samples per block.
+
+    Yields
+    ------
+    np.ndarray
+        The sample IDs of the block.
+    scipy.sparse.csc_matrix
+        The observation by sample counts of the block.
+
+    Notes
+    -----
+    Only the compressed sparse column representation is read, and only one
+    block of it is held in memory at a time.
+    """
+    if block_size < 1:
+        raise ValueError("block_size must be positive.")
+
+    n_obs, n_samp = table_shape(h5grp)
+    ids = sample_ids(h5grp)
+    indptr = h5grp['sample/matrix/indptr'][:]
+    data = h5grp['sample/matrix/data']
+    indices = h5grp['sample/matrix/indices']
+
+    for start in range(0, n_samp, block_size):
+        stop = min(start + block_size, n_samp)
+        lo, hi = indptr[start], indptr[stop]
+        block = ss.csc_matrix((data[lo:hi], indices[lo:hi],
+                               indptr[start:stop + 1] - lo),
+                              shape=(n_obs, stop - start))
+        yield ids[start:stop], block
+
+
+def read_columns(h5grp, positions):
+    """Read individual sample columns from a BIOM v2.1 HDF5 group
+
+    Parameters
+    ----------
+    h5grp : h5py.Group or h5py.File
+        An open BIOM v2.1 table.
+    positions : iterable of int
+        The column offsets of the samples to read.
+
+    Returns
+    -------
+    scipy.sparse.csc_matrix
+        The observation by sample counts of the requested columns, in the
+        order requested.
+
+    Notes
+    -----
+    The sample index pointer gives the extent of every column within the
+    data and indices arrays, so runs of adjacent requested columns are
+    fetched with one contiguous read each. The cost of a read scales with
+    the number of requested columns rather than the size of the table.
+    """
+    n_obs, _ = table_shape(h5grp)
+    positions = np.asarray(positions, dtype=np.int64)
+    if not len(positions):
+        return ss.csc_matrix((n_obs, 0))
+
+    indptr = h5grp['sample/matrix/indptr'][:]
+    data = h5grp['sample/matrix/data']
+    indices = h5grp['sample/matrix/indices']
+
+    unique, inverse = np.unique(positions, return_inverse=True)
+    breaks = np.flatnonzero(np.diff(unique) != 1) + 1
+    datas, rows, lengths = [], [], []
+    for run in np.split(unique, breaks):
+        lo, hi = indptr[run[0]], indptr[run[-1] + 1]
+        datas.append(data[lo:hi])
+        rows.append(indices[lo:hi])
+        lengths.append(np.diff(indptr[run[0]:run[-1] + 2]))
+
+    lengths = np.concatenate(lengths)
+    read = ss.csc_matrix((np.concatenate(datas), np.concatenate(rows),
+                          np.concatenate([[0], np.cumsum(lengths)])),
+                         shape=(n_obs, len(unique)))
+    return read[:, inverse]
+
+
+def _compression_options(compression):
+    if compression == 'none':
+        return {}
+    if compression == 'gzip':
+        return {'compression': 'gzip', 'shuffle': True}
+    if compression == 'lzf':
+        return {'compression': 'lzf', 'shuffle': True}
+    if compression not in COMPRESSIONS:
+        raise ValueError("Unknown compression %r, expected one of: %s"
+                         % (compression, ', '.join(COMPRESSIONS)))
+
+    if hdf5plugin is None:
+        warnings.warn("hdf5plugin is not installed, so %s compression is "
+                      "unavailable. Falling back to gzip." % compression,
+                      RuntimeWarning)
+        return _compression_options('gzip')
+    if compression == 'blosc-lz4':
+        return dict(hdf5plugin.Blosc(cname='lz4', clevel=5,
+                                     shuffle=hdf5plugin.Blosc.SHUFFLE))
+    return dict(hdf5plugin.LZ4())
+
+
+def write_table(table, h5grp, generated_by, chunk_size=2 ** 16,
+                compression='gzip'):
+    """Write a biom.Table as BIOM v2.1 HDF5 with tuned chunking
+
+    Parameters
+    ----------
+    table : biom.Table
+        The table to write.
+    h5grp : h5py.Group or h5py.File
+        The group to write to.
+    generated_by : str
+        The program which generated the table.
+    chunk_size : int, optional
+        The number of elements per chunk of the matrix datasets. Larger
+        chunks compress better and cost fewer calls into the codec, while
+        smaller chunks make reading individual samples cheaper.
+    compression : str, optional
+        The codec used for the matrix datasets, one of ``COMPRESSIONS``.
+        ``lzf`` is always available in h5py and is considerably faster than
+        ``gzip``. ``blosc-lz4`` and ``lz4`` require hdf5plugin, both to
+        write and to read, and fall back to ``gzip`` when it is missing.
+
+    Notes
+    -----
+    The layout is that of ``biom.Table.to_hdf5``, so the file is read by
+    any BIOM v2.1 reader supporting the chosen codec. Identifiers and
+    metadata are written by biom itself, while both orientations of the
+    matrix are written here directly from a single conversion.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive.")
+    options = _compression_options(compression)
+
+    # let biom lay out everything but the matrix by writing a table with the
+    # same identifiers and metadata but no data to memory, then copy it over
+    empty = biom.Table(ss.csr_matrix(table.shape),
+                       table.ids(axis='observation'),
+                       table.ids(axis='sample'),
+                       table.metadata(axis='observation'),
+                       table.metadata(axis='sample'),
+                       table.group_metadata(axis='observation'),
+                       table.group_metadata(axis='sample'),
+                       table.table_id, table.type)
+    with h5py.File('skeleton', 'w', driver='core',
+                   backing_store=False) as skeleton:
+        empty.to_hdf5(skeleton, generated_by)
+        for name, value in skeleton.attrs.items():
+            h5grp.attrs[name] = value
+        for axis in ('observation', 'sample'):
+            grp = h5grp.create_group(axis)
+            for name in skeleton[axis]:
+                if name != 'matrix':
+                    skeleton.copy(skeleton[axis][name], grp, name=name)
+
+    csr = table.matrix_data.tocsr()
+    h5grp.attrs['nnz'] = csr.nnz
+    for axis, matrix in (('observation', csr), ('sample', csr.tocsc())):
+        grp = h5grp[axis].create_group('matrix')
+        for name in ('data', 'indices', 'indptr'):
+            values = getattr(matrix, name)
+            if name != 'data':
+                values = values.astype(np.int32)
+            if not len(values):
+                # an empty dataset cannot be chunked, nor so compressed
+                grp.create_dataset(name, data=values)
+                continue
+            chunks = (min(chunk_size, len(values)), )
+            grp.create_dataset(name, data=values, chunks=chunks, **options)
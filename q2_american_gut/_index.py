@@ -0,0 +1,303 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import contextlib
+import io
+import os
+import struct
+import zipfile
+
+import biom
+import h5py
+import numpy as np
+import pandas as pd
+import qiime2
+import scipy.sparse as ss
+
+from ._hdf5 import observation_ids, read_columns, sample_ids
+
+
+_BIOM_MEMBER = '%s/data/feature-table.biom'
+_METADATA_MEMBER = '%s/metadata.yaml'
+
+# the only type indexed, as fetched samples are returned as this type
+_TABLE_TYPE = 'FeatureTable[Frequency]'
+
+# the size of the fixed part of a zip local file header
+_LOCAL_HEADER_SIZE = 30
+
+
+def artifact_uuid(zf):
+    """The UUID of an open .qza, read from the zip directory alone"""
+    return zf.namelist()[0].split('/')[0]
+
+
+def artifact_type(zf):
+    """The semantic type of an open .qza, read from its metadata.yaml"""
+    try:
+        metadata = zf.read(_METADATA_MEMBER % artifact_uuid(zf))
+    except KeyError:
+        return None
+    for line in metadata.decode('utf8').splitlines():
+        if line.startswith('type:'):
+            return line[len('type:'):].strip()
+    return None
+
+
+def member_range(path, zf, name):
+    """The byte range of a zip member within its archive
+
+    Returns
+    -------
+    int
+        The offset of the member's data, or -1 if it is compressed, in
+        which case its bytes cannot be read in place.
+    int
+        The uncompressed size of the member.
+    """
+    info = zf.getinfo(name)
+    if info.compress_type != zipfile.ZIP_STORED:
+        return -1, info.file_size
+    # the extra field of the local header need not match that of the
+    # central directory, so its length is read from the header itself
+    with open(path, 'rb') as fh:
+        fh.seek(info.header_offset)
+        header = fh.read(_LOCAL_HEADER_SIZE)
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    return (info.header_offset + _LOCAL_HEADER_SIZE + name_length +
+            extra_length, info.file_size)
+
+
+class _ByteRange(io.RawIOBase):
+    """A read-only file over a byte range of another file"""
+    def __init__(self, path, offset, size):
+        super().__init__()
+        self._fh = open(path, 'rb')
+        self._offset = offset
+        self._size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, position, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            position += self._position
+        elif whence == io.SEEK_END:
+            position += self._size
+        self._position = max(0, position)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def readinto(self, buffer):
+        n = max(0, min(len(buffer), self._size - self._position))
+        self._fh.seek(self._offset + self._position)
+        read = self._fh.readinto(memoryview(buffer)[:n])
+        self._position += read
+        return read
+
+    def close(self):
+        self._fh.close()
+        super().close()
+
+
+@contextlib.contextmanager
+def open_table(path, offset=-1, size=0):
+    """Open the BIOM table of a FeatureTable .qza as an HDF5 file
+
+    A table stored uncompressed in the archive is read in place, so only
+    the parts of it which are accessed are read from disk, and a lookup
+    costs the same as in an extracted .biom file. A compressed table, as
+    QIIME 2 writes by default, cannot be read from an arbitrary position,
+    so it is decompressed in full into memory.
+
+    Parameters
+    ----------
+    path : str
+        The .qza.
+    offset, size : int, optional
+        The byte range of the uncompressed table, as by ``member_range``.
+        With a negative offset the table is decompressed.
+    """
+    if offset >= 0:
+        fh = _ByteRange(path, offset, size)
+    else:
+        with zipfile.ZipFile(path) as zf:
+            fh = io.BytesIO(zf.read(_BIOM_MEMBER % artifact_uuid(zf)))
+    try:
+        with h5py.File(fh, 'r') as h5:
+            yield h5
+    finally:
+        fh.close()
+
+
+class SampleArtifactIndex:
+    """Locate samples across a collection of FeatureTable artifacts
+
+    Parameters
+    ----------
+    samples : pd.DataFrame, optional
+        Indexed by sample ID, with the ``artifact-uuid`` holding each sample
+        and the ``column`` offset of the sample in that artifact's table. A
+        sample may be present in more than one artifact.
+    artifacts : pd.DataFrame, optional
+        Indexed by artifact UUID, with the ``path`` of each artifact, its
+        number of samples, ``n-samples``, its semantic ``type``, and the
+        ``offset`` and ``size`` of its table within the archive as by
+        ``member_range``. Artifacts which are not feature tables are kept
+        with no samples, so they are not opened again by later updates.
+    """
+    def __init__(self, samples=None, artifacts=None):
+        if samples is None:
+            samples = pd.DataFrame(
+                {'artifact-uuid': pd.Series([], dtype=str),
+                 'column': pd.Series([], dtype=np.int64)},
+                index=pd.Index([], name='sample-id'))
+        if artifacts is None:
+            artifacts = pd.DataFrame(
+                {'path': pd.Series([], dtype=str),
+                 'n-samples': pd.Series([], dtype=np.int64),
+                 'type': pd.Series([], dtype=str),
+                 'offset': pd.Series([], dtype=np.int64),
+                 'size': pd.Series([], dtype=np.int64)},
+                index=pd.Index([], name='artifact-uuid'))
+        self.samples = samples[['artifact-uuid', 'column']]
+        self.artifacts = artifacts[['path', 'n-samples', 'type', 'offset',
+                                    'size']]
+
+    def __len__(self):
+        return len(self.samples)
+
+    def update(self, directory):
+        """Index the .qza files of a directory
+
+        Artifacts already indexed are recognized by UUID without reading
+        their tables, and artifacts no longer present are dropped, so
+        repeated updates only pay for new artifacts. Only the tables of
+        FeatureTable[Frequency] artifacts are read.
+
+        Parameters
+        ----------
+        directory : str
+            The directory to scan.
+
+        Returns
+        -------
+        int
+            The number of newly indexed artifacts.
+        """
+        paths = {}
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.qza'):
+                continue
+            path = os.path.abspath(os.path.join(directory, name))
+            with zipfile.ZipFile(path) as zf:
+                paths[artifact_uuid(zf)] = path
+
+        known = self.artifacts.index.intersection(list(paths))
+        artifacts = self.artifacts.loc[known].copy()
+        artifacts['path'] = [paths[uuid] for uuid in known]
+        samples = [self.samples[self.samples['artifact-uuid'].isin(known)]]
+
+        new = [uuid for uuid in paths if uuid not in known]
+        for uuid in new:
+            path = paths[uuid]
+            member = _BIOM_MEMBER % uuid
+            with zipfile.ZipFile(path) as zf:
+                semantic_type = artifact_type(zf) or 'unknown'
+                is_table = (semantic_type == _TABLE_TYPE and
+                            member in zf.namelist())
+                offset, size = member_range(path, zf, member) \
+                    if is_table else (-1, 0)
+            ids = []
+            if is_table:
+                with open_table(path, offset, size) as h5:
+                    ids = sample_ids(h5)
+                samples.append(pd.DataFrame(
+                    {'artifact-uuid': uuid, 'column': np.arange(len(ids))},
+                    index=pd.Index(ids, name='sample-id')))
+            artifacts.loc[uuid] = [path, len(ids), semantic_type, offset,
+                                   size]
+
+        self.samples = pd.concat(samples)
+        self.artifacts = artifacts
+        self.artifacts.index.name = 'artifact-uuid'
+        return len(new)
+
+    def locate(self, sample_id):
+        """The (artifact UUID, column) pairs holding a sample"""
+        found = self.samples.loc[[sample_id]] \
+            if sample_id in self.samples.index else self.samples.iloc[:0]
+        return list(zip(found['artifact-uuid'], found['column']))
+
+    def fetch(self, sample_ids):
+        """Read samples from the artifacts holding them
+
+        Only the columns of the requested samples are read from tables
+        stored uncompressed. Compressed tables are decompressed in full,
+        once per artifact holding any requested sample. Where a sample is
+        present in more than one artifact, the first indexed is used.
+
+        Parameters
+        ----------
+        sample_ids : iterable of str
+            The samples to retrieve.
+
+        Returns
+        -------
+        biom.Table
+            The requested samples.
+        """
+        sample_ids = list(sample_ids)
+        first = self.samples[~self.samples.index.duplicated(keep='first')]
+        missing = set(sample_ids) - set(first.index)
+        if missing:
+            raise KeyError("%d samples are not indexed, including: %s"
+                           % (len(missing), ', '.join(sorted(missing)[:5])))
+
+        located = first.loc[sample_ids]
+        obs_index = pd.Index([])
+        blocks = []
+        for uuid, group in located.groupby('artifact-uuid', sort=False):
+            artifact = self.artifacts.loc[uuid]
+            with open_table(artifact['path'], int(artifact['offset']),
+                            int(artifact['size'])) as h5:
+                block = read_columns(h5, group['column'].values)
+                obs = observation_ids(h5)
+            blocks.append((list(group.index), obs, block.tocoo()))
+            obs_index = obs_index.append(pd.Index(obs)).unique()
+
+        position = {s: i for i, s in enumerate(sample_ids)}
+        rows, cols, data = [], [], []
+        for ids, obs, block in blocks:
+            rows.append(obs_index.get_indexer(obs)[block.row])
+            cols.append(np.array([position[s] for s in ids])[block.col])
+            data.append(block.data)
+
+        matrix = ss.csr_matrix(
+            (np.concatenate(data), (np.concatenate(rows),
+                                    np.concatenate(cols))),
+            shape=(len(obs_index), len(sample_ids)))
+        return biom.Table(matrix, list(obs_index), sample_ids)
+
+
+def index_samples(directory: str,
+                  index: SampleArtifactIndex = None) -> SampleArtifactIndex:
+    if index is None:
+        index = SampleArtifactIndex()
+    index.update(directory)
+    return index
+
+
+def fetch_samples(index: SampleArtifactIndex,
+                  samples: qiime2.Metadata) -> biom.Table:
+    return index.fetch(samples.ids)
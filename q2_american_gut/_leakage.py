@@ -0,0 +1,166 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import re
+
+import biom
+import numpy as np
+import pandas as pd
+import qiime2
+import scipy.sparse as ss
+
+from ._parallel import imap_shared, get_shared
+
+
+_WELL = re.compile(r'^\s*([A-Za-z]+)\s*0*(\d+)\s*$')
+
+# wells sharing an edge leak more readily than wells sharing a corner
+_NEIGHBORS = [(-1, 0, 1.), (1, 0, 1.), (0, -1, 1.), (0, 1, 1.),
+              (-1, -1, 2 ** -.5), (-1, 1, 2 ** -.5), (1, -1, 2 ** -.5),
+              (1, 1, 2 ** -.5)]
+
+
+def parse_wells(wells):
+    """The zero-based row and column of wells such as 'A1' or 'H12'
+
+    Parameters
+    ----------
+    wells : iterable of str
+
+    Returns
+    -------
+    rows, columns : np.ndarray of int
+
+    Raises
+    ------
+    ValueError
+        If a well is not a row letter followed by a column number.
+    """
+    rows, columns = [], []
+    for well in wells:
+        match = _WELL.match(str(well))
+        if match is None:
+            raise ValueError("%r is not a well such as 'A1'." % well)
+        letters, number = match.groups()
+        row = 0
+        for letter in letters.upper():
+            row = row * 26 + ord(letter) - ord('A') + 1
+        rows.append(row - 1)
+        columns.append(int(number) - 1)
+    return np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64)
+
+
+def well_adjacency(rows, columns):
+    """The weighted adjacency of the wells of one plate
+
+    Parameters
+    ----------
+    rows, columns : np.ndarray of int
+        The position of each sample's well.
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        A samples by samples matrix weighting edge neighbors by one and
+        corner neighbors by 1 / sqrt(2).
+    """
+    grid = np.full((rows.max() + 3, columns.max() + 3), -1, dtype=np.int64)
+    # the grid is padded by one well on every side so that shifted lookups
+    # never leave it
+    grid[rows + 1, columns + 1] = np.arange(len(rows))
+    if len(np.unique(grid[rows + 1, columns + 1])) != len(rows):
+        raise ValueError("Two samples of a plate share a well.")
+
+    sources, targets, weights = [], [], []
+    for dr, dc, weight in _NEIGHBORS:
+        neighbor = grid[rows + 1 + dr, columns + 1 + dc]
+        present = neighbor >= 0
+        sources.append(np.flatnonzero(present))
+        targets.append(neighbor[present])
+        weights.append(np.full(present.sum(), weight))
+    n = len(rows)
+    return ss.csr_matrix((np.concatenate(weights),
+                          (np.concatenate(sources), np.concatenate(targets))),
+                         shape=(n, n))
+
+
+def _score_plate(plate):
+    name, positions, rows, columns = plate
+    profiles = get_shared()[positions]
+    adjacency = well_adjacency(rows, columns)
+
+    # with unit profiles, the row sums of P * (A @ P) are the weighted sums
+    # of cosine similarities to each well's neighbors, and of P * (1 @ P)
+    # those to every well of the plate
+    to_neighbors = np.asarray(profiles.multiply(adjacency @ profiles)
+                              .sum(axis=1)).ravel()
+    total = np.asarray(profiles.sum(axis=0)).ravel()
+    to_plate = profiles @ total
+    to_self = np.asarray(profiles.multiply(profiles).sum(axis=1)).ravel()
+    pattern = adjacency.copy()
+    pattern.data[:] = 1
+    to_adjacent = np.asarray(profiles.multiply(pattern @ profiles)
+                             .sum(axis=1)).ravel()
+
+    weight = np.asarray(adjacency.sum(axis=1)).ravel()
+    n_neighbors = np.diff(pattern.indptr)
+    n_background = len(positions) - 1 - n_neighbors
+    with np.errstate(divide='ignore', invalid='ignore'):
+        neighbor_similarity = to_neighbors / weight
+        plate_similarity = (to_plate - to_self - to_adjacent) / n_background
+    # without background wells only rounding error remains of the sum
+    plate_similarity[n_background == 0] = np.nan
+    return (name, positions, n_neighbors, neighbor_similarity,
+            plate_similarity)
+
+
+def well_leakage(table: biom.Table, metadata: qiime2.Metadata,
+                 plate_column: str, well_column: str,
+                 threshold: float = 0.1, n_jobs: int = 1) -> pd.DataFrame:
+    sample_ids = table.ids(axis='sample')
+    md = metadata.to_dataframe().reindex(sample_ids)
+    for column in (plate_column, well_column):
+        if column not in md.columns:
+            raise ValueError("%r is not a metadata column." % column)
+    located = md[plate_column].notnull() & md[well_column].notnull()
+    if not located.any():
+        raise ValueError("No sample of the table has a plate and well.")
+
+    profiles = ss.csr_matrix(table.matrix_data.T, dtype=float)
+    norms = np.sqrt(np.asarray(profiles.multiply(profiles)
+                               .sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    profiles = ss.csr_matrix(ss.diags(1. / norms) @ profiles)
+
+    plates = []
+    wells = md.loc[located, [plate_column, well_column]]
+    positions = np.flatnonzero(located.values)
+    rows, columns = parse_wells(wells[well_column])
+    plate_of = wells[plate_column].astype(str).values
+    for name in pd.unique(plate_of):
+        on_plate = plate_of == name
+        plates.append((name, positions[on_plate], rows[on_plate],
+                       columns[on_plate]))
+
+    results = []
+    for (name, positions, n_neighbors, neighbor_similarity,
+         plate_similarity) in imap_shared(_score_plate, plates, profiles,
+                                          n_jobs=n_jobs):
+        results.append(pd.DataFrame(
+            {'plate': name, 'well': md[well_column].values[positions],
+             'n-neighbors': n_neighbors,
+             'neighbor-similarity': neighbor_similarity,
+             'plate-similarity': plate_similarity},
+            index=pd.Index(sample_ids[positions], name='sample-id')))
+
+    leakage = pd.concat(results)
+    leakage['excess'] = (leakage['neighbor-similarity'] -
+                         leakage['plate-similarity'])
+    leakage['flagged'] = leakage['excess'] > threshold
+    leakage = leakage.reindex(sample_ids[located.values])
+    return leakage[['plate', 'well', 'n-neighbors', 'neighbor-similarity',
+                    'plate-similarity', 'excess', 'flagged']]
@@ -0,0 +1,132 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import asyncio
+import io
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import biom
+import h5py
+
+from ._index import artifact_uuid, _BIOM_MEMBER
+
+
+def read_table(path):
+    """Load a BIOM table, or the table of a FeatureTable .qza"""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            # inflating the member in one call releases the GIL, so several
+            # archives decompress in parallel across threads
+            data = io.BytesIO(zf.read(_BIOM_MEMBER % artifact_uuid(zf)))
+        with h5py.File(data, 'r') as h5:
+            return biom.Table.from_hdf5(h5)
+    with h5py.File(path, 'r') as h5:
+        return biom.Table.from_hdf5(h5)
+
+
+class TableLoader:
+    """Load many tables concurrently, yielding each as soon as it is ready
+
+    Tables are unzipped and parsed on a thread pool. At most
+    ``max_concurrency`` tables are being loaded or waiting to be consumed at
+    any time, which bounds memory when the consumer is slower than loading.
+
+    The loader is an asynchronous iterator::
+
+        async for path, table in TableLoader(paths):
+            ...
+
+    and can also be iterated synchronously, in which case it runs its own
+    event loop::
+
+        for path, table in TableLoader(paths):
+            ...
+
+    Parameters
+    ----------
+    paths : iterable of str
+        .qza or .biom files.
+    max_concurrency : int, optional
+        The number of loader threads, and the bound on tables in flight.
+
+    Yields
+    ------
+    str
+        The path of the table.
+    biom.Table
+        The table.
+    """
+    def __init__(self, paths, max_concurrency=4):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be positive.")
+        self._paths = list(paths)
+        self._max_concurrency = max_concurrency
+        self._tasks = []
+        self._executor = None
+
+    def __aiter__(self):
+        loop = asyncio.get_event_loop()
+        self._executor = ThreadPoolExecutor(self._max_concurrency)
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self._max_concurrency)
+        self._remaining = len(self._paths)
+        self._tasks = [asyncio.ensure_future(self._load(loop, path))
+                       for path in self._paths]
+        return self
+
+    async def _load(self, loop, path):
+        # a slot is held from the start of loading until the table is
+        # handed to the consumer
+        await self._slots.acquire()
+        try:
+            table = await loop.run_in_executor(self._executor, read_table,
+                                               path)
+        except Exception as e:
+            await self._queue.put((path, None, e))
+        else:
+            await self._queue.put((path, table, None))
+
+    async def __anext__(self):
+        if not self._remaining:
+            self.close()
+            raise StopAsyncIteration
+        path, table, error = await self._queue.get()
+        self._remaining -= 1
+        self._slots.release()
+        if error is not None:
+            self.close()
+            raise error
+        return path, table
+
+    def close(self):
+        """Abandon any tables not yet loaded"""
+        for task in self._tasks:
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def __iter__(self):
+        loop = asyncio.new_event_loop()
+
+        async def start():
+            return self.__aiter__()
+
+        try:
+            iterator = loop.run_until_complete(start())
+            while True:
+                try:
+                    yield loop.run_until_complete(iterator.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            self.close()
+            # gathering nothing would make a future on another loop
+            if self._tasks:
+                loop.run_until_complete(
+                    asyncio.gather(*self._tasks, return_exceptions=True))
+            loop.close()
@@ -0,0 +1,128 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import biom
+import numpy as np
+import pandas as pd
+import qiime2
+import scipy.sparse as ss
+
+
+METRICS = ('braycurtis', 'jaccard')
+
+
+def paired_distances(matrix, a, b, metric='braycurtis'):
+    """The distance between pairs of rows of a sparse matrix
+
+    Parameters
+    ----------
+    matrix : scipy.sparse matrix
+        A samples by features matrix of counts.
+    a, b : np.ndarray of int
+        The rows of each pair.
+    metric : {'braycurtis', 'jaccard'}
+        Bray-Curtis dissimilarity of the counts, or Jaccard distance of the
+        features present.
+
+    Returns
+    -------
+    np.ndarray
+        The distance of each pair. Two empty samples are NaN apart by
+        Bray-Curtis and identical by Jaccard, as by recent SciPy.
+
+    Notes
+    -----
+    Only the rows of the pairs are touched, and every pair is computed at
+    once from elementwise products of the sparse rows, so the cost scales
+    with the nonzero counts of the pairs rather than with all pairs of
+    samples.
+    """
+    if metric not in METRICS:
+        raise ValueError("Unknown metric %r." % metric)
+    matrix = ss.csr_matrix(matrix, dtype=float)
+    first, second = matrix[a], matrix[b]
+
+    def row_sums(m):
+        return np.asarray(m.sum(axis=1)).ravel()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if metric == 'braycurtis':
+            # sum |u - v| / sum (u + v) = 1 - 2 sum min(u, v) / sum (u + v)
+            shared = row_sums(first.minimum(second))
+            return 1 - 2 * shared / (row_sums(first) + row_sums(second))
+        first.data[:] = 1
+        second.data[:] = 1
+        both = row_sums(first.multiply(second))
+        either = row_sums(first) + row_sums(second) - both
+        return np.where(either > 0, 1 - both / either, 0.)
+
+
+def host_trajectories(table: biom.Table, metadata: qiime2.Metadata,
+                      host_column: str, time_column: str,
+                      metric: str = 'braycurtis'
+                      ) -> (pd.DataFrame, pd.DataFrame):
+    sample_ids = table.ids(axis='sample')
+    md = metadata.to_dataframe().reindex(sample_ids)
+    for column in (host_column, time_column):
+        if column not in md.columns:
+            raise ValueError("%r is not a metadata column." % column)
+    hosts = md[host_column]
+    times = pd.to_numeric(md[time_column], errors='coerce')
+    # empty samples have no composition to compare, and would otherwise
+    # carry a NaN Bray-Curtis distance into their host's volatility
+    depth = table.sum(axis='sample')
+    timed = np.flatnonzero((hosts.notnull() & times.notnull()).values &
+                           (depth > 0))
+
+    # ordering every sample by host and then time places each host's
+    # consecutive timepoints next to each other
+    host_codes, host_ids = pd.factorize(hosts.values[timed].astype(str))
+    order = timed[np.lexsort((times.values[timed], host_codes))]
+    host_of = np.full(len(sample_ids), -1, dtype=np.int64)
+    host_of[timed] = host_codes
+    consecutive = host_of[order[:-1]] == host_of[order[1:]]
+    a, b = order[:-1][consecutive], order[1:][consecutive]
+    if not len(a):
+        raise ValueError("No host has more than one timepoint.")
+
+    distance = paired_distances(table.matrix_data.T, a, b, metric)
+    elapsed = times.values[b] - times.values[a]
+    pairs = pd.DataFrame({'sample-a': sample_ids[a],
+                          'sample-b': sample_ids[b],
+                          'time-a': times.values[a],
+                          'time-b': times.values[b],
+                          'distance': distance},
+                         index=pd.Index(host_ids[host_of[a]], name='host'),
+                         columns=['sample-a', 'sample-b', 'time-a',
+                                  'time-b', 'distance'])
+
+    # volatility is summarized per host from sums over its pairs
+    pair_host = host_of[a]
+    n_hosts = len(host_ids)
+    n_pairs = np.bincount(pair_host, minlength=n_hosts)
+    total = np.bincount(pair_host, weights=distance, minlength=n_hosts)
+    squares = np.bincount(pair_host, weights=distance ** 2,
+                          minlength=n_hosts)
+    duration = np.bincount(pair_host, weights=elapsed, minlength=n_hosts)
+    largest = np.full(n_hosts, np.nan)
+    np.fmax.at(largest, pair_host, distance)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / n_pairs
+        sd = np.sqrt(np.maximum(squares / n_pairs - mean ** 2, 0) *
+                     n_pairs / (n_pairs - 1))
+        rate = total / duration
+    volatility = pd.DataFrame({'n-timepoints': n_pairs + 1,
+                               'duration': duration,
+                               'mean-distance': mean, 'sd-distance': sd,
+                               'max-distance': largest,
+                               'distance-per-time': rate},
+                              index=pd.Index(host_ids, name='host'),
+                              columns=['n-timepoints', 'duration',
+                                       'mean-distance', 'sd-distance',
+                                       'max-distance', 'distance-per-time'])
+    volatility = volatility[n_pairs > 0]
+    return pairs, volatility
@@ -0,0 +1,148 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import biom
+import numpy as np
+import pandas as pd
+import scipy.sparse as ss
+
+from ._longitudinal import paired_distances
+
+
+# hashes are (a * x + b) mod p over a Mersenne prime, which keeps every
+# product of a feature index and a coefficient within 64 bits
+_PRIME = np.uint64(2 ** 31 - 1)
+_EMPTY = np.iinfo(np.uint64).max
+
+# the number of values held at once while sketching
+_BLOCK_CELLS = 2 ** 24
+
+
+def minhash_signatures(matrix, n_hashes=128, seed=0):
+    """The MinHash signature of the features present in each row
+
+    Parameters
+    ----------
+    matrix : scipy.sparse matrix
+        A samples by features matrix.
+    n_hashes : int, optional
+        The length of each signature.
+    seed : int, optional
+        The seed of the hash functions. Signatures are only comparable when
+        computed with the same seed.
+
+    Returns
+    -------
+    np.ndarray
+        A samples by ``n_hashes`` array of uint64. The fraction of positions
+        at which two signatures agree estimates the Jaccard similarity of
+        their rows. Empty rows are all the largest uint64.
+    """
+    matrix = ss.csr_matrix(matrix)
+    matrix.eliminate_zeros()
+    n_rows, n_features = matrix.shape
+    if n_features >= _PRIME:
+        raise ValueError("Too many features to hash.")
+
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, int(_PRIME), n_hashes).astype(np.uint64)
+    b = rng.randint(0, int(_PRIME), n_hashes).astype(np.uint64)
+    features = np.arange(n_features, dtype=np.uint64)
+
+    signatures = np.full((n_rows, n_hashes), _EMPTY, dtype=np.uint64)
+    occupied = np.flatnonzero(np.diff(matrix.indptr) > 0)
+    starts = matrix.indptr[occupied]
+    block = max(1, _BLOCK_CELLS // max(1, matrix.nnz))
+    for lo in range(0, n_hashes, block):
+        hi = min(lo + block, n_hashes)
+        hashes = (np.outer(features, a[lo:hi]) + b[lo:hi]) % _PRIME
+        # the minimum over each row's stored features, for every hash of
+        # the block at once
+        signatures[occupied, lo:hi] = np.minimum.reduceat(
+            hashes[matrix.indices], starts, axis=0)
+    return signatures
+
+
+def lsh_candidates(signatures, bands, max_bucket_size=None):
+    """Pairs of rows whose signatures agree over at least one band
+
+    Parameters
+    ----------
+    signatures : np.ndarray
+        As returned by ``minhash_signatures``.
+    bands : int
+        The number of bands, which must divide the signature length. Rows of
+        Jaccard similarity s become candidates with probability
+        1 - (1 - s ** r) ** bands, r being the rows per band.
+    max_bucket_size : int, optional
+        Buckets larger than this are skipped, such as those of empty or
+        near-identical low-diversity samples, which would otherwise
+        contribute a quadratic number of candidates.
+
+    Returns
+    -------
+    np.ndarray
+        An n by 2 array of distinct candidate pairs, each ordered.
+    """
+    n_rows, n_hashes = signatures.shape
+    if n_hashes % bands:
+        raise ValueError("%d hashes cannot be split into %d bands."
+                         % (n_hashes, bands))
+    width = n_hashes // bands
+    nonempty = signatures[:, 0] != _EMPTY
+
+    pairs = []
+    for band in range(bands):
+        rows = np.ascontiguousarray(
+            signatures[nonempty, band * width:(band + 1) * width])
+        # the band of each row is viewed as one opaque value, so rows are
+        # bucketed by a single sort
+        keys = rows.view(np.dtype((np.void, rows.dtype.itemsize * width)))
+        _, buckets, sizes = np.unique(keys.ravel(), return_inverse=True,
+                                      return_counts=True)
+        shared = sizes[buckets] > 1
+        if max_bucket_size is not None:
+            shared &= sizes[buckets] <= max_bucket_size
+        members = np.flatnonzero(nonempty)[shared]
+        buckets = buckets[shared]
+        order = np.argsort(buckets, kind='mergesort')
+        members, buckets = members[order], buckets[order]
+        bounds = np.flatnonzero(np.diff(buckets)) + 1
+        for group in np.split(members, bounds):
+            if len(group) > 1:
+                i, j = np.triu_indices(len(group), k=1)
+                pairs.append(group[i] * n_rows + group[j])
+
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+    pairs = np.unique(np.concatenate(pairs))
+    return np.column_stack([pairs // n_rows, pairs % n_rows])
+
+
+def similar_pairs(table: biom.Table, threshold: float = 0.5,
+                  n_hashes: int = 128, bands: int = 32,
+                  max_bucket_size: int = 1000,
+                  seed: int = 0) -> pd.DataFrame:
+    presence = ss.csr_matrix(table.matrix_data.T)
+    signatures = minhash_signatures(presence, n_hashes, seed)
+    candidates = lsh_candidates(signatures, bands, max_bucket_size)
+    a, b = candidates[:, 0], candidates[:, 1]
+
+    # candidates are only a filter, and each is verified exactly
+    estimated = (signatures[a] == signatures[b]).mean(axis=1)
+    similarity = 1 - paired_distances(presence, a, b, 'jaccard')
+    keep = similarity >= threshold
+
+    sample_ids = table.ids(axis='sample')
+    pairs = pd.DataFrame({'sample-b': sample_ids[b[keep]],
+                          'estimated-similarity': estimated[keep],
+                          'similarity': similarity[keep]},
+                         index=pd.Index(sample_ids[a[keep]],
+                                        name='sample-a'),
+                         columns=['sample-b', 'estimated-similarity',
+                                  'similarity'])
+    return pairs.sort_values('similarity', ascending=False)
@@ -0,0 +1,132 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+from concurrent.futures import ThreadPoolExecutor
+
+import biom
+import numpy as np
+import pandas as pd
+import scipy.sparse as ss
+
+from ._rank import sparse_ranks
+
+
+METHODS = ('spearman', 'rho')
+
+# the dense temporaries held per row of a block, relative to the block
+_BLOCK_OVERHEAD = 4
+
+
+class _Covariance:
+    """Blocks of the covariance among the rows of a sparse matrix
+
+    The covariance of rows a and b is ``M_a . M_b / n - m_a * m_b`` where m
+    holds the row means, so only a sparse product is needed and rows are
+    never centered, which would make them dense.
+    """
+    def __init__(self, matrix):
+        self.matrix = ss.csr_matrix(matrix, dtype=float)
+        self.n = self.matrix.shape[1]
+        self.means = np.asarray(self.matrix.mean(axis=1)).ravel()
+        squares = self.matrix.multiply(self.matrix)
+        mean_squares = np.asarray(squares.sum(axis=1)).ravel() / self.n
+        self.variances = mean_squares - self.means ** 2
+        # the subtraction leaves rounding error where a row is constant
+        self.variances[self.variances <= 1e-12 * mean_squares] = 0
+
+    def block(self, start, stop):
+        products = (self.matrix[start:stop] @ self.matrix.T).toarray()
+        return (products / self.n -
+                np.outer(self.means[start:stop], self.means))
+
+
+def _spearman(matrix):
+    ranks, zero_rank, _ = sparse_ranks(matrix)
+    # shifting each row by the rank of its zeros leaves the covariance
+    # unchanged but makes the zeros zero again
+    shifted = ranks.copy()
+    shifted.data -= np.repeat(zero_rank, np.diff(shifted.indptr))
+    cov = _Covariance(shifted)
+    # a constant feature has no correlation, and NaN is never reported
+    sd = np.sqrt(cov.variances)
+    sd[sd == 0] = np.nan
+
+    def association(start, stop):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return cov.block(start, stop) / np.outer(sd[start:stop], sd)
+    return association
+
+
+def _rho(matrix):
+    # log(x + 1) keeps zeros zero, and the clr of a feature differs from it
+    # only by a per-sample shift c, which cancels in var(clr_a - clr_b)
+    logged = ss.csr_matrix(matrix, dtype=float, copy=True)
+    logged.data = np.log1p(logged.data)
+    cov = _Covariance(logged)
+
+    shift = np.asarray(logged.mean(axis=0)).ravel()
+    with_shift = (logged @ shift) / cov.n - cov.means * shift.mean()
+    clr_variances = cov.variances - 2 * with_shift + shift.var()
+
+    def association(start, stop):
+        block = cov.block(start, stop)
+        log_ratio_variance = (cov.variances[start:stop, None] +
+                              cov.variances[None, :] - 2 * block)
+        denominator = clr_variances[start:stop, None] + clr_variances
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return 1 - log_ratio_variance / denominator
+    return association
+
+
+def feature_network(table: biom.Table, method: str = 'spearman',
+                    threshold: float = 0.6, min_prevalence: float = 0.01,
+                    max_memory_mb: int = 1024,
+                    n_jobs: int = 1) -> pd.DataFrame:
+    if method not in METHODS:
+        raise ValueError("Unknown method %r." % method)
+
+    matrix = table.matrix_data.tocsr()
+    prevalence = np.diff(matrix.indptr) / matrix.shape[1]
+    keep = np.flatnonzero(prevalence >= min_prevalence)
+    if len(keep) < 2:
+        raise ValueError("Fewer than two features are present in at least "
+                         "%r of samples." % min_prevalence)
+    matrix = matrix[keep]
+    feature_ids = np.asarray(table.ids(axis='observation'), dtype=object)
+    feature_ids = feature_ids[keep]
+    n_features = len(keep)
+
+    association = {'spearman': _spearman, 'rho': _rho}[method](matrix)
+
+    # a block of rows against all features is the largest dense array
+    # materialized, so the memory cap sets the block height
+    block_rows = int(max_memory_mb * 2 ** 20 /
+                     (8 * n_features * _BLOCK_OVERHEAD * n_jobs))
+    block_rows = max(1, min(block_rows, n_features))
+
+    def edges(start):
+        stop = min(start + block_rows, n_features)
+        block = association(start, stop)
+        rows, cols = np.nonzero(np.abs(block) >= threshold)
+        # each pair is kept once, from the block holding its first feature
+        upper = cols > rows + start
+        rows, cols = rows[upper], cols[upper]
+        return rows + start, cols, block[rows, cols]
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        results = list(executor.map(edges, range(0, n_features,
+                                                 block_rows)))
+
+    rows = np.concatenate([r for r, _, _ in results])
+    cols = np.concatenate([c for _, c, _ in results])
+    values = np.concatenate([v for _, _, v in results])
+    network = pd.DataFrame({'feature-b': feature_ids[cols],
+                            'association': values},
+                           index=pd.Index(feature_ids[rows],
+                                          name='feature-a'),
+                           columns=['feature-b', 'association'])
+    return network
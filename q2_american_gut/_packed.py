@@ -0,0 +1,175 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import biom
+import h5py
+import numpy as np
+import scipy.sparse as ss
+import skbio
+
+from ._bitset import pack_rows, popcount
+
+
+# the number of unpacked bytes held at once by default
+_BLOCK_CELLS = 2 ** 24
+
+
+class PackedPresence:
+    """The presence and absence of features, eight samples to a byte
+
+    Parameters
+    ----------
+    bits : np.ndarray of uint8
+        A features by ceil(samples / 8) array, bit j of row i set, in the
+        order of ``np.packbits``, where feature i is present in sample j.
+    feature_ids : iterable of str
+        The features, in row order.
+    sample_ids : iterable of str
+        The samples, in bit order.
+    """
+    FORMAT_VERSION = 1
+
+    def __init__(self, bits, feature_ids, sample_ids):
+        self.bits = np.asarray(bits, dtype=np.uint8)
+        self.feature_ids = np.asarray(list(feature_ids), dtype=object)
+        self.sample_ids = np.asarray(list(sample_ids), dtype=object)
+        expected = (len(self.feature_ids), (len(self.sample_ids) + 7) // 8)
+        if self.bits.shape != expected:
+            raise ValueError("Expected bits of shape %r, found %r."
+                             % (expected, self.bits.shape))
+
+    @property
+    def shape(self):
+        return len(self.feature_ids), len(self.sample_ids)
+
+    @classmethod
+    def from_table(cls, table):
+        return cls(pack_rows(table.matrix_data),
+                   table.ids(axis='observation'), table.ids(axis='sample'))
+
+    def to_table(self):
+        """The presence of each feature as a biom.Table of ones"""
+        rows, cols = [], []
+        for lo, hi, dense in self._unpacked_blocks():
+            i, j = np.nonzero(dense)
+            rows.append(i + lo)
+            cols.append(j)
+        rows = np.concatenate(rows) if rows else np.array([], dtype=int)
+        cols = np.concatenate(cols) if cols else np.array([], dtype=int)
+        matrix = ss.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                               shape=self.shape)
+        return biom.Table(matrix, list(self.feature_ids),
+                          list(self.sample_ids))
+
+    def _unpacked_blocks(self, max_cells=None):
+        """Successive rows of features unpacked to one byte per sample"""
+        if max_cells is None:
+            max_cells = _BLOCK_CELLS
+        n_features, n_samples = self.shape
+        step = 8 * max(1, max_cells // max(1, 8 * n_samples))
+        for lo in range(0, n_features, step):
+            hi = min(lo + step, n_features)
+            yield lo, hi, np.unpackbits(self.bits[lo:hi], axis=1,
+                                        count=n_samples)
+
+    def prevalence(self):
+        """The number of samples in which each feature is present"""
+        return popcount(self.bits, axis=1)
+
+    def filter_features(self, keep):
+        """The table restricted to a boolean mask or indices of features"""
+        return PackedPresence(self.bits[keep], self.feature_ids[keep],
+                              self.sample_ids)
+
+    def to_hdf5(self, h5grp):
+        h5grp.attrs['format-version'] = self.FORMAT_VERSION
+        h5grp.attrs['n-samples'] = len(self.sample_ids)
+        vlen = h5py.special_dtype(vlen=str)
+        h5grp.create_dataset('feature-ids',
+                             data=[i.encode('utf8') for i in self.feature_ids],
+                             dtype=vlen)
+        h5grp.create_dataset('sample-ids',
+                             data=[i.encode('utf8') for i in self.sample_ids],
+                             dtype=vlen)
+        h5grp.create_dataset('bits', data=self.bits, compression='gzip')
+
+    @classmethod
+    def from_hdf5(cls, h5grp):
+        def decode(ids):
+            return [i.decode('utf8') if isinstance(i, bytes) else i
+                    for i in ids]
+        return cls(h5grp['bits'][:], decode(h5grp['feature-ids'][:]),
+                   decode(h5grp['sample-ids'][:]))
+
+
+def jaccard(table, max_memory_mb=256):
+    """The Jaccard distances among the samples of a packed table
+
+    Parameters
+    ----------
+    table : PackedPresence
+        The table whose samples are compared.
+    max_memory_mb : int, optional
+        An approximate bound on the memory of every intermediate array,
+        beyond the matrix of distances returned.
+
+    Returns
+    -------
+    np.ndarray
+        The square matrix of distances. Two empty samples are at distance
+        zero, as in ``scipy.spatial.distance.jaccard``.
+    """
+    n = table.shape[1]
+    budget = max(1, max_memory_mb * 2 ** 20)
+    # half the budget holds a block of features unpacked, its transposed
+    # copy and its bits repacked eight features to a byte, the other half
+    # the intersections of a block of samples with every later sample, the
+    # set bits of each and their sum
+    width = max(1, budget // (2 * 17 * max(1, n)))
+    rows = max(1, budget // (2 * max(1, n) * (2 * width + 8)))
+
+    # the upper triangle first counts the features shared by each pair
+    distances = np.zeros((n, n))
+    sizes = np.zeros(n, dtype=np.int64)
+    for _, _, dense in table._unpacked_blocks(8 * width * n):
+        bits = np.packbits(dense.T, axis=1)
+        sizes += popcount(bits, axis=1)
+        for lo in range(0, n, rows):
+            hi = min(lo + rows, n)
+            distances[lo:hi, lo:] += popcount(
+                bits[lo:hi, None, :] & bits[None, lo:, :], axis=2)
+
+    # and is then turned into distances in place, and mirrored
+    for lo in range(0, n, rows):
+        hi = min(lo + rows, n)
+        block = distances[lo:hi, lo:]
+        union = sizes[lo:hi, None] + sizes[None, lo:] - block
+        nonempty = union > 0
+        np.divide(block, union, out=block, where=nonempty)
+        np.subtract(1, block, out=block, where=nonempty)
+        distances[lo:, lo:hi] = block.T
+    return distances
+
+
+def pack_presence(table: biom.Table) -> PackedPresence:
+    return PackedPresence.from_table(table)
+
+
+def filter_prevalence(table: PackedPresence, min_prevalence: float = 0.0,
+                      max_prevalence: float = 1.0) -> PackedPresence:
+    prevalence = table.prevalence() / max(1, table.shape[1])
+    keep = (prevalence >= min_prevalence) & (prevalence <= max_prevalence)
+    if not keep.any():
+        raise ValueError("No feature is present in between %r and %r of the "
+                         "samples." % (min_prevalence, max_prevalence))
+    return table.filter_features(keep)
+
+
+def jaccard_distances(table: PackedPresence,
+                      max_memory_mb: int = 256) -> skbio.DistanceMatrix:
+    distances = jaccard(table, max_memory_mb)
+    return skbio.DistanceMatrix(distances, ids=list(table.sample_ids))
@@ -0,0 +1,66 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import multiprocessing
+
+
+_SHARED = None
+
+
+def _set_shared(shared):
+    global _SHARED
+    _SHARED = shared
+
+
+def get_shared():
+    """The read-only data handed to the current worker by ``imap_shared``"""
+    return _SHARED
+
+
+def imap_shared(func, items, shared, n_jobs=1, ordered=False):
+    """Map a function over items in a process pool with shared data
+
+    Parameters
+    ----------
+    func : callable
+        A module level function of one item. It can retrieve the shared data
+        with ``get_shared``.
+    items : iterable
+        The items to map over.
+    shared : object
+        Read-only data needed by every call, such as a reference table. It is
+        handed to each worker once when the worker starts rather than once
+        per item, and on platforms which fork it is not copied at all until
+        written to.
+    n_jobs : int, optional
+        The number of worker processes. With one, items are processed in
+        this process.
+    ordered : bool, optional
+        Whether results must be yielded in the order of ``items``.
+
+    Yields
+    ------
+    object
+        The result of each call as it completes.
+    """
+    if n_jobs < 1:
+        raise ValueError("n_jobs must be positive.")
+
+    if n_jobs == 1:
+        _set_shared(shared)
+        try:
+            for item in items:
+                yield func(item)
+        finally:
+            _set_shared(None)
+        return
+
+    with multiprocessing.Pool(n_jobs, initializer=_set_shared,
+                              initargs=(shared, )) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for result in imap(func, items):
+            yield result
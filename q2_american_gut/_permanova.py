@@ -0,0 +1,163 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import qiime2
+import scipy.sparse as ss
+import skbio
+
+from ._rank import benjamini_hochberg
+
+
+# the number of values of the product of distances and group indicators held
+# at once by each thread
+_PRODUCT_CELLS = 2 ** 22
+
+
+def within_sums(squared, labels, max_cells=_PRODUCT_CELLS):
+    """The within group sum of squares for a batch of groupings
+
+    Parameters
+    ----------
+    squared : np.ndarray
+        The squared distances among n samples.
+    labels : np.ndarray of int
+        A (groupings, n) array of group labels, from zero. Every grouping
+        must have the same group sizes, as permutations of one do.
+    max_cells : int, optional
+        The number of values of the intermediate product held at once.
+
+    Returns
+    -------
+    np.ndarray
+        The within group sum of squares of each grouping.
+
+    Notes
+    -----
+    Stacking the group indicators of every grouping side by side turns the
+    per-group sums over the distance matrix into one product with a sparse
+    matrix of n entries per grouping, so the cost is that of n squared
+    values per grouping whatever the number of groups. Rows are taken a few
+    at a time so the product, one value per row, group and grouping, stays
+    within ``max_cells``.
+    """
+    n_groupings, n = labels.shape
+    k = labels.max() + 1
+    columns = labels + (np.arange(n_groupings) * k)[:, None]
+    indicator = ss.csr_matrix(
+        (np.ones(n * n_groupings), (columns.ravel(),
+                                    np.tile(np.arange(n), n_groupings))),
+        shape=(n_groupings * k, n))
+    weights = 1. / np.bincount(labels[0], minlength=k)[labels]
+
+    within = np.zeros(n_groupings)
+    step = max(1, max_cells // (n_groupings * k))
+    for lo in range(0, n, step):
+        hi = min(lo + step, n)
+        # the sum of the squared distances of each row to every group of
+        # every grouping, of which only the row's own groups are kept
+        product = indicator @ squared[lo:hi].T
+        own = product[columns[:, lo:hi], np.arange(hi - lo)]
+        within += (own * weights[:, lo:hi]).sum(axis=1)
+    return within / 2
+
+
+def _pseudo_f(total, within, n, k):
+    return ((total - within) / (k - 1)) / (within / (n - k))
+
+
+def _restrict(permutations, positions, n):
+    """Restrict permutations of n items to a subset of the items
+
+    The order a uniform random permutation induces on a subset is itself a
+    uniform random permutation, so one set of permutations serves every
+    subset of samples.
+    """
+    subset = np.full(n, -1)
+    subset[positions] = np.arange(len(positions))
+    restricted = subset[permutations]
+    return restricted[restricted >= 0].reshape(len(permutations), -1)
+
+
+def _test(squared, labels, permutations, batch_size, alpha, early_stopping):
+    n = len(labels)
+    k = labels.max() + 1
+    total = squared.sum() / (2 * n)
+    observed = _pseudo_f(total, within_sums(squared, labels[None, :]), n,
+                         k)[0]
+
+    exceeded = performed = 0
+    for start in range(0, len(permutations), batch_size):
+        batch = labels[permutations[start:start + batch_size]]
+        stats = _pseudo_f(total, within_sums(squared, batch), n, k)
+        exceeded += (stats >= observed).sum()
+        performed += len(batch)
+
+        # stop once the p-value is confidently above alpha, as further
+        # permutations cannot make the test significant
+        p = (exceeded + 1) / (performed + 1)
+        if early_stopping and \
+                p - 2.58 * np.sqrt(p * (1 - p) / performed) > alpha:
+            break
+
+    if not len(permutations):
+        return observed, np.nan, 0
+    return observed, (exceeded + 1) / (performed + 1), performed
+
+
+def permanova(distance_matrix: skbio.DistanceMatrix,
+              metadata: qiime2.Metadata, columns: list = None,
+              permutations: int = 999, batch_size: int = 100,
+              early_stopping: bool = True, alpha: float = 0.05,
+              random_seed: int = 0, n_jobs: int = 1) -> pd.DataFrame:
+    ids = list(distance_matrix.ids)
+    md = metadata.to_dataframe().reindex(ids)
+    if columns is None:
+        columns = [c for c, props in metadata.columns.items()
+                   if props.type == 'categorical']
+    unknown = set(columns) - set(md.columns)
+    if unknown:
+        raise ValueError("Columns not present in the metadata: %s"
+                         % ', '.join(sorted(unknown)))
+
+    squared = distance_matrix.data ** 2
+    rng = np.random.RandomState(random_seed)
+    # every column is tested against the same permutations
+    shared = np.array([rng.permutation(len(ids))
+                       for _ in range(permutations)]).reshape(
+                           permutations, len(ids))
+
+    def test_column(column):
+        values = md[column]
+        positions = np.flatnonzero(values.notna().values)
+        labels = pd.Categorical(values.iloc[positions]).codes
+        k = len(np.unique(labels))
+        if k < 2 or len(positions) <= k:
+            return column, len(positions), k, np.nan, np.nan, 0
+        if len(positions) < len(ids):
+            sub = squared[np.ix_(positions, positions)]
+            perms = _restrict(shared, positions, len(ids))
+        else:
+            sub, perms = squared, shared
+        stat, p, performed = _test(sub, labels.astype(np.int64), perms,
+                                   batch_size, alpha, early_stopping)
+        return column, len(positions), k, stat, p, performed
+
+    # the matrix products release the GIL, so threads share the squared
+    # distances without copying them
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        results = list(executor.map(test_column, columns))
+
+    results = pd.DataFrame(results, columns=['variable', 'sample size',
+                                             'number of groups',
+                                             'test statistic', 'p-value',
+                                             'number of permutations'])
+    results['q-value'] = benjamini_hochberg(results['p-value'])
+    return results.set_index('variable')
@@ -0,0 +1,156 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import hashlib
+import os
+import time
+
+import biom
+import numpy as np
+import pandas as pd
+import qiime2
+import scipy.sparse as ss
+from sklearn.ensemble import (RandomForestClassifier, RandomForestRegressor,
+                              ExtraTreesClassifier, ExtraTreesRegressor)
+from sklearn.metrics import accuracy_score, mean_absolute_error, r2_score
+from sklearn.model_selection import KFold, StratifiedKFold
+
+from ._fingerprint import array_fingerprint
+from ._parallel import imap_shared, get_shared
+from ._version import get_versions
+from ._training import build_training_set
+
+
+ESTIMATORS = {
+    'RandomForest': (RandomForestRegressor, RandomForestClassifier),
+    'ExtraTrees': (ExtraTreesRegressor, ExtraTreesClassifier),
+}
+
+
+def _selected_features(train):
+    """The features prevalent enough in a fold's training samples
+
+    When a cache directory is configured the selection is stored under a
+    key of the data, the training samples and the threshold, so repeated
+    runs over the same data skip it.
+    """
+    shared = get_shared()
+    path = None
+    if shared['cache_dir'] is not None:
+        key = hashlib.sha1(shared['data_key'])
+        key.update(train.tobytes())
+        key.update(repr(shared['min_prevalence']).encode('ascii'))
+        path = os.path.join(shared['cache_dir'],
+                            'fold-features-%s.npy' % key.hexdigest())
+        if os.path.exists(path):
+            return np.load(path)
+
+    X = shared['X'][train]
+    prevalence = np.bincount(X.indices, minlength=X.shape[1]) / X.shape[0]
+    selected = np.flatnonzero(prevalence >= shared['min_prevalence'])
+
+    if path is not None:
+        np.save(path, selected)
+    return selected
+
+
+def _run_fold(fold):
+    shared = get_shared()
+    train, test = shared['folds'][fold]
+    X, y = shared['X'], shared['y']
+
+    start = time.time()
+    selected = _selected_features(train)
+    preprocess_time = time.time() - start
+
+    estimator = shared['estimator'](n_estimators=shared['n_estimators'],
+                                    random_state=shared['random_seed'],
+                                    n_jobs=1)
+    start = time.time()
+    estimator.fit(X[train][:, selected], y[train])
+    fit_time = time.time() - start
+
+    start = time.time()
+    predicted = estimator.predict(X[test][:, selected])
+    predict_time = time.time() - start
+
+    return (fold, test, predicted, len(train), len(selected),
+            preprocess_time, fit_time, predict_time)
+
+
+def predict_trait(table: biom.Table, target: qiime2.MetadataColumn,
+                  estimator: str = 'RandomForest', n_estimators: int = 100,
+                  cv: int = 5, min_prevalence: float = 0.0,
+                  random_seed: int = 0, cache_dir: str = None,
+                  n_jobs: int = 1) -> (pd.DataFrame, pd.DataFrame):
+    data = build_training_set(table, target.to_series())
+    if cv < 2 or cv > len(data.y):
+        raise ValueError("cv must be between 2 and the number of samples "
+                         "with a target, %d." % len(data.y))
+
+    # relative abundances are computed once for all folds
+    depths = np.asarray(data.X.sum(axis=1)).ravel()
+    depths[depths == 0] = 1
+    X = ss.csr_matrix(ss.diags(1. / depths) @ data.X, dtype=np.float32)
+
+    regressor, classifier = ESTIMATORS[estimator]
+    if data.is_categorical:
+        splitter = StratifiedKFold(cv, shuffle=True, random_state=random_seed)
+    else:
+        splitter = KFold(cv, shuffle=True, random_state=random_seed)
+    folds = list(splitter.split(np.zeros(len(data.y)), data.y))
+
+    # cached selections are keyed on the plugin version too, so an upgrade
+    # never reuses another version's results
+    data_key, _ = array_fingerprint((X.data, X.indices, X.indptr, data.y))
+    data_key = '%s %s' % (get_versions()['version'], data_key)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    shared = {
+        'X': X, 'y': data.y, 'folds': folds,
+        'estimator': classifier if data.is_categorical else regressor,
+        'n_estimators': n_estimators, 'random_seed': random_seed,
+        'min_prevalence': min_prevalence, 'cache_dir': cache_dir,
+        'data_key': data_key.encode('utf8'),
+    }
+
+    predictions = np.empty(len(data.y), dtype=data.y.dtype)
+    fold_of = np.empty(len(data.y), dtype=np.int64)
+    report = []
+    for (fold, test, predicted, n_train, n_features, preprocess_time,
+         fit_time, predict_time) in imap_shared(_run_fold, range(cv), shared,
+                                                n_jobs=n_jobs):
+        predictions[test] = predicted
+        fold_of[test] = fold
+        truth = data.y[test]
+        row = {'fold': fold, 'n-train': n_train, 'n-test': len(test),
+               'n-features': n_features,
+               'preprocess-seconds': preprocess_time,
+               'fit-seconds': fit_time, 'predict-seconds': predict_time}
+        if data.is_categorical:
+            row['accuracy'] = accuracy_score(truth, predicted)
+        else:
+            row['r2'] = r2_score(truth, predicted)
+            row['mae'] = mean_absolute_error(truth, predicted)
+        report.append(row)
+
+    truth = data.y
+    if data.is_categorical:
+        classes = np.asarray(data.classes, dtype=object)
+        truth, predictions = classes[truth], classes[predictions]
+
+    predictions = pd.DataFrame(
+        {'truth': truth, 'prediction': predictions, 'fold': fold_of},
+        index=pd.Index(data.sample_ids, name='sample-id'),
+        columns=['truth', 'prediction', 'fold'])
+    columns = ['fold', 'n-train', 'n-test', 'n-features',
+               'preprocess-seconds', 'fit-seconds', 'predict-seconds']
+    columns += ['accuracy'] if data.is_categorical else ['r2', 'mae']
+    report = pd.DataFrame(report, columns=columns).set_index('fold')
+    report = report.sort_index()
+    return predictions, report
@@ -0,0 +1,160 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import biom
+import numpy as np
+import pandas as pd
+import scipy.sparse as ss
+
+
+def bloom_mask(feature_ids, blooms):
+    """Which features are blooms
+
+    A feature matches a bloom when the shorter of its ID and the bloom
+    sequence is a prefix of the other, so 150 nt blooms match the 100 nt
+    or 125 nt sOTUs derived from them.
+
+    Parameters
+    ----------
+    feature_ids : iterable of str
+        The sOTU sequences.
+    blooms : iterable of str
+        The bloom sequences.
+
+    Returns
+    -------
+    np.ndarray of bool
+    """
+    ids = np.char.upper(np.asarray(feature_ids, dtype=str))
+    blooms = np.char.upper(np.asarray(list(blooms), dtype=str))
+    id_lengths = np.char.str_len(ids)
+    bloom_lengths = np.char.str_len(blooms)
+
+    mask = np.zeros(len(ids), dtype=bool)
+    # truncating to a fixed width string compares every ID of a length at
+    # once rather than one prefix at a time
+    for length in np.unique(bloom_lengths):
+        prefixes = blooms[bloom_lengths == length]
+        longer = id_lengths >= length
+        mask[longer] |= np.isin(ids[longer].astype('<U%d' % length),
+                                prefixes)
+    for length in np.unique(id_lengths):
+        prefixes = blooms[bloom_lengths > length].astype('<U%d' % length)
+        of_length = id_lengths == length
+        mask[of_length] |= np.isin(ids[of_length], prefixes)
+    return mask
+
+
+def sample_qc(table, blooms=None, contaminants=None):
+    """Per sample quality metrics from one pass over a table
+
+    Parameters
+    ----------
+    table : biom.Table
+        The feature table.
+    blooms : np.ndarray of bool, optional
+        Which features are blooms.
+    contaminants : np.ndarray of bool, optional
+        Which features are contaminants.
+
+    Returns
+    -------
+    pd.DataFrame
+        The depth, bloom fraction, singleton ratio, private fraction and
+        contaminant fraction of each sample, the last being NaN without a
+        mask, as is the bloom fraction. The singleton ratio is the fraction
+        of a sample's features seen once, and the private fraction the
+        fraction of its reads from features seen in no other sample, as
+        chimeras and other artifacts tend to be.
+    """
+    matrix = ss.csc_matrix(table.matrix_data, dtype=float)
+    n_features = matrix.shape[0]
+    features = matrix.indices
+    prevalence = np.bincount(features, minlength=n_features)
+
+    # every metric is a sum over each column's stored values, so weights
+    # per stored value are reduced by column in one call each
+    columns = np.repeat(np.arange(matrix.shape[1]), np.diff(matrix.indptr))
+
+    def column_sums(weights):
+        return np.bincount(columns, weights=weights,
+                           minlength=matrix.shape[1])
+
+    depth = column_sums(matrix.data)
+    observed = column_sums(matrix.data > 0)
+    singletons = column_sums(matrix.data == 1)
+    private = column_sums(matrix.data * (prevalence[features] == 1))
+    masked = {}
+    for name, mask in (('bloom-fraction', blooms),
+                       ('contaminant-fraction', contaminants)):
+        masked[name] = np.full(matrix.shape[1], np.nan)
+        if mask is not None:
+            masked[name] = column_sums(matrix.data * mask[features])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        qc = pd.DataFrame({'depth': depth,
+                           'bloom-fraction': masked['bloom-fraction'] / depth,
+                           'singleton-ratio': singletons / observed,
+                           'private-fraction': private / depth,
+                           'contaminant-fraction':
+                               masked['contaminant-fraction'] / depth},
+                          index=pd.Index(table.ids(axis='sample'),
+                                         name='sample-id'),
+                          columns=['depth', 'bloom-fraction',
+                                   'singleton-ratio', 'private-fraction',
+                                   'contaminant-fraction'])
+    return qc
+
+
+def qc_gate(table: biom.Table, blooms: pd.Series = None,
+            contaminant_scores: pd.DataFrame = None, min_depth: int = 1000,
+            max_bloom_fraction: float = 1.0,
+            max_singleton_ratio: float = 1.0,
+            max_private_fraction: float = 1.0,
+            max_contaminant_fraction: float = 1.0
+            ) -> (biom.Table, pd.DataFrame):
+    feature_ids = table.ids(axis='observation')
+    bloom_features = contaminant_features = None
+    if blooms is not None:
+        bloom_features = bloom_mask(feature_ids,
+                                    [str(b) for b in blooms.values])
+    if contaminant_scores is not None:
+        flagged = contaminant_scores['contaminant'].astype(str) == 'True'
+        contaminant_features = np.isin(
+            feature_ids, contaminant_scores.index[flagged.values])
+
+    qc = sample_qc(table, bloom_features, contaminant_features)
+    limits = [('depth', min_depth, np.greater_equal, '>='),
+              ('singleton-ratio', max_singleton_ratio, np.less_equal, '<='),
+              ('private-fraction', max_private_fraction, np.less_equal,
+               '<='),
+              ('bloom-fraction', max_bloom_fraction, np.less_equal, '<='),
+              ('contaminant-fraction', max_contaminant_fraction,
+               np.less_equal, '<=')]
+    # fractions are undefined for empty samples, which fail on depth alone,
+    # and for metrics without a mask
+    empty = qc['depth'].values == 0
+    passed = ~empty
+    failures = []
+    for column, limit, compare, symbol in limits:
+        values = qc[column].values
+        with np.errstate(invalid='ignore'):
+            failed = ~(compare(values, limit) | np.isnan(values))
+        if column == 'depth':
+            failed |= empty
+        passed &= ~failed
+        failures.append('%s %s %r: %d' % (column, symbol, limit,
+                                          failed.sum()))
+    qc['passed'] = passed
+
+    if not passed.any():
+        raise ValueError("No sample passed quality control. Of %d samples, "
+                         "the number failing each limit is %s."
+                         % (len(qc), ', '.join(failures)))
+    pruned = table.filter(qc.index[passed], axis='sample', inplace=False)
+    pruned = pruned.remove_empty(axis='observation', inplace=False)
+    return pruned, qc
@@ -0,0 +1,187 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import biom
+import numpy as np
+import pandas as pd
+import qiime2
+import scipy.sparse as ss
+from scipy.stats import chi2
+
+from ._parallel import imap_shared, get_shared
+
+
+def sparse_ranks(matrix):
+    """Rank the values of every row of a nonnegative sparse matrix
+
+    Zeros are not materialized. As every zero of a row shares the lowest
+    average rank, ranks are returned for the stored values only alongside
+    the rank shared by the zeros of each row.
+
+    Parameters
+    ----------
+    matrix : scipy.sparse.spmatrix
+        A features by samples matrix of nonnegative values.
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        The one-based average rank of each nonzero value within its row.
+    np.ndarray
+        The average rank of the zeros of each row.
+    np.ndarray
+        The tie term, sum(t ** 3 - t) over groups of tied values, of each
+        row, zeros included.
+    """
+    matrix = ss.csr_matrix(matrix, dtype=float, copy=True)
+    matrix.eliminate_zeros()
+    if (matrix.data < 0).any():
+        raise ValueError("Only nonnegative values can be ranked.")
+
+    n_rows, n_cols = matrix.shape
+    rows = np.repeat(np.arange(n_rows), np.diff(matrix.indptr))
+    order = np.lexsort((matrix.data, rows))
+    values, rows = matrix.data[order], rows[order]
+
+    n_zero = n_cols - np.diff(matrix.indptr)
+    position = np.arange(len(values)) - matrix.indptr[rows]
+
+    starts = np.ones(len(values), dtype=bool)
+    starts[1:] = (rows[1:] != rows[:-1]) | (values[1:] != values[:-1])
+    group = np.cumsum(starts) - 1
+    size = np.bincount(group)
+    first = position[starts]
+
+    rank = np.empty(len(values))
+    rank[order] = (n_zero[rows] + first[group] + (size[group] + 1) / 2.)
+    ranks = ss.csr_matrix((rank, matrix.indices, matrix.indptr),
+                          shape=matrix.shape)
+
+    ties = np.bincount(rows[starts], weights=size ** 3. - size,
+                       minlength=n_rows)
+    ties += n_zero ** 3. - n_zero
+    return ranks, (n_zero + 1) / 2., ties
+
+
+def kruskal_wallis(ranks, zero_rank, ties, labels):
+    """Kruskal-Wallis H tests of every row against one grouping
+
+    Parameters
+    ----------
+    ranks, zero_rank, ties
+        As returned by ``sparse_ranks`` over the samples being tested.
+    labels : np.ndarray of int
+        The group of each sample, from zero.
+
+    Returns
+    -------
+    np.ndarray
+        The tie corrected H statistic of each row.
+    np.ndarray
+        The p-value of each row.
+    """
+    n = len(labels)
+    k = labels.max() + 1
+    indicator = ss.csr_matrix((np.ones(n), (np.arange(n), labels)),
+                              shape=(n, k))
+    n_group = np.asarray(indicator.sum(axis=0)).ravel()
+
+    pattern = ranks.copy()
+    pattern.data[:] = 1
+    nonzero_in_group = (pattern @ indicator).toarray()
+    rank_sums = ((ranks @ indicator).toarray() +
+                 zero_rank[:, None] * (n_group - nonzero_in_group))
+
+    h = (12. / (n * (n + 1)) * (rank_sums ** 2 / n_group).sum(axis=1) -
+         3 * (n + 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        h = h / (1 - ties / (n ** 3. - n))
+    return h, chi2.sf(h, k - 1)
+
+
+def benjamini_hochberg(pvalues):
+    """Benjamini-Hochberg adjusted p-values, ignoring NaNs"""
+    pvalues = np.asarray(pvalues, dtype=float)
+    qvalues = np.full(len(pvalues), np.nan)
+    tested = np.flatnonzero(~np.isnan(pvalues))
+    if not len(tested):
+        return qvalues
+
+    order = np.argsort(pvalues[tested])
+    ranked = pvalues[tested][order] * len(tested) / \
+        np.arange(1, len(tested) + 1)
+    ranked = np.minimum.accumulate(ranked[::-1])[::-1]
+    qvalues[tested[order]] = np.minimum(ranked, 1)
+    return qvalues
+
+
+def _test_variable(item):
+    name, labels = item
+    shared = get_shared()
+    tested = labels >= 0
+
+    if tested.all():
+        ranks = shared['ranks']
+    else:
+        # variables with the same missing samples share a ranking
+        cache = shared['rank_cache']
+        key = tested.tobytes()
+        if key not in cache:
+            cache.clear()
+            cache[key] = sparse_ranks(shared['matrix'][:, tested])
+        ranks = cache[key]
+
+    h, p = kruskal_wallis(*ranks, labels=labels[tested])
+    return name, labels.max() + 1, tested.sum(), h, p
+
+
+def rank_test(table: biom.Table, metadata: qiime2.Metadata,
+              columns: list = None, min_group_size: int = 5,
+              n_jobs: int = 1) -> pd.DataFrame:
+    sample_ids = table.ids(axis='sample')
+    md = metadata.to_dataframe().reindex(sample_ids)
+    if columns is None:
+        columns = [c for c, props in metadata.columns.items()
+                   if props.type == 'categorical']
+    unknown = set(columns) - set(md.columns)
+    if unknown:
+        raise ValueError("Columns not present in the metadata: %s"
+                         % ', '.join(sorted(unknown)))
+
+    variables = []
+    for column in columns:
+        values = md[column]
+        counts = values.value_counts()
+        values = values.where(values.isin(counts.index[counts >=
+                                                       min_group_size]))
+        codes = pd.Categorical(values).codes.astype(np.int64)
+        if codes.max() >= 1:
+            variables.append((column, codes))
+
+    if not variables:
+        raise ValueError("No column has at least two groups of %d or more "
+                         "samples." % min_group_size)
+
+    matrix = table.matrix_data.tocsr()
+    # every feature is ranked once across all samples, and the ranks are
+    # reused by each variable without missing values. The last ranking of
+    # a subset is kept by each worker in its copy of the cache, which goes
+    # with the shared data once every variable is tested.
+    shared = {'matrix': matrix, 'ranks': sparse_ranks(matrix),
+              'rank_cache': {}}
+
+    feature_ids = table.ids(axis='observation')
+    results = []
+    for name, k, n, h, p in imap_shared(_test_variable, variables, shared,
+                                        n_jobs=n_jobs, ordered=True):
+        results.append(pd.DataFrame(
+            {'variable': name, 'n-groups': k, 'n-samples': n,
+             'statistic': h, 'p-value': p, 'q-value': benjamini_hochberg(p)},
+            index=pd.Index(feature_ids, name='feature-id')))
+
+    return pd.concat(results)[['variable', 'n-groups', 'n-samples',
+                               'statistic', 'p-value', 'q-value']]
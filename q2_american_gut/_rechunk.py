@@ -0,0 +1,29 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import biom
+import h5py
+from q2_types.feature_table import BIOMV210Format
+
+import q2_american_gut
+from ._hdf5 import PORTABLE_COMPRESSIONS, write_table
+
+
+def rechunk_table(table: biom.Table, chunk_size: int = 65536,
+                  compression: str = 'lzf') -> BIOMV210Format:
+    # the output is a plain FeatureTable, so it must be readable by other
+    # plugins without hdf5plugin
+    if compression not in PORTABLE_COMPRESSIONS:
+        raise ValueError("A feature table can only be written with one of: "
+                         "%s" % ', '.join(PORTABLE_COMPRESSIONS))
+    # the file is written here rather than by a transformer, as the layout
+    # depends on the parameters
+    ff = BIOMV210Format()
+    with h5py.File(str(ff), 'w') as h5:
+        write_table(table, h5, 'q2-american-gut %s'
+                    % q2_american_gut.__version__, chunk_size, compression)
+    return ff
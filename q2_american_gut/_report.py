@@ -0,0 +1,252 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import html
+import os
+import shutil
+import tempfile
+import time
+import urllib.parse
+
+import biom
+import numpy as np
+import pandas as pd
+import qiime2
+import scipy.sparse as ss
+import skbio
+
+from ._fingerprint import array_fingerprint
+from ._parallel import imap_shared, get_shared
+from ._topk import column_top_k
+
+
+_COMPLETE = '.complete'
+
+# scratch directories left this long by an interrupted run are removed.
+# Younger ones may belong to a run still rendering into the same cache.
+_STALE_SECONDS = 24 * 60 * 60
+
+
+def collapse_by_taxonomy(table, taxonomy, level):
+    """Collapse features to a taxonomic level with one sparse product
+
+    Parameters
+    ----------
+    table : biom.Table
+        The feature table.
+    taxonomy : pd.Series
+        Semicolon delimited taxonomy strings indexed by feature ID.
+    level : int
+        The number of ranks to retain.
+
+    Returns
+    -------
+    np.ndarray
+        The taxa, sorted.
+    scipy.sparse.csr_matrix
+        The taxa by sample counts.
+    """
+    features = table.ids(axis='observation')
+    missing = set(features) - set(taxonomy.index)
+    if missing:
+        raise ValueError("%d features are not present in the taxonomy."
+                         % len(missing))
+
+    lineages = taxonomy.loc[features].apply(
+        lambda t: ';'.join([r.strip() for r in t.split(';')][:level]))
+    taxa, inverse = np.unique(lineages.values.astype(str),
+                              return_inverse=True)
+    indicator = ss.csr_matrix((np.ones(len(features)),
+                               (inverse, np.arange(len(features)))),
+                              shape=(len(taxa), len(features)))
+    return taxa, (indicator @ table.matrix_data).tocsr()
+
+
+def _participant_dir(root, sample_id):
+    return os.path.join(root, urllib.parse.quote(sample_id, safe=''))
+
+
+def _reference_key(reference):
+    """A fingerprint of everything a participant report is rendered from
+
+    The reference is summarized from the table, taxonomy and taxonomic
+    level before this is computed, so a change to any input or parameter
+    gives a different key.
+    """
+    profiles = reference['profiles']
+    names = '\n'.join(list(reference['taxa']) +
+                      list(reference['sample_index']) +
+                      list(reference['alpha'].index) +
+                      list(reference['coords'].index))
+    key, _ = array_fingerprint(
+        [np.frombuffer(names.encode('utf8'), dtype=np.uint8),
+         profiles.data, profiles.indices, profiles.indptr,
+         reference['alpha'].values.astype(float),
+         reference['coords'].values.astype(float),
+         reference['explained'].astype(float),
+         np.array([reference['max_taxa']], dtype=np.int64)])
+    return key.replace(':', '-')
+
+
+def _figure(figsize):
+    # figures are drawn without pyplot, so neither the caller's backend nor
+    # its figure state are touched when reports render in this process
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot(1, 1, 1)
+
+
+def _render_participant(sample_id):
+    ref = get_shared()
+    final = _participant_dir(ref['root'], sample_id)
+    if os.path.exists(os.path.join(final, _COMPLETE)):
+        return sample_id, False
+
+    # render into a scratch directory which is only moved into place once
+    # complete, so an interrupted run never leaves a partial report behind
+    scratch = tempfile.mkdtemp(dir=ref['root'], prefix='.partial-')
+    sections = []
+
+    col = ref['sample_index'].get(sample_id)
+    if col is not None:
+        profile = ref['profiles'][:, col].toarray().ravel()
+        _, top, _, _ = column_top_k(ref['profiles'][:, col],
+                                    ref['max_taxa'])
+        top = top[::-1]
+        fig, ax = _figure((8, 0.4 * len(top) + 1.5))
+        y = np.arange(len(top))
+        ax.barh(y + 0.2, profile[top], height=0.4, label='You')
+        ax.barh(y - 0.2, ref['cohort_mean'][top], height=0.4,
+                label='Average participant')
+        ax.set_yticks(y)
+        ax.set_yticklabels([t.split(';')[-1] for t in ref['taxa'][top]])
+        ax.set_xlabel('Relative abundance')
+        ax.legend(loc='lower right')
+        fig.tight_layout()
+        fig.savefig(os.path.join(scratch, 'taxa.png'))
+        sections.append(('Most abundant taxa', 'taxa.png'))
+
+    alpha = ref['alpha']
+    if sample_id in alpha.index:
+        value = alpha.loc[sample_id]
+        percentile = 100 * (alpha < value).mean()
+        fig, ax = _figure((6, 4))
+        ax.hist(alpha.values, bins=50, color='lightgrey')
+        ax.axvline(value, color='red')
+        ax.set_xlabel(alpha.name or 'Alpha diversity')
+        ax.set_ylabel('Participants')
+        ax.set_title('Higher than %.0f%% of participants' % percentile)
+        fig.tight_layout()
+        fig.savefig(os.path.join(scratch, 'alpha.png'))
+        sections.append(('Diversity', 'alpha.png'))
+
+    coords = ref['coords']
+    if sample_id in coords.index:
+        fig, ax = _figure((6, 6))
+        ax.scatter(coords.iloc[:, 0], coords.iloc[:, 1], s=2,
+                   color='lightgrey', rasterized=True)
+        ax.scatter([coords.loc[sample_id].iloc[0]],
+                   [coords.loc[sample_id].iloc[1]], s=150, marker='*',
+                   color='red')
+        ax.set_xlabel('PC1 (%.1f%%)' % (100 * ref['explained'][0]))
+        ax.set_ylabel('PC2 (%.1f%%)' % (100 * ref['explained'][1]))
+        fig.tight_layout()
+        fig.savefig(os.path.join(scratch, 'pcoa.png'))
+        sections.append(('Your place among participants', 'pcoa.png'))
+
+    with open(os.path.join(scratch, 'index.html'), 'w') as fh:
+        fh.write('<html><head><title>%s</title></head><body>\n'
+                 % html.escape(sample_id))
+        fh.write('<h1>%s</h1>\n' % html.escape(sample_id))
+        for title, image in sections:
+            fh.write('<h2>%s</h2>\n<img src="%s">\n' % (title, image))
+        if not sections:
+            fh.write('<p>This sample is not present in the reference.</p>\n')
+        fh.write('</body></html>\n')
+    open(os.path.join(scratch, _COMPLETE), 'w').close()
+
+    if os.path.exists(final):
+        shutil.rmtree(final)
+    os.rename(scratch, final)
+    return sample_id, True
+
+
+def _is_stale(path):
+    try:
+        return time.time() - os.path.getmtime(path) > _STALE_SECONDS
+    except OSError:
+        # removed meanwhile by the run that made it
+        return False
+
+
+def participant_reports(output_dir: str, table: biom.Table,
+                        taxonomy: pd.Series,
+                        alpha_diversity: pd.Series,
+                        pcoa: skbio.OrdinationResults,
+                        samples: qiime2.Metadata,
+                        taxonomic_level: int = 6, max_taxa: int = 10,
+                        cache_dir: str = None, n_jobs: int = 1) -> None:
+    sample_ids = list(samples.ids)
+    root = os.path.join(output_dir, 'participants')
+
+    # the reference is summarized once here and shared read-only with every
+    # worker, instead of being reloaded for each participant
+    taxa, counts = collapse_by_taxonomy(table, taxonomy, taxonomic_level)
+    depths = np.asarray(counts.sum(axis=0)).ravel()
+    depths[depths == 0] = 1
+    profiles = counts.multiply(1. / depths).tocsc()
+
+    reference = {
+        'taxa': taxa,
+        'profiles': profiles,
+        'sample_index': {s: i for i, s in
+                         enumerate(table.ids(axis='sample'))},
+        'cohort_mean': np.asarray(profiles.mean(axis=1)).ravel(),
+        'alpha': alpha_diversity.dropna(),
+        'coords': pcoa.samples.iloc[:, :2],
+        'explained': np.asarray(pcoa.proportion_explained)[:2],
+        'max_taxa': max_taxa,
+    }
+
+    if cache_dir is not None:
+        # reports are kept under a fingerprint of the reference, so those
+        # rendered from other inputs or parameters are never reused
+        render_root = os.path.join(cache_dir, _reference_key(reference))
+        os.makedirs(render_root, exist_ok=True)
+        for name in os.listdir(render_root):
+            path = os.path.join(render_root, name)
+            if name.startswith('.partial-') and _is_stale(path):
+                shutil.rmtree(path, ignore_errors=True)
+    else:
+        os.makedirs(root)
+        render_root = root
+    reference['root'] = render_root
+
+    for _ in imap_shared(_render_participant, sample_ids, reference,
+                         n_jobs=n_jobs):
+        pass
+
+    if cache_dir is not None:
+        os.makedirs(root)
+        for sample_id in sample_ids:
+            shutil.copytree(_participant_dir(render_root, sample_id),
+                            _participant_dir(root, sample_id))
+
+    with open(os.path.join(output_dir, 'index.html'), 'w') as fh:
+        fh.write('<html><head><title>Participant reports</title></head>'
+                 '<body>\n<h1>Participant reports</h1>\n<ul>\n')
+        for sample_id in sample_ids:
+            link = os.path.relpath(
+                os.path.join(_participant_dir(root, sample_id),
+                             'index.html'), output_dir)
+            fh.write('<li><a href="%s">%s</a></li>\n'
+                     % (html.escape(urllib.parse.quote(link)),
+                        html.escape(sample_id)))
+        fh.write('</ul>\n</body></html>\n')
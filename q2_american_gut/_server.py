@@ -0,0 +1,326 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""A local service answering queries against an AG reference table
+
+The reference table is loaded once by the server and queried by any number
+of clients on the same host over a Unix socket, rather than each worker
+loading its own copy.
+
+Each message is one line of JSON holding a batch of requests::
+
+    {"requests": [{"op": "fetch", "sample": "10317.000012345"},
+                  {"op": "neighbors", "sample": "10317.000012345", "k": 5},
+                  {"op": "neighbors", "vector": {"TACG...": 10}, "k": 5},
+                  {"op": "percentile", "feature": "TACG...", "value": 0.01},
+                  {"op": "percentile", "alpha": 4.2},
+                  {"op": "stats"}]}
+
+and is answered by one line of JSON holding a response per request, each
+with its latency, and the latency of the whole batch. Neighbor requests
+within a batch are answered together with one sparse matrix product. Each
+request is validated on its own, and one that is malformed, names an
+unknown sample or feature, or asks for fewer than one neighbor is answered
+with an error without affecting the others.
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as ss
+
+from ._loader import read_table
+
+
+class ReferenceServer(socketserver.ThreadingMixIn,
+                      socketserver.UnixStreamServer):
+    """Serve queries against a reference table
+
+    Parameters
+    ----------
+    socket_path : str
+        The Unix socket to listen on.
+    table : biom.Table
+        The reference table.
+    alpha : pd.Series, optional
+        An alpha diversity metric of the reference samples, enabling
+        percentile queries of alpha diversity.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, table, alpha=None):
+        self.sample_ids = np.asarray(table.ids(axis='sample'), dtype=object)
+        self.feature_ids = np.asarray(table.ids(axis='observation'),
+                                      dtype=object)
+        self._sample_index = {s: i for i, s in enumerate(self.sample_ids)}
+        self._feature_index = {f: i for i, f in enumerate(self.feature_ids)}
+
+        # every structure is built once and only read afterwards, so the
+        # handler threads share them without locking
+        counts = table.matrix_data.tocsc()
+        depths = np.asarray(counts.sum(axis=0)).ravel()
+        depths[depths == 0] = 1
+        self._relative = ss.csc_matrix(counts.multiply(1. / depths))
+
+        profiles = self._relative.T.tocsr()
+        norms = np.sqrt(np.asarray(profiles.multiply(profiles)
+                                   .sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        self._unit_profiles = ss.csr_matrix(
+            ss.diags(1. / norms) @ profiles)
+
+        by_feature = self._relative.tocsr()
+        by_feature.sort_indices()
+        starts, stops = by_feature.indptr[:-1], by_feature.indptr[1:]
+        self._sorted_values = [np.sort(by_feature.data[lo:hi])
+                               for lo, hi in zip(starts, stops)]
+
+        self._alpha = None if alpha is None else np.sort(
+            alpha.dropna().values)
+
+        self._latencies = {}
+        self._latency_lock = threading.Lock()
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, _Handler)
+
+    def record(self, op, seconds):
+        with self._latency_lock:
+            self._latencies.setdefault(op, []).append(seconds)
+
+    def stats(self):
+        with self._latency_lock:
+            latencies = {op: np.array(v) for op, v in
+                         self._latencies.items()}
+        return {op: {'count': len(v),
+                     'mean_ms': 1000 * v.mean(),
+                     'p50_ms': 1000 * np.percentile(v, 50),
+                     'p99_ms': 1000 * np.percentile(v, 99)}
+                for op, v in latencies.items()}
+
+    def fetch(self, sample):
+        col = self._relative[:, self._sample_index[sample]]
+        return {self.feature_ids[i]: float(v)
+                for i, v in zip(col.indices, col.data)}
+
+    def percentile(self, request):
+        value = request['value'] if 'value' in request else request['alpha']
+        if 'feature' in request:
+            values = self._sorted_values[
+                self._feature_index[request['feature']]]
+            n_zero = len(self.sample_ids) - len(values)
+            below = np.searchsorted(values, value, side='left')
+            below += n_zero if value > 0 else 0
+            return 100. * below / len(self.sample_ids)
+        if self._alpha is None:
+            raise ValueError("The server was not given alpha diversity.")
+        below = np.searchsorted(self._alpha, value, side='left')
+        return 100. * below / len(self._alpha)
+
+    def neighbor_query(self, request):
+        """Validate a neighbor request
+
+        Returns
+        -------
+        tuple
+            The feature indices and values of the unit query vector, the
+            number of neighbors and the index of the query sample, or None
+            for a vector.
+
+        Raises
+        ------
+        KeyError
+            If the sample is not in the reference.
+        ValueError
+            If k is not a positive integer or the vector is not a mapping of
+            feature IDs to nonnegative abundances.
+        """
+        k = request.get('k', 10)
+        if isinstance(k, bool) or not isinstance(k, int) or k < 1:
+            raise ValueError("k must be a positive integer, not %r." % (k, ))
+
+        if 'sample' in request:
+            position = self._sample_index[request['sample']]
+            vector = self._unit_profiles[position]
+            return vector.indices, vector.data, k, position
+
+        vector = request['vector']
+        if not isinstance(vector, dict):
+            raise ValueError("A vector must map feature IDs to abundances.")
+        known = [(self._feature_index[f], v) for f, v in vector.items()
+                 if f in self._feature_index]
+        try:
+            values = np.array([v for _, v in known], dtype=float)
+        except (TypeError, ValueError):
+            raise ValueError("A vector's abundances must be numbers.")
+        if not np.isfinite(values).all() or (values < 0).any():
+            raise ValueError("A vector's abundances must be finite and "
+                             "nonnegative.")
+        norm = np.sqrt((values ** 2).sum()) or 1.
+        return (np.array([f for f, _ in known], dtype=int), values / norm,
+                k, None)
+
+    def neighbors(self, queries):
+        """Answer a batch of validated neighbor queries with one product
+
+        Parameters
+        ----------
+        queries : list of tuple
+            Queries as returned by ``neighbor_query``.
+
+        Returns
+        -------
+        list
+            The neighbors of each query as [sample ID, cosine similarity]
+            pairs, most similar first.
+        """
+        rows = [np.full(len(cols), i)
+                for i, (cols, _, _, _) in enumerate(queries)]
+        matrix = ss.csr_matrix(
+            (np.concatenate([data for _, data, _, _ in queries]),
+             (np.concatenate(rows),
+              np.concatenate([cols for cols, _, _, _ in queries]))),
+            shape=(len(queries), len(self.feature_ids)))
+        similarity = (matrix @ self._unit_profiles.T).toarray()
+
+        answers = []
+        for i, (_, _, k, position) in enumerate(queries):
+            candidates = len(self.sample_ids)
+            if position is not None:
+                # a sample is not its own neighbor
+                similarity[i, position] = -np.inf
+                candidates -= 1
+            k = min(k, candidates)
+            if not k:
+                answers.append([])
+                continue
+            top = np.argpartition(-similarity[i], k - 1)[:k]
+            top = top[np.argsort(-similarity[i, top], kind='mergesort')]
+            answers.append([[self.sample_ids[j], float(similarity[i, j])]
+                            for j in top])
+        return answers
+
+    def answer(self, requests):
+        """Answer a batch of requests
+
+        Every request is validated on its own, so a malformed request is
+        answered with an error without failing the rest of the batch.
+        """
+        responses = [None] * len(requests)
+        queries, neighbors = [], []
+        for i, request in enumerate(requests):
+            start = time.time()
+            try:
+                if not isinstance(request, dict):
+                    raise ValueError("A request must be an object.")
+                op = request['op']
+                if op == 'fetch':
+                    result = self.fetch(request['sample'])
+                elif op == 'percentile':
+                    result = self.percentile(request)
+                elif op == 'stats':
+                    result = self.stats()
+                elif op == 'neighbors':
+                    queries.append(self.neighbor_query(request))
+                    neighbors.append((i, time.time() - start))
+                    continue
+                else:
+                    raise ValueError("Unknown op %r." % (op, ))
+                responses[i] = {'result': result}
+            except (KeyError, ValueError, TypeError) as e:
+                op = 'error'
+                responses[i] = {'error': '%s: %s' % (type(e).__name__, e)}
+            elapsed = time.time() - start
+            responses[i]['latency_ms'] = 1000 * elapsed
+            self.record(op, elapsed)
+
+        if neighbors:
+            start = time.time()
+            results = self.neighbors(queries)
+            # the batch is answered at once, so its cost is shared
+            shared = (time.time() - start) / len(neighbors)
+            for (i, validation), result in zip(neighbors, results):
+                responses[i] = {'result': result,
+                                'latency_ms': 1000 * (validation + shared)}
+                self.record('neighbors', validation + shared)
+        return responses
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            start = time.time()
+            try:
+                requests = json.loads(line.decode('utf8'))['requests']
+                message = {'responses': self.server.answer(requests)}
+            except (ValueError, KeyError, TypeError) as e:
+                message = {'error': 'Malformed message: %s' % e}
+            message['latency_ms'] = 1000 * (time.time() - start)
+            self.wfile.write(json.dumps(message).encode('utf8') + b'\n')
+            self.wfile.flush()
+
+
+class ReferenceClient:
+    """A connection to a ``ReferenceServer``
+
+    Parameters
+    ----------
+    socket_path : str
+        The server's Unix socket.
+    """
+    def __init__(self, socket_path):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(socket_path)
+        self._file = self._socket.makefile('rwb')
+
+    def query(self, requests):
+        """Send a batch of requests and wait for the responses"""
+        self._file.write(json.dumps({'requests': requests}).encode('utf8') +
+                         b'\n')
+        self._file.flush()
+        return json.loads(self._file.readline().decode('utf8'))
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Serve queries against an AG reference table.')
+    parser.add_argument('--table', required=True,
+                        help='A .biom file or FeatureTable .qza.')
+    parser.add_argument('--alpha', help=('A TSV of the alpha diversity of '
+                                         'the reference samples.'))
+    parser.add_argument('--socket', required=True,
+                        help='The Unix socket to listen on.')
+    args = parser.parse_args(argv)
+
+    alpha = None
+    if args.alpha is not None:
+        alpha = pd.read_csv(args.alpha, sep='\t', index_col=0,
+                            dtype=str).iloc[:, 0].astype(float)
+
+    server = ReferenceServer(args.socket, read_table(args.table), alpha)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(args.socket)
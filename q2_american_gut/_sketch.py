@@ -0,0 +1,249 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import h5py
+import numpy as np
+import pandas as pd
+import scipy.sparse as ss
+from q2_types.feature_table import BIOMV210Format
+
+from ._hdf5 import iter_sample_blocks, observation_ids
+
+
+class FeatureSketch:
+    """Mergeable per-feature quantile sketches
+
+    Each feature is summarized by a logarithmically bucketed histogram of its
+    nonzero values, in the style of DDSketch (Masson et al. 2019). A value
+    ``x`` is placed into bucket ``ceil(log(x) / log(gamma))`` where
+    ``gamma = (1 + alpha) / (1 - alpha)``, so any quantile estimated from the
+    sketch is within a relative error of ``alpha`` of the true value. Zeros
+    are not stored, and are instead inferred from the total number of samples
+    observed.
+
+    Sketches built over disjoint sets of samples can be merged by summing
+    bucket counts, without revisiting the underlying tables.
+
+    Parameters
+    ----------
+    feature_ids : iterable of str
+        The features summarized by the sketch.
+    relative_accuracy : float
+        The relative accuracy, ``alpha``, of the quantile estimates.
+    counts : scipy.sparse.csr_matrix, optional
+        Feature by bucket counts.
+    key_min : int, optional
+        The bucket key of the first column of ``counts``.
+    n_samples : int, optional
+        The number of samples summarized.
+    """
+    FORMAT_VERSION = 1
+
+    def __init__(self, feature_ids, relative_accuracy, counts=None,
+                 key_min=0, n_samples=0):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be in (0, 1).")
+
+        self.feature_ids = np.asarray(feature_ids, dtype=object)
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self.gamma)
+        self.n_samples = n_samples
+        self.key_min = key_min
+
+        if counts is None:
+            counts = ss.csr_matrix((len(self.feature_ids), 0), dtype=np.int64)
+        if counts.shape[0] != len(self.feature_ids):
+            raise ValueError("counts and feature_ids disagree in size.")
+        self.counts = counts.tocsr()
+
+    def __eq__(self, other):
+        if not isinstance(other, FeatureSketch):
+            return False
+        if (self.relative_accuracy != other.relative_accuracy or
+                self.n_samples != other.n_samples or
+                not np.array_equal(self.feature_ids, other.feature_ids)):
+            return False
+        a, b = self._realigned(other)
+        return (a != b).nnz == 0
+
+    def update(self, block):
+        """Add a block of samples to the sketch
+
+        Parameters
+        ----------
+        block : scipy.sparse.spmatrix
+            A feature by sample matrix whose rows correspond to
+            ``feature_ids``.
+        """
+        block = ss.coo_matrix(block)
+        keep = block.data > 0
+        if (block.data < 0).any():
+            raise ValueError("Negative values cannot be sketched.")
+
+        rows = block.row[keep]
+        keys = np.ceil(np.log(block.data[keep]) /
+                       self._log_gamma).astype(np.int64)
+        self.n_samples += block.shape[1]
+
+        if not len(keys):
+            return
+
+        lo = min(keys.min(), self.key_min) if self.counts.shape[1] \
+            else keys.min()
+        hi = max(keys.max() + 1, self.key_min + self.counts.shape[1])
+        new = ss.csr_matrix((np.ones(len(keys), dtype=np.int64),
+                             (rows, keys - lo)),
+                            shape=(len(self.feature_ids), hi - lo))
+        self.counts = self._shifted(lo, hi) + new
+        self.key_min = lo
+
+    def _shifted(self, lo, hi):
+        """The counts expressed over the key range [lo, hi)"""
+        coo = self.counts.tocoo()
+        cols = coo.col + self.key_min - lo
+        return ss.csr_matrix((coo.data, (coo.row, cols)),
+                             shape=(len(self.feature_ids), hi - lo))
+
+    def _realigned(self, other):
+        lo = min(self.key_min, other.key_min)
+        hi = max(self.key_min + self.counts.shape[1],
+                 other.key_min + other.counts.shape[1])
+        return self._shifted(lo, hi), other._shifted(lo, hi)
+
+    def merge(self, other):
+        """Combine with a sketch summarizing a disjoint set of samples
+
+        Parameters
+        ----------
+        other : FeatureSketch
+            The sketch to merge. Features need not match; a feature missing
+            from one sketch is treated as absent from all of its samples.
+
+        Returns
+        -------
+        FeatureSketch
+            A new sketch summarizing the samples of both.
+        """
+        if self.relative_accuracy != other.relative_accuracy:
+            raise ValueError("Sketches with different relative accuracies "
+                             "cannot be merged.")
+
+        features = pd.Index(self.feature_ids).union(
+            pd.Index(other.feature_ids))
+
+        lo = min(self.key_min, other.key_min)
+        hi = max(self.key_min + self.counts.shape[1],
+                 other.key_min + other.counts.shape[1])
+
+        merged = ss.csr_matrix((len(features), hi - lo), dtype=np.int64)
+        for sketch in (self, other):
+            coo = sketch._shifted(lo, hi).tocoo()
+            rows = features.get_indexer(sketch.feature_ids)[coo.row]
+            merged = merged + ss.csr_matrix((coo.data, (rows, coo.col)),
+                                            shape=merged.shape)
+
+        return FeatureSketch(np.asarray(features, dtype=object),
+                             self.relative_accuracy, merged, lo,
+                             self.n_samples + other.n_samples)
+
+    def quantiles(self, qs):
+        """Estimate per-feature quantiles
+
+        Parameters
+        ----------
+        qs : iterable of float
+            The quantiles to estimate, each within [0, 1].
+
+        Returns
+        -------
+        pd.DataFrame
+            Features by quantiles.
+        """
+        qs = np.asarray(qs, dtype=float)
+        if ((qs < 0) | (qs > 1)).any():
+            raise ValueError("Quantiles must be within [0, 1].")
+
+        counts = self.counts.copy()
+        counts.sort_indices()
+        nonzero = np.asarray(counts.sum(axis=1)).ravel()
+        zeros = self.n_samples - nonzero
+
+        # a global running count is monotonic across rows, so the bucket
+        # holding each rank can be located with a single search
+        cumulative = np.cumsum(counts.data)
+        row_base = np.concatenate([[0], cumulative])[counts.indptr[:-1]]
+
+        result = np.zeros((len(self.feature_ids), len(qs)))
+        for j, q in enumerate(qs):
+            rank = np.floor(q * (self.n_samples - 1))
+            in_buckets = rank >= zeros
+            target = row_base + (rank - zeros)
+            pos = np.searchsorted(cumulative, target[in_buckets],
+                                  side='right')
+            keys = counts.indices[pos] + self.key_min
+            result[in_buckets, j] = (2 * self.gamma ** keys /
+                                     (self.gamma + 1))
+
+        return pd.DataFrame(result, index=pd.Index(self.feature_ids,
+                                                   name='feature-id'),
+                            columns=['q%s' % q for q in qs])
+
+    def to_hdf5(self, h5grp):
+        h5grp.attrs['format-version'] = self.FORMAT_VERSION
+        h5grp.attrs['relative-accuracy'] = self.relative_accuracy
+        h5grp.attrs['key-min'] = self.key_min
+        h5grp.attrs['n-samples'] = self.n_samples
+        h5grp.attrs['n-keys'] = self.counts.shape[1]
+        h5grp.create_dataset('feature-ids',
+                             data=[i.encode('utf8') for i in self.feature_ids],
+                             dtype=h5py.special_dtype(vlen=str))
+        for name in ('data', 'indices', 'indptr'):
+            h5grp.create_dataset(name, data=getattr(self.counts, name),
+                                 compression='gzip')
+
+    @classmethod
+    def from_hdf5(cls, h5grp):
+        ids = [i.decode('utf8') if isinstance(i, bytes) else i
+               for i in h5grp['feature-ids'][:]]
+        counts = ss.csr_matrix((h5grp['data'][:], h5grp['indices'][:],
+                                h5grp['indptr'][:]),
+                               shape=(len(ids), int(h5grp.attrs['n-keys'])))
+        return cls(ids, float(h5grp.attrs['relative-accuracy']), counts,
+                   int(h5grp.attrs['key-min']),
+                   int(h5grp.attrs['n-samples']))
+
+
+def sketch_quantiles(table: BIOMV210Format, relative_accuracy: float = 0.01,
+                     relative_frequency: bool = True,
+                     block_size: int = 1000) -> FeatureSketch:
+    with h5py.File(str(table), 'r') as h5:
+        sketch = FeatureSketch(observation_ids(h5), relative_accuracy)
+        for _, block in iter_sample_blocks(h5, block_size):
+            if relative_frequency:
+                depths = np.asarray(block.sum(axis=0)).ravel()
+                depths[depths == 0] = 1
+                block = block.multiply(1. / depths).tocsc()
+            sketch.update(block)
+    return sketch
+
+
+def merge_sketches(sketches: FeatureSketch) -> FeatureSketch:
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged = merged.merge(sketch)
+    return merged
+
+
+def summarize_sketch(sketch: FeatureSketch,
+                     quantiles: list = None) -> pd.DataFrame:
+    if quantiles is None:
+        quantiles = [0.25, 0.5, 0.75]
+    summary = sketch.quantiles(quantiles)
+    nonzero = np.asarray(sketch.counts.sum(axis=1)).ravel()
+    summary.insert(0, 'prevalence', nonzero / max(sketch.n_samples, 1))
+    return summary
@@ -0,0 +1,144 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import collections
+
+import biom
+import numpy as np
+import pandas as pd
+import qiime2
+import scipy.sparse as ss
+
+from ._decontam import score_contaminants
+from ._parallel import imap_shared, get_shared
+from ._qc import qc_gate
+
+
+STEPS = ('qc-gate', 'remove-contaminants', 'rarefy')
+
+
+class StratifiedTables:
+    """Feature tables keyed by the stratum of their samples
+
+    Parameters
+    ----------
+    tables : mapping of str to biom.Table
+        The table of each stratum, in order.
+    """
+    def __init__(self, tables):
+        self.tables = collections.OrderedDict(tables)
+
+    def __len__(self):
+        return len(self.tables)
+
+    def __iter__(self):
+        return iter(self.tables.items())
+
+    def __getitem__(self, stratum):
+        return self.tables[stratum]
+
+    def summary(self):
+        """The number of samples and features of each stratum"""
+        return pd.DataFrame(
+            [(len(t.ids(axis='sample')), len(t.ids(axis='observation')))
+             for t in self.tables.values()],
+            index=pd.Index(list(self.tables), name='stratum'),
+            columns=['n-samples', 'n-features'])
+
+    def merge(self):
+        """One table of every stratum's samples"""
+        tables = [t for t in self.tables.values() if not t.is_empty()]
+        if not tables:
+            raise ValueError("Every stratum is empty.")
+        return tables[0].concat(tables[1:], axis='sample')
+
+
+def _process_stratum(stratum):
+    name, start, stop = stratum
+    shared = get_shared()
+    matrix = shared['matrix']
+
+    # samples were grouped by stratum once up front, so each stratum is a
+    # contiguous run of columns and is sliced without copying its counts
+    lo, hi = matrix.indptr[start], matrix.indptr[stop]
+    block = ss.csc_matrix((matrix.data[lo:hi], matrix.indices[lo:hi],
+                           matrix.indptr[start:stop + 1] - lo),
+                          shape=(matrix.shape[0], stop - start), copy=False)
+    table = biom.Table(block, shared['feature_ids'],
+                       shared['sample_ids'][start:stop])
+    table = table.remove_empty(axis='observation', inplace=False)
+
+    for step in shared['steps']:
+        if table.is_empty():
+            break
+        if step == 'qc-gate':
+            try:
+                table, _ = qc_gate(table, min_depth=shared['min_depth'])
+            except ValueError:
+                # no sample of the stratum passed
+                table = table.filter([], inplace=False)
+        elif step == 'remove-contaminants':
+            table, _ = score_contaminants(table, **shared['contaminants'])
+        elif step == 'rarefy':
+            depth = shared['sampling_depth']
+            deep = table.ids(axis='sample')[table.sum(axis='sample') >=
+                                            depth]
+            table = table.filter(deep, inplace=False)
+            if not table.is_empty():
+                table = table.subsample(depth, axis='sample',
+                                        seed=shared['random_seed'])
+        table = table.remove_empty(axis='observation', inplace=False)
+    return name, table
+
+
+def stratify(table: biom.Table, metadata: qiime2.Metadata, column: str,
+             steps: list = None, min_depth: int = 1000,
+             sampling_depth: int = 1000, control_column: str = None,
+             concentration_column: str = None, plate_column: str = None,
+             random_seed: int = 0,
+             n_jobs: int = 1) -> (StratifiedTables, biom.Table):
+    steps = [] if steps is None else list(steps)
+    unknown = set(steps) - set(STEPS)
+    if unknown:
+        raise ValueError("Unknown steps: %s" % ', '.join(sorted(unknown)))
+    if ('remove-contaminants' in steps and control_column is None and
+            concentration_column is None):
+        raise ValueError("remove-contaminants requires a control or "
+                         "concentration column.")
+
+    sample_ids = table.ids(axis='sample')
+    md = metadata.to_dataframe().reindex(sample_ids)
+    if column not in md.columns:
+        raise ValueError("%r is not a metadata column." % column)
+    strata = md[column].astype(str).where(md[column].notnull())
+    if strata.isnull().all():
+        raise ValueError("No sample of the table has a value for %r."
+                         % column)
+
+    # one stable sort groups each stratum's samples into a contiguous run
+    codes, names = pd.factorize(strata, sort=True)
+    order = np.argsort(codes, kind='mergesort')
+    order = order[codes[order] >= 0]
+    bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+    matrix = ss.csc_matrix(table.matrix_data)[:, order]
+
+    shared = {
+        'matrix': matrix, 'sample_ids': sample_ids[order],
+        'feature_ids': table.ids(axis='observation'), 'steps': steps,
+        'min_depth': min_depth, 'sampling_depth': sampling_depth,
+        'random_seed': random_seed,
+        'contaminants': {'metadata': metadata,
+                         'control_column': control_column,
+                         'concentration_column': concentration_column,
+                         'plate_column': plate_column},
+    }
+    items = [(name, bounds[i], bounds[i + 1])
+             for i, name in enumerate(names)]
+    tables = dict(imap_shared(_process_stratum, items, shared,
+                              n_jobs=n_jobs))
+    stratified = StratifiedTables((name, tables[name]) for name in names)
+    return stratified, stratified.merge()
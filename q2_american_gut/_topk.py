@@ -0,0 +1,106 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import biom
+import numpy as np
+import pandas as pd
+import scipy.sparse as ss
+
+
+# the number of padded cells selected over at once
+_BATCH_CELLS = 2 ** 22
+
+
+def column_top_k(matrix, k):
+    """The k largest nonzero values of every column of a sparse matrix
+
+    Parameters
+    ----------
+    matrix : scipy.sparse matrix
+        A features by samples matrix.
+    k : int
+        The number of values to select per column.
+
+    Returns
+    -------
+    columns, rows, ranks : np.ndarray
+        The column, row and one-based rank of each selected value, ordered
+        by column and then rank.
+    values : np.ndarray
+        The selected values.
+
+    Notes
+    -----
+    The nonzero values of a batch of columns are packed into a dense array
+    padded with -inf, one row per column, so that a single
+    ``np.argpartition`` selects the top k of every column and only those k
+    are sorted. Columns with fewer than k nonzero values yield them all.
+    """
+    if k < 1:
+        raise ValueError("k must be positive.")
+    matrix = ss.csc_matrix(matrix)
+    matrix.sort_indices()
+    lengths = np.diff(matrix.indptr)
+    n_cols = matrix.shape[1]
+
+    results = []
+    start = 0
+    while start < n_cols:
+        # batches are sized by the longest column they hold
+        stop = start + 1
+        width = lengths[start]
+        while stop < n_cols:
+            longest = max(width, lengths[stop])
+            if longest * (stop - start + 1) > _BATCH_CELLS:
+                break
+            width = longest
+            stop += 1
+        results.append(_batch_top_k(matrix, start, stop, max(width, 1), k))
+        start = stop
+
+    if not results:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, empty, np.array([], dtype=matrix.dtype)
+    return tuple(np.concatenate(parts) for parts in zip(*results))
+
+
+def _batch_top_k(matrix, start, stop, width, k):
+    lo, hi = matrix.indptr[start], matrix.indptr[stop]
+    lengths = np.diff(matrix.indptr[start:stop + 1])
+    cols = np.repeat(np.arange(stop - start), lengths)
+    starts = np.repeat(matrix.indptr[start:stop] - lo, lengths)
+    offsets = np.arange(hi - lo) - starts
+
+    padded = np.full((stop - start, width), -np.inf)
+    padded[cols, offsets] = matrix.data[lo:hi]
+
+    k = min(k, width)
+    top = np.argpartition(-padded, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(padded, top, axis=1), axis=1,
+                       kind='mergesort')
+    top = np.take_along_axis(top, order, axis=1)
+
+    present = top < lengths[:, None]
+    cols, ranks = np.nonzero(present)
+    offsets = top[present]
+    positions = matrix.indptr[start:stop][cols] + offsets
+    return (cols + start, matrix.indices[positions], ranks + 1,
+            matrix.data[positions])
+
+
+def top_features(table: biom.Table, k: int = 10,
+                 relative_frequency: bool = True) -> pd.DataFrame:
+    if relative_frequency:
+        table = table.norm(axis='sample', inplace=False)
+    cols, rows, ranks, values = column_top_k(table.matrix_data, k)
+
+    sample_ids = np.asarray(table.ids(axis='sample'), dtype=object)
+    feature_ids = np.asarray(table.ids(axis='observation'), dtype=object)
+    return pd.DataFrame({'rank': ranks, 'feature-id': feature_ids[rows],
+                         'abundance': values},
+                        index=pd.Index(sample_ids[cols], name='sample-id'),
+                        columns=['rank', 'feature-id', 'abundance'])
@@ -0,0 +1,148 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+
+import biom
+import numpy as np
+import pandas as pd
+import qiime2
+import scipy.sparse as ss
+
+
+class SparseTrainingSet:
+    """A samples by features matrix aligned with a prediction target
+
+    Parameters
+    ----------
+    X : scipy.sparse.csr_matrix
+        The float32 samples by features matrix.
+    y : np.ndarray
+        The target of each sample. Numeric targets are floats, and
+        categorical targets are integer codes into ``classes``.
+    sample_ids, feature_ids : iterable of str
+        The rows and columns of ``X``.
+    classes : iterable of str, optional
+        The categories of a categorical target.
+    """
+    _ARRAYS = ('data', 'indices', 'indptr')
+
+    def __init__(self, X, y, sample_ids, feature_ids, classes=None):
+        self.X = X
+        self.y = y
+        self.sample_ids = list(sample_ids)
+        self.feature_ids = list(feature_ids)
+        self.classes = None if classes is None else list(classes)
+        if X.shape != (len(self.sample_ids), len(self.feature_ids)):
+            raise ValueError("X is %r, but there are %d samples and %d "
+                             "features." % (X.shape, len(self.sample_ids),
+                                            len(self.feature_ids)))
+        if len(y) != len(self.sample_ids):
+            raise ValueError("y and X disagree in length.")
+
+    @property
+    def is_categorical(self):
+        return self.classes is not None
+
+    def save(self, path):
+        """Write to a directory of .npy arrays and ID lists"""
+        for name in self._ARRAYS:
+            np.save(os.path.join(path, '%s.npy' % name),
+                    getattr(self.X, name))
+        np.save(os.path.join(path, 'target.npy'), self.y)
+        for name, ids in (('samples', self.sample_ids),
+                          ('features', self.feature_ids),
+                          ('classes', self.classes)):
+            if ids is None:
+                continue
+            with open(os.path.join(path, '%s.txt' % name), 'w') as fh:
+                fh.write(''.join('%s\n' % i for i in ids))
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Read from a directory written by ``save``
+
+        The arrays are memory mapped by default, so a training job pays
+        only for the pages it touches.
+        """
+        def ids(name):
+            fp = os.path.join(path, '%s.txt' % name)
+            if not os.path.exists(fp):
+                return None
+            with open(fp) as fh:
+                return [line.rstrip('\n') for line in fh]
+
+        samples, features = ids('samples'), ids('features')
+        data, indices, indptr = [
+            np.load(os.path.join(path, '%s.npy' % name), mmap_mode=mmap_mode)
+            for name in cls._ARRAYS]
+        X = ss.csr_matrix((data, indices, indptr),
+                          shape=(len(samples), len(features)), copy=False)
+        y = np.load(os.path.join(path, 'target.npy'), mmap_mode=mmap_mode)
+        return cls(X, y, samples, features, ids('classes'))
+
+
+def build_training_set(table, target, feature_ids=None):
+    """Convert a table and target into a training set in one pass
+
+    Parameters
+    ----------
+    table : biom.Table
+        The feature table.
+    target : pd.Series
+        The target of each sample. Samples missing a target are excluded.
+    feature_ids : iterable of str, optional
+        A fixed feature ordering, such as that of a previous training set.
+        Features absent from the table are zero and features absent from
+        the ordering are dropped.
+
+    Returns
+    -------
+    SparseTrainingSet
+    """
+    target = target.dropna()
+    target = target[target.index.isin(table.ids(axis='sample'))]
+    if not len(target):
+        raise ValueError("No sample of the table has a target value.")
+
+    matrix = table.matrix_data
+    table_features = table.ids(axis='observation')
+    if feature_ids is None:
+        feature_ids = table_features
+    else:
+        # reordering the rows is a product with a sparse selection matrix,
+        # which also inserts empty rows for features the table lacks
+        feature_ids = list(feature_ids)
+        rows = pd.Index(table_features).get_indexer(feature_ids)
+        present = np.flatnonzero(rows >= 0)
+        selection = ss.csr_matrix(
+            (np.ones(len(present)), (present, rows[present])),
+            shape=(len(feature_ids), len(table_features)))
+        matrix = selection @ matrix
+
+    # the features by samples CSC matrix is, read the other way, the
+    # samples by features CSR matrix, so the transpose costs nothing
+    columns = pd.Index(table.ids(axis='sample')).get_indexer(target.index)
+    csc = ss.csc_matrix(matrix)[:, columns]
+    X = ss.csr_matrix((csc.data.astype(np.float32, copy=False),
+                       csc.indices, csc.indptr),
+                      shape=(len(columns), len(feature_ids)), copy=False)
+
+    classes = None
+    if pd.api.types.is_numeric_dtype(target):
+        y = target.values.astype(float)
+    else:
+        categorical = pd.Categorical(target.values)
+        y, classes = categorical.codes.astype(np.int64), \
+            list(categorical.categories)
+    return SparseTrainingSet(X, y, target.index, feature_ids, classes)
+
+
+def training_set(table: biom.Table, target: qiime2.MetadataColumn,
+                 reference: SparseTrainingSet = None) -> SparseTrainingSet:
+    feature_ids = None if reference is None else reference.feature_ids
+    return build_training_set(table, target.to_series(), feature_ids)
@@ -0,0 +1,330 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+
+import biom
+import h5py
+import numpy as np
+import pandas as pd
+import qiime2
+from q2_types.tree import NewickFormat
+
+from .plugin_setup import plugin
+from ._format import (QuantileSketchFormat, FeatureQuantilesFormat,
+                      SampleIndexDirFmt, RankTestResultsFormat,
+                      PermanovaResultsFormat, TrainingMatrixDirFmt,
+                      TraitPredictionsFormat, CrossValidationReportFormat,
+                      FeatureNetworkFormat, TopFeaturesFormat,
+                      TableFingerprintFormat, ContaminantScoresFormat,
+                      WellLeakageFormat, QCReportFormat,
+                      StratifiedFeatureTablesDirFmt,
+                      ConsecutiveDistancesFormat, HostVolatilityFormat,
+                      BlockDistancesFormat, SimilarSamplePairsFormat,
+                      PackedPresenceFormat)
+from ._blockdist import BlockDistances
+from ._index import SampleArtifactIndex
+from ._packed import PackedPresence
+from ._sketch import FeatureSketch
+from ._stratify import StratifiedTables
+from ._training import SparseTrainingSet
+from ._tree import ArrayTree, read_newick
+
+
+def _df_to_tsv(df, fmt):
+    ff = fmt()
+    df.to_csv(str(ff), sep='\t', header=True, index=True)
+    return ff
+
+
+def _read_tsv(path, dtype=None):
+    # identifiers such as 10317.000012345 must not be parsed as numbers
+    with open(path) as fh:
+        id_header = fh.readline().rstrip('\n').split('\t')[0]
+    dtype = dict(dtype or {})
+    dtype[id_header] = str
+    return pd.read_csv(path, sep='\t', header=0, index_col=0, dtype=dtype)
+
+
+def _tsv_to_df(ff):
+    return _read_tsv(str(ff))
+
+
+@plugin.register_transformer
+def _1(data: FeatureSketch) -> QuantileSketchFormat:
+    ff = QuantileSketchFormat()
+    with h5py.File(str(ff), 'w') as h5:
+        data.to_hdf5(h5)
+    return ff
+
+
+@plugin.register_transformer
+def _2(ff: QuantileSketchFormat) -> FeatureSketch:
+    with h5py.File(str(ff), 'r') as h5:
+        return FeatureSketch.from_hdf5(h5)
+
+
+@plugin.register_transformer
+def _3(data: pd.DataFrame) -> FeatureQuantilesFormat:
+    return _df_to_tsv(data, FeatureQuantilesFormat)
+
+
+@plugin.register_transformer
+def _4(ff: FeatureQuantilesFormat) -> pd.DataFrame:
+    return _tsv_to_df(ff)
+
+
+@plugin.register_transformer
+def _5(ff: FeatureQuantilesFormat) -> qiime2.Metadata:
+    return qiime2.Metadata(_tsv_to_df(ff))
+
+
+@plugin.register_transformer
+def _6(data: SampleArtifactIndex) -> SampleIndexDirFmt:
+    ff = SampleIndexDirFmt()
+    data.samples.to_csv(os.path.join(str(ff), 'samples.tsv'), sep='\t')
+    data.artifacts.to_csv(os.path.join(str(ff), 'artifacts.tsv'), sep='\t')
+    return ff
+
+
+@plugin.register_transformer
+def _7(ff: SampleIndexDirFmt) -> SampleArtifactIndex:
+    samples = _read_tsv(os.path.join(str(ff), 'samples.tsv'),
+                        {'artifact-uuid': str, 'column': np.int64})
+    artifacts = _read_tsv(os.path.join(str(ff), 'artifacts.tsv'),
+                          {'path': str, 'n-samples': np.int64, 'type': str,
+                           'offset': np.int64, 'size': np.int64})
+    return SampleArtifactIndex(samples, artifacts)
+
+
+@plugin.register_transformer
+def _8(data: pd.DataFrame) -> RankTestResultsFormat:
+    return _df_to_tsv(data, RankTestResultsFormat)
+
+
+@plugin.register_transformer
+def _9(ff: RankTestResultsFormat) -> pd.DataFrame:
+    return _read_tsv(str(ff), {'variable': str})
+
+
+@plugin.register_transformer
+def _10(data: pd.DataFrame) -> PermanovaResultsFormat:
+    return _df_to_tsv(data, PermanovaResultsFormat)
+
+
+@plugin.register_transformer
+def _11(ff: PermanovaResultsFormat) -> pd.DataFrame:
+    return _read_tsv(str(ff))
+
+
+@plugin.register_transformer
+def _12(data: SparseTrainingSet) -> TrainingMatrixDirFmt:
+    ff = TrainingMatrixDirFmt()
+    data.save(str(ff))
+    return ff
+
+
+@plugin.register_transformer
+def _13(ff: TrainingMatrixDirFmt) -> SparseTrainingSet:
+    return SparseTrainingSet.load(str(ff))
+
+
+@plugin.register_transformer
+def _14(data: pd.DataFrame) -> TraitPredictionsFormat:
+    return _df_to_tsv(data, TraitPredictionsFormat)
+
+
+@plugin.register_transformer
+def _15(ff: TraitPredictionsFormat) -> pd.DataFrame:
+    return _read_tsv(str(ff))
+
+
+@plugin.register_transformer
+def _16(ff: TraitPredictionsFormat) -> qiime2.Metadata:
+    return qiime2.Metadata(_read_tsv(str(ff)))
+
+
+@plugin.register_transformer
+def _17(data: pd.DataFrame) -> CrossValidationReportFormat:
+    return _df_to_tsv(data, CrossValidationReportFormat)
+
+
+@plugin.register_transformer
+def _18(ff: CrossValidationReportFormat) -> pd.DataFrame:
+    return _read_tsv(str(ff))
+
+
+@plugin.register_transformer
+def _19(data: pd.DataFrame) -> FeatureNetworkFormat:
+    return _df_to_tsv(data, FeatureNetworkFormat)
+
+
+@plugin.register_transformer
+def _20(ff: FeatureNetworkFormat) -> pd.DataFrame:
+    return _read_tsv(str(ff), {'feature-b': str})
+
+
+@plugin.register_transformer
+def _21(data: pd.DataFrame) -> TopFeaturesFormat:
+    return _df_to_tsv(data, TopFeaturesFormat)
+
+
+@plugin.register_transformer
+def _22(ff: TopFeaturesFormat) -> pd.DataFrame:
+    return _read_tsv(str(ff), {'feature-id': str})
+
+
+@plugin.register_transformer
+def _23(data: pd.DataFrame) -> TableFingerprintFormat:
+    return _df_to_tsv(data, TableFingerprintFormat)
+
+
+@plugin.register_transformer
+def _24(ff: TableFingerprintFormat) -> pd.DataFrame:
+    return _read_tsv(str(ff), {'value': str})
+
+
+@plugin.register_transformer
+def _25(data: pd.DataFrame) -> ContaminantScoresFormat:
+    return _df_to_tsv(data, ContaminantScoresFormat)
+
+
+@plugin.register_transformer
+def _26(ff: ContaminantScoresFormat) -> pd.DataFrame:
+    return _read_tsv(str(ff))
+
+
+@plugin.register_transformer
+def _27(ff: ContaminantScoresFormat) -> qiime2.Metadata:
+    return qiime2.Metadata(_read_tsv(str(ff), {'contaminant': str}))
+
+
+@plugin.register_transformer
+def _28(data: pd.DataFrame) -> WellLeakageFormat:
+    return _df_to_tsv(data, WellLeakageFormat)
+
+
+@plugin.register_transformer
+def _29(ff: WellLeakageFormat) -> pd.DataFrame:
+    return _read_tsv(str(ff), {'plate': str, 'well': str})
+
+
+@plugin.register_transformer
+def _30(ff: WellLeakageFormat) -> qiime2.Metadata:
+    return qiime2.Metadata(_read_tsv(str(ff), {'plate': str, 'well': str,
+                                               'flagged': str}))
+
+
+@plugin.register_transformer
+def _31(data: pd.DataFrame) -> QCReportFormat:
+    return _df_to_tsv(data, QCReportFormat)
+
+
+@plugin.register_transformer
+def _32(ff: QCReportFormat) -> pd.DataFrame:
+    return _read_tsv(str(ff))
+
+
+@plugin.register_transformer
+def _33(ff: QCReportFormat) -> qiime2.Metadata:
+    return qiime2.Metadata(_read_tsv(str(ff), {'passed': str}))
+
+
+@plugin.register_transformer
+def _34(data: StratifiedTables) -> StratifiedFeatureTablesDirFmt:
+    ff = StratifiedFeatureTablesDirFmt()
+    strata = data.summary()
+    strata.insert(0, 'file', ['table-%d.biom' % i for i in range(len(data))])
+    for (_, table), path in zip(data, strata['file']):
+        with h5py.File(os.path.join(str(ff), path), 'w') as h5:
+            table.to_hdf5(h5, 'q2-american-gut')
+    strata.to_csv(os.path.join(str(ff), 'strata.tsv'), sep='\t')
+    return ff
+
+
+@plugin.register_transformer
+def _35(ff: StratifiedFeatureTablesDirFmt) -> StratifiedTables:
+    strata = _read_tsv(os.path.join(str(ff), 'strata.tsv'), {'file': str})
+    return StratifiedTables(
+        (stratum, biom.load_table(os.path.join(str(ff), path)))
+        for stratum, path in strata['file'].items())
+
+
+@plugin.register_transformer
+def _36(data: pd.DataFrame) -> ConsecutiveDistancesFormat:
+    return _df_to_tsv(data, ConsecutiveDistancesFormat)
+
+
+@plugin.register_transformer
+def _37(ff: ConsecutiveDistancesFormat) -> pd.DataFrame:
+    return _read_tsv(str(ff), {'sample-a': str, 'sample-b': str})
+
+
+@plugin.register_transformer
+def _38(data: pd.DataFrame) -> HostVolatilityFormat:
+    return _df_to_tsv(data, HostVolatilityFormat)
+
+
+@plugin.register_transformer
+def _39(ff: HostVolatilityFormat) -> pd.DataFrame:
+    return _read_tsv(str(ff))
+
+
+@plugin.register_transformer
+def _40(ff: HostVolatilityFormat) -> qiime2.Metadata:
+    # 'host' is not among the ID headers metadata accepts
+    volatility = _read_tsv(str(ff))
+    volatility.index.name = 'id'
+    return qiime2.Metadata(volatility)
+
+
+@plugin.register_transformer
+def _41(data: BlockDistances) -> BlockDistancesFormat:
+    ff = BlockDistancesFormat()
+    with h5py.File(str(ff), 'w') as h5:
+        data.to_hdf5(h5)
+    return ff
+
+
+@plugin.register_transformer
+def _42(ff: BlockDistancesFormat) -> BlockDistances:
+    with h5py.File(str(ff), 'r') as h5:
+        return BlockDistances.from_hdf5(h5)
+
+
+@plugin.register_transformer
+def _43(data: pd.DataFrame) -> SimilarSamplePairsFormat:
+    return _df_to_tsv(data, SimilarSamplePairsFormat)
+
+
+@plugin.register_transformer
+def _44(ff: SimilarSamplePairsFormat) -> pd.DataFrame:
+    return _read_tsv(str(ff), {'sample-b': str})
+
+
+@plugin.register_transformer
+def _45(data: PackedPresence) -> PackedPresenceFormat:
+    ff = PackedPresenceFormat()
+    with h5py.File(str(ff), 'w') as h5:
+        data.to_hdf5(h5)
+    return ff
+
+
+@plugin.register_transformer
+def _46(ff: PackedPresenceFormat) -> PackedPresence:
+    with h5py.File(str(ff), 'r') as h5:
+        return PackedPresence.from_hdf5(h5)
+
+
+@plugin.register_transformer
+def _47(data: biom.Table) -> PackedPresence:
+    return PackedPresence.from_table(data)
+
+
+@plugin.register_transformer
+def _48(ff: NewickFormat) -> ArrayTree:
+    return read_newick(str(ff))
@@ -0,0 +1,297 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import collections
+import io
+import os
+import tempfile
+import uuid as _uuid
+import zipfile
+
+import biom
+import numpy as np
+import skbio
+
+from ._index import artifact_uuid
+
+
+_NEWICK_MEMBER = '%s/data/tree.nwk'
+
+# trees already loaded by this process, keyed by artifact UUID, with the
+# least recently used dropped once there are more than _MAX_TREES
+_TREES = collections.OrderedDict()
+_MAX_TREES = 4
+
+
+class ArrayTree:
+    """A rooted tree as arrays over its nodes in postorder
+
+    Every node follows its descendants, so the root is last and a node's
+    parent always has a larger index.
+
+    Parameters
+    ----------
+    parent : np.ndarray of int
+        The index of each node's parent, -1 for the root.
+    length : np.ndarray of float
+        The length of the branch above each node, zero where absent.
+    names : np.ndarray of object
+        The name of each node, None where absent.
+    """
+    def __init__(self, parent, length, names):
+        self.parent = np.asarray(parent, dtype=np.int64)
+        self.length = np.asarray(length, dtype=float)
+        self.names = np.asarray(names, dtype=object)
+        if not (len(self.parent) == len(self.length) == len(self.names)):
+            raise ValueError("parent, length and names disagree in length.")
+        if len(self.parent) and self.parent[-1] != -1:
+            raise ValueError("The last node must be the root.")
+        self.is_tip = np.ones(len(self.parent), dtype=bool)
+        self.is_tip[self.parent[self.parent >= 0]] = False
+        self._tip_index = {n: i for i, n in enumerate(self.names)
+                           if self.is_tip[i] and n is not None}
+
+    def __len__(self):
+        return len(self.parent)
+
+    @classmethod
+    def from_treenode(cls, tree):
+        nodes = list(tree.postorder(include_self=True))
+        position = {id(node): i for i, node in enumerate(nodes)}
+        parent = np.array([-1 if node.parent is None
+                           else position[id(node.parent)]
+                           for node in nodes], dtype=np.int64)
+        length = np.array([0. if node.length is None else node.length
+                           for node in nodes], dtype=float)
+        names = np.array([node.name for node in nodes], dtype=object)
+        return cls(parent, length, names)
+
+    def to_treenode(self):
+        nodes = [skbio.TreeNode(name=name, length=length)
+                 for name, length in zip(self.names, self.length)]
+        children = [[] for _ in nodes]
+        for i, p in enumerate(self.parent):
+            if p >= 0:
+                children[p].append(nodes[i])
+        for node, kids in zip(nodes, children):
+            if kids:
+                node.extend(kids, uncache=False)
+        root = nodes[-1]
+        root.length = None
+        return root
+
+    def tips(self, names):
+        """The indices of the named tips
+
+        Raises
+        ------
+        ValueError
+            If a name is not a tip of the tree.
+        """
+        missing = [n for n in names if n not in self._tip_index]
+        if missing:
+            raise ValueError("%d features are not tips of the tree, "
+                             "including: %s"
+                             % (len(missing), ', '.join(missing[:5])))
+        return np.array([self._tip_index[n] for n in names],
+                        dtype=np.int64)
+
+    def heights(self):
+        """The number of branches on the longest path from each node to a tip
+
+        Each pass settles one more level, so the number of passes is the
+        height of the root.
+        """
+        height = np.zeros(len(self), dtype=np.int64)
+        nonroot = np.flatnonzero(self.parent >= 0)
+        while True:
+            updated = np.zeros_like(height)
+            np.maximum.at(updated, self.parent[nonroot], height[nonroot] + 1)
+            if np.array_equal(updated, height):
+                return height
+            height = updated
+
+    def induced_nodes(self, names):
+        """The nodes on a path from any of the named tips to the root
+
+        The walk up from the tips stops at nodes already reached, so the
+        cost is the size of the induced subtree rather than of the tree.
+
+        Returns
+        -------
+        np.ndarray of int
+            The nodes, in postorder.
+        """
+        reached = np.zeros(len(self), dtype=bool)
+        frontier = np.unique(self.tips(names))
+        while len(frontier):
+            frontier = frontier[~reached[frontier]]
+            reached[frontier] = True
+            frontier = np.unique(self.parent[frontier])
+            frontier = frontier[frontier >= 0]
+        return np.flatnonzero(reached)
+
+    def induced(self, names, collapse=True):
+        """The subtree induced by the named tips
+
+        Parameters
+        ----------
+        names : iterable of str
+            The tips to keep.
+        collapse : bool, optional
+            Whether to remove nodes left with one child, joining the branches
+            above and below them, as ``skbio.TreeNode.shear`` does.
+
+        Returns
+        -------
+        ArrayTree
+        """
+        keep = self.induced_nodes(names)
+        reindex = np.full(len(self), -1, dtype=np.int64)
+        reindex[keep] = np.arange(len(keep))
+        parent = self.parent[keep]
+        parent = np.where(parent >= 0, reindex[parent], -1)
+        length = self.length[keep].copy()
+        names = self.names[keep]
+        if collapse:
+            parent, length, keep = _collapse(parent, length)
+            names = names[keep]
+        return ArrayTree(parent, length, names)
+
+    def save(self, path):
+        """Write to a .npz file"""
+        names = np.array(['' if n is None else n for n in self.names],
+                         dtype=str)
+        np.savez(path, parent=self.parent, length=self.length, names=names,
+                 named=np.array([n is not None for n in self.names]))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            names = npz['names'].astype(object)
+            names[~npz['named']] = None
+            return cls(npz['parent'], npz['length'], names)
+
+
+def _collapse(parent, length):
+    """Remove nodes with exactly one child from a postorder tree"""
+    n = len(parent)
+    n_children = np.bincount(parent[parent >= 0], minlength=n)
+    unary = n_children == 1
+    # nodes are visited from the root down, so every ancestor has already
+    # been attached to its nearest kept ancestor. Below a root with one
+    # child, the first node with other than one child becomes the root.
+    attach = parent.copy()
+    length = length.copy()
+    for i in range(n - 2, -1, -1):
+        p = attach[i]
+        if unary[p]:
+            attach[i] = attach[p]
+            length[i] += length[p]
+
+    keep = np.flatnonzero(~unary)
+    length[keep[attach[keep] < 0]] = 0
+    reindex = np.full(n, -1, dtype=np.int64)
+    reindex[keep] = np.arange(len(keep))
+    attach = attach[keep]
+    return np.where(attach >= 0, reindex[attach], -1), length[keep], keep
+
+
+def _cached(uuid):
+    tree = _TREES.get(uuid)
+    if tree is not None:
+        _TREES.move_to_end(uuid)
+    return tree
+
+
+def _remember(uuid, tree):
+    _TREES[uuid] = tree
+    while len(_TREES) > _MAX_TREES:
+        _TREES.popitem(last=False)
+
+
+def load_tree(path, cache_dir=None):
+    """Load the ArrayTree of a Phylogeny .qza, caching it by artifact UUID
+
+    The tree is parsed from its Newick file only the first time a given
+    artifact is loaded. Later loads in the same process reuse it, and with
+    ``cache_dir`` so do loads in other processes and later runs.
+
+    Parameters
+    ----------
+    path : str
+        A Phylogeny .qza.
+    cache_dir : str, optional
+        A directory of cached trees, created if absent.
+
+    Returns
+    -------
+    ArrayTree
+    """
+    with zipfile.ZipFile(path) as zf:
+        uuid = artifact_uuid(zf)
+        tree = _cached(uuid)
+        if tree is not None:
+            return tree
+        cached = None
+        if cache_dir is not None:
+            cached = os.path.join(cache_dir, '%s.npz' % uuid)
+        if cached is not None and os.path.exists(cached):
+            tree = ArrayTree.load(cached)
+        else:
+            newick = zf.read(_NEWICK_MEMBER % uuid).decode('utf8')
+            tree = ArrayTree.from_treenode(
+                skbio.TreeNode.read(io.StringIO(newick)))
+            if cached is not None:
+                os.makedirs(cache_dir, exist_ok=True)
+                # written under another name and renamed, so concurrent
+                # jobs never read a partial file
+                fd, scratch = tempfile.mkstemp(dir=cache_dir,
+                                               suffix='.npz')
+                os.close(fd)
+                tree.save(scratch)
+                os.replace(scratch, cached)
+    _remember(uuid, tree)
+    return tree
+
+
+def read_newick(path):
+    """Read the ArrayTree of a Newick file, cached by artifact UUID
+
+    An artifact's data is extracted to ``<uuid>/data/``, so a file found
+    there is cached under that UUID, shared with ``load_tree``. Any other
+    file is parsed on every read.
+
+    Parameters
+    ----------
+    path : str
+        A Newick file.
+
+    Returns
+    -------
+    ArrayTree
+    """
+    data_dir = os.path.dirname(os.path.abspath(path))
+    uuid = os.path.basename(os.path.dirname(data_dir))
+    try:
+        _uuid.UUID(uuid)
+    except ValueError:
+        uuid = None
+    if os.path.basename(data_dir) != 'data':
+        uuid = None
+    if uuid is not None:
+        tree = _cached(uuid)
+        if tree is not None:
+            return tree
+    tree = ArrayTree.from_treenode(skbio.TreeNode.read(path))
+    if uuid is not None:
+        _remember(uuid, tree)
+    return tree
+
+
+def prune_tree(tree: ArrayTree, table: biom.Table) -> skbio.TreeNode:
+    return tree.induced(table.ids(axis='observation')).to_treenode()
@@ -0,0 +1,29 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import biom
+import numpy as np
+import pandas as pd
+import scipy.sparse as ss
+
+
+def trim_and_collapse(table: biom.Table, length: int) -> biom.Table:
+    ids = np.asarray(table.ids(axis='observation'), dtype=str)
+    keep = np.flatnonzero(np.char.str_len(ids) >= length)
+    if not len(keep):
+        raise ValueError("No feature ID is at least %d characters long."
+                         % length)
+
+    # casting to a narrower fixed width string truncates every ID at once,
+    # and factorizing hashes them into groups without sorting
+    trimmed = ids[keep].astype('<U%d' % length)
+    groups, collapsed_ids = pd.factorize(trimmed)
+
+    indicator = ss.csr_matrix((np.ones(len(keep)), (groups, keep)),
+                              shape=(len(collapsed_ids), len(ids)))
+    return biom.Table(indicator @ table.matrix_data, list(collapsed_ids),
+                      table.ids(axis='sample'))
@@ -0,0 +1,57 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+from qiime2.plugin import SemanticType
+from q2_types.feature_data import FeatureData
+from q2_types.feature_table import FeatureTable
+from q2_types.sample_data import SampleData
+
+
+QuantileSketch = SemanticType('QuantileSketch')
+
+FeatureQuantiles = SemanticType('FeatureQuantiles',
+                                variant_of=FeatureData.field['type'])
+
+SampleIndex = SemanticType('SampleIndex')
+
+RankTestResults = SemanticType('RankTestResults')
+
+PermanovaResults = SemanticType('PermanovaResults')
+
+TrainingMatrix = SemanticType('TrainingMatrix',
+                              variant_of=SampleData.field['type'])
+
+TraitPredictions = SemanticType('TraitPredictions',
+                                variant_of=SampleData.field['type'])
+
+CrossValidationReport = SemanticType('CrossValidationReport')
+
+FeatureNetwork = SemanticType('FeatureNetwork')
+
+TopFeatures = SemanticType('TopFeatures', variant_of=SampleData.field['type'])
+
+TableFingerprint = SemanticType('TableFingerprint')
+
+ContaminantScores = SemanticType('ContaminantScores',
+                                 variant_of=FeatureData.field['type'])
+
+WellLeakage = SemanticType('WellLeakage', variant_of=SampleData.field['type'])
+
+QCReport = SemanticType('QCReport', variant_of=SampleData.field['type'])
+
+StratifiedFeatureTables = SemanticType('StratifiedFeatureTables')
+
+ConsecutiveDistances = SemanticType('ConsecutiveDistances')
+
+HostVolatility = SemanticType('HostVolatility')
+
+GroupedDistanceMatrix = SemanticType('GroupedDistanceMatrix')
+
+SimilarSamplePairs = SemanticType('SimilarSamplePairs')
+
+PackedPresenceAbsence = SemanticType(
+    'PackedPresenceAbsence', variant_of=FeatureTable.field['content'])
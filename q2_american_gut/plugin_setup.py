@@ -6,11 +6,75 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import importlib
+
 import biom
-from qiime2.plugin import Plugin
-from q2_types.feature_table import FeatureTable, Frequency
+from qiime2.plugin import (Plugin, Float, Int, Bool, Str, Range, Choices,
+                           List, Metadata, MetadataColumn, Numeric,
+                           Categorical)
+from q2_types.feature_table import (FeatureTable, Frequency, RelativeFrequency,
+                                    PresenceAbsence)
+from q2_types.feature_data import FeatureData, Taxonomy, Sequence
+from q2_types.sample_data import SampleData, AlphaDiversity
+from q2_types.ordination import PCoAResults
+from q2_types.distance_matrix import DistanceMatrix
+from q2_types.tree import Phylogeny, Rooted
 
 import q2_american_gut
+from q2_american_gut._hdf5 import PORTABLE_COMPRESSIONS
+from q2_american_gut._predict import ESTIMATORS
+from q2_american_gut._network import METHODS as NETWORK_METHODS
+from q2_american_gut._stratify import STEPS
+from q2_american_gut._longitudinal import METRICS as PAIRED_METRICS
+from q2_american_gut._type import (QuantileSketch, FeatureQuantiles,
+                                   SampleIndex, RankTestResults,
+                                   PermanovaResults, TrainingMatrix,
+                                   TraitPredictions, CrossValidationReport,
+                                   FeatureNetwork, TopFeatures,
+                                   TableFingerprint, ContaminantScores,
+                                   WellLeakage, QCReport,
+                                   StratifiedFeatureTables,
+                                   ConsecutiveDistances, HostVolatility,
+                                   GroupedDistanceMatrix, SimilarSamplePairs,
+                                   PackedPresenceAbsence)
+from q2_american_gut._format import (QuantileSketchFormat,
+                                     QuantileSketchDirFmt,
+                                     FeatureQuantilesFormat,
+                                     FeatureQuantilesDirFmt,
+                                     IndexedSamplesFormat,
+                                     IndexedArtifactsFormat,
+                                     SampleIndexDirFmt,
+                                     RankTestResultsFormat,
+                                     RankTestResultsDirFmt,
+                                     PermanovaResultsFormat,
+                                     PermanovaResultsDirFmt,
+                                     NPYFormat, IDListFormat,
+                                     TrainingMatrixDirFmt,
+                                     TraitPredictionsFormat,
+                                     TraitPredictionsDirFmt,
+                                     CrossValidationReportFormat,
+                                     CrossValidationReportDirFmt,
+                                     FeatureNetworkFormat,
+                                     FeatureNetworkDirFmt,
+                                     TopFeaturesFormat, TopFeaturesDirFmt,
+                                     TableFingerprintFormat,
+                                     TableFingerprintDirFmt,
+                                     ContaminantScoresFormat,
+                                     ContaminantScoresDirFmt,
+                                     WellLeakageFormat, WellLeakageDirFmt,
+                                     QCReportFormat, QCReportDirFmt,
+                                     StrataFormat,
+                                     StratifiedFeatureTablesDirFmt,
+                                     ConsecutiveDistancesFormat,
+                                     ConsecutiveDistancesDirFmt,
+                                     HostVolatilityFormat,
+                                     HostVolatilityDirFmt,
+                                     BlockDistancesFormat,
+                                     BlockDistancesDirFmt,
+                                     SimilarSamplePairsFormat,
+                                     SimilarSamplePairsDirFmt,
+                                     PackedPresenceFormat,
+                                     PackedPresenceDirFmt)
 
 
 plugin = Plugin(
@@ -24,9 +88,85 @@ plugin = Plugin(
     citation_text='https://doi.org/10.1101/277970'
 )
 
+
+plugin.register_formats(QuantileSketchFormat, QuantileSketchDirFmt,
+                        FeatureQuantilesFormat, FeatureQuantilesDirFmt,
+                        IndexedSamplesFormat, IndexedArtifactsFormat,
+                        SampleIndexDirFmt, RankTestResultsFormat,
+                        RankTestResultsDirFmt, PermanovaResultsFormat,
+                        PermanovaResultsDirFmt, NPYFormat, IDListFormat,
+                        TrainingMatrixDirFmt, TraitPredictionsFormat,
+                        TraitPredictionsDirFmt, CrossValidationReportFormat,
+                        CrossValidationReportDirFmt, FeatureNetworkFormat,
+                        FeatureNetworkDirFmt, TopFeaturesFormat,
+                        TopFeaturesDirFmt, TableFingerprintFormat,
+                        TableFingerprintDirFmt, ContaminantScoresFormat,
+                        ContaminantScoresDirFmt, WellLeakageFormat,
+                        WellLeakageDirFmt, QCReportFormat, QCReportDirFmt,
+                        StrataFormat, StratifiedFeatureTablesDirFmt,
+                        ConsecutiveDistancesFormat,
+                        ConsecutiveDistancesDirFmt, HostVolatilityFormat,
+                        HostVolatilityDirFmt, BlockDistancesFormat,
+                        BlockDistancesDirFmt, SimilarSamplePairsFormat,
+                        SimilarSamplePairsDirFmt, PackedPresenceFormat,
+                        PackedPresenceDirFmt)
+
+plugin.register_semantic_types(QuantileSketch, FeatureQuantiles, SampleIndex,
+                               RankTestResults, PermanovaResults,
+                               TrainingMatrix, TraitPredictions,
+                               CrossValidationReport, FeatureNetwork,
+                               TopFeatures, TableFingerprint,
+                               ContaminantScores, WellLeakage, QCReport,
+                               StratifiedFeatureTables, ConsecutiveDistances,
+                               HostVolatility, GroupedDistanceMatrix,
+                               SimilarSamplePairs, PackedPresenceAbsence)
+
+plugin.register_semantic_type_to_format(
+    QuantileSketch, artifact_format=QuantileSketchDirFmt)
+plugin.register_semantic_type_to_format(
+    FeatureData[FeatureQuantiles], artifact_format=FeatureQuantilesDirFmt)
+plugin.register_semantic_type_to_format(
+    SampleIndex, artifact_format=SampleIndexDirFmt)
+plugin.register_semantic_type_to_format(
+    RankTestResults, artifact_format=RankTestResultsDirFmt)
+plugin.register_semantic_type_to_format(
+    PermanovaResults, artifact_format=PermanovaResultsDirFmt)
+plugin.register_semantic_type_to_format(
+    SampleData[TrainingMatrix], artifact_format=TrainingMatrixDirFmt)
+plugin.register_semantic_type_to_format(
+    SampleData[TraitPredictions], artifact_format=TraitPredictionsDirFmt)
+plugin.register_semantic_type_to_format(
+    CrossValidationReport, artifact_format=CrossValidationReportDirFmt)
+plugin.register_semantic_type_to_format(
+    FeatureNetwork, artifact_format=FeatureNetworkDirFmt)
+plugin.register_semantic_type_to_format(
+    SampleData[TopFeatures], artifact_format=TopFeaturesDirFmt)
+plugin.register_semantic_type_to_format(
+    TableFingerprint, artifact_format=TableFingerprintDirFmt)
+plugin.register_semantic_type_to_format(
+    FeatureData[ContaminantScores], artifact_format=ContaminantScoresDirFmt)
+plugin.register_semantic_type_to_format(
+    SampleData[WellLeakage], artifact_format=WellLeakageDirFmt)
+plugin.register_semantic_type_to_format(
+    SampleData[QCReport], artifact_format=QCReportDirFmt)
+plugin.register_semantic_type_to_format(
+    StratifiedFeatureTables, artifact_format=StratifiedFeatureTablesDirFmt)
+plugin.register_semantic_type_to_format(
+    ConsecutiveDistances, artifact_format=ConsecutiveDistancesDirFmt)
+plugin.register_semantic_type_to_format(
+    HostVolatility, artifact_format=HostVolatilityDirFmt)
+plugin.register_semantic_type_to_format(
+    GroupedDistanceMatrix, artifact_format=BlockDistancesDirFmt)
+plugin.register_semantic_type_to_format(
+    SimilarSamplePairs, artifact_format=SimilarSamplePairsDirFmt)
+plugin.register_semantic_type_to_format(
+    FeatureTable[PackedPresenceAbsence], artifact_format=PackedPresenceDirFmt)
+
+
 def dummy(foo: biom.Table) -> biom.Table:
     return foo
 
+
 plugin.methods.register_function(
     function=dummy,
     inputs={'foo': FeatureTable[Frequency]},
@@ -39,3 +179,847 @@ plugin.methods.register_function(
     name='A dummy placeholder',
     description="A dummy placeholder"
 )
+
+plugin.methods.register_function(
+    function=q2_american_gut.sketch_quantiles,
+    inputs={'table': FeatureTable[Frequency]},
+    parameters={'relative_accuracy': Float % Range(0, 1,
+                                                   inclusive_start=False),
+                'relative_frequency': Bool,
+                'block_size': Int % Range(1, None)},
+    outputs=[('sketch', QuantileSketch)],
+    input_descriptions={
+        'table': 'The feature table to summarize.'
+    },
+    parameter_descriptions={
+        'relative_accuracy': ('The relative error bound on any quantile '
+                              'estimated from the sketch.'),
+        'relative_frequency': ('Sketch relative frequencies rather than '
+                               'counts.'),
+        'block_size': ('The number of samples read from the table at a '
+                       'time. This bounds the memory used.')
+    },
+    output_descriptions={'sketch': 'Per-feature quantile sketches.'},
+    name='Sketch per-feature quantiles',
+    description=('Stream a feature table in blocks of samples and summarize '
+                 'the distribution of every feature with a mergeable '
+                 'quantile sketch. Sketches of disjoint sets of samples, '
+                 'such as different sequencing rounds, can be merged '
+                 'without revisiting the tables.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.merge_sketches,
+    inputs={'sketches': List[QuantileSketch]},
+    parameters={},
+    outputs=[('merged_sketch', QuantileSketch)],
+    input_descriptions={
+        'sketches': ('The sketches to merge. Each must summarize a disjoint '
+                     'set of samples and share the same relative accuracy.')
+    },
+    output_descriptions={'merged_sketch': 'The combined sketches.'},
+    name='Merge quantile sketches',
+    description='Combine quantile sketches of disjoint sets of samples.'
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.summarize_sketch,
+    inputs={'sketch': QuantileSketch},
+    parameters={'quantiles': List[Float % Range(0, 1, inclusive_end=True)]},
+    outputs=[('summary', FeatureData[FeatureQuantiles])],
+    input_descriptions={
+        'sketch': 'The quantile sketch to summarize.'
+    },
+    parameter_descriptions={
+        'quantiles': ('The quantiles to estimate. Defaults to the quartiles.')
+    },
+    output_descriptions={
+        'summary': 'The prevalence and estimated quantiles of each feature.'
+    },
+    name='Summarize a quantile sketch',
+    description='Estimate per-feature quantiles from a quantile sketch.'
+)
+
+plugin.visualizers.register_function(
+    function=q2_american_gut.participant_reports,
+    inputs={'table': FeatureTable[Frequency],
+            'taxonomy': FeatureData[Taxonomy],
+            'alpha_diversity': SampleData[AlphaDiversity],
+            'pcoa': PCoAResults},
+    parameters={'samples': Metadata,
+                'taxonomic_level': Int % Range(1, None),
+                'max_taxa': Int % Range(1, None),
+                'cache_dir': Str,
+                'n_jobs': Int % Range(1, None)},
+    input_descriptions={
+        'table': 'The reference feature table.',
+        'taxonomy': 'The taxonomy of the features in the table.',
+        'alpha_diversity': ('The alpha diversity of the reference samples, '
+                            'against which each participant is placed.'),
+        'pcoa': ('An ordination of the reference samples, in which each '
+                 'participant is placed.')
+    },
+    parameter_descriptions={
+        'samples': 'The participant samples to render reports for.',
+        'taxonomic_level': 'The taxonomic level at which to report taxa.',
+        'max_taxa': 'The number of most abundant taxa to report.',
+        'cache_dir': ('A directory in which completed reports are kept, '
+                      'under a fingerprint of the reference and parameters. '
+                      'Reports already rendered from the same inputs are '
+                      'not rendered again, so an interrupted run resumes '
+                      'where it stopped.'),
+        'n_jobs': 'The number of processes used to render reports.'
+    },
+    name='Render participant reports',
+    description=('Render a report for each participant describing their '
+                 'most abundant taxa, their alpha diversity relative to the '
+                 'reference, and their placement in the reference '
+                 'ordination. The reference is prepared once and shared '
+                 'read-only across a pool of worker processes.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.index_samples,
+    inputs={'index': SampleIndex},
+    parameters={'directory': Str},
+    outputs=[('updated_index', SampleIndex)],
+    input_descriptions={
+        'index': ('An existing index to update. Artifacts it already holds '
+                  'are not read again.')
+    },
+    parameter_descriptions={
+        'directory': ('A directory of FeatureTable[Frequency] artifacts. '
+                      'Artifacts of other types are recorded but not read.')
+    },
+    output_descriptions={
+        'updated_index': ('The location of every sample by artifact UUID '
+                          'and column.')
+    },
+    name='Index samples across artifacts',
+    description=('Build or incrementally update an index locating every '
+                 'sample of a directory of feature table artifacts. '
+                 'Artifacts removed from the directory are dropped from the '
+                 'index.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.fetch_samples,
+    inputs={'index': SampleIndex},
+    parameters={'samples': Metadata},
+    outputs=[('table', FeatureTable[Frequency])],
+    input_descriptions={
+        'index': 'The index locating the samples.'
+    },
+    parameter_descriptions={
+        'samples': 'The samples to retrieve.'
+    },
+    output_descriptions={
+        'table': 'The requested samples.'
+    },
+    name='Fetch samples from indexed artifacts',
+    description=('Retrieve samples from the artifacts holding them. Only '
+                 'the requested columns are read from tables stored '
+                 'uncompressed within their archives. Compressed tables, '
+                 'as QIIME 2 writes by default, are decompressed in full '
+                 'once per artifact.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.extract_samples,
+    inputs={'table': FeatureTable[Frequency]},
+    parameters={'metadata': Metadata,
+                'filter_empty_features': Bool},
+    outputs=[('extracted_table', FeatureTable[Frequency])],
+    input_descriptions={
+        'table': 'The feature table to extract samples from.'
+    },
+    parameter_descriptions={
+        'metadata': 'The samples to extract.',
+        'filter_empty_features': ('Remove features which are absent from '
+                                  'all of the extracted samples.')
+    },
+    output_descriptions={
+        'extracted_table': 'The extracted samples.'
+    },
+    name='Extract a subset of samples',
+    description=('Extract samples from a feature table by reading only their '
+                 'columns from disk, so the cost scales with the number of '
+                 'samples extracted rather than the size of the table.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.rechunk_table,
+    inputs={'table': FeatureTable[Frequency]},
+    parameters={'chunk_size': Int % Range(1, None),
+                'compression': Str % Choices(PORTABLE_COMPRESSIONS)},
+    outputs=[('rechunked_table', FeatureTable[Frequency])],
+    input_descriptions={
+        'table': 'The feature table to write.'
+    },
+    parameter_descriptions={
+        'chunk_size': ('The number of values per HDF5 chunk. Larger chunks '
+                       'compress better, smaller chunks make reading '
+                       'individual samples cheaper.'),
+        'compression': ('The compression codec. Every codec offered can be '
+                        'read wherever h5py is installed, so the table '
+                        'remains usable by any plugin.')
+    },
+    output_descriptions={
+        'rechunked_table': 'The same table, stored with the chosen layout.'
+    },
+    name='Rewrite a table with tuned HDF5 chunking and compression',
+    description=('Store a feature table using a chosen chunk size and a '
+                 'faster compression codec than the default gzip, which '
+                 'makes writing large tables considerably faster.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.rank_test,
+    inputs={'table': FeatureTable[Frequency]},
+    parameters={'metadata': Metadata,
+                'columns': List[Str],
+                'min_group_size': Int % Range(1, None),
+                'n_jobs': Int % Range(1, None)},
+    outputs=[('results', RankTestResults)],
+    input_descriptions={
+        'table': 'The feature table to test.'
+    },
+    parameter_descriptions={
+        'metadata': 'The sample metadata defining the groupings.',
+        'columns': ('The metadata columns to test. Defaults to every '
+                    'categorical column.'),
+        'min_group_size': ('Groups with fewer samples than this are '
+                           'excluded from a test.'),
+        'n_jobs': 'The number of processes across which columns are tested.'
+    },
+    output_descriptions={
+        'results': ('The test statistic, p-value and Benjamini-Hochberg '
+                    'q-value of every feature for every column.')
+    },
+    name='Rank-based differential abundance across metadata columns',
+    description=('Test every feature for differential abundance across the '
+                 'groups of each metadata column with a Kruskal-Wallis test, '
+                 'which with two groups is equivalent to a Wilcoxon rank-sum '
+                 'test. Features are ranked once, sparsely, and the ranks are '
+                 'reused by every column without missing values. Each column '
+                 'is then tested for all features at once.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.permanova,
+    inputs={'distance_matrix': DistanceMatrix},
+    parameters={'metadata': Metadata,
+                'columns': List[Str],
+                'permutations': Int % Range(0, None),
+                'batch_size': Int % Range(1, None),
+                'early_stopping': Bool,
+                'alpha': Float % Range(0, 1),
+                'random_seed': Int,
+                'n_jobs': Int % Range(1, None)},
+    outputs=[('results', PermanovaResults)],
+    input_descriptions={
+        'distance_matrix': 'The distance matrix to test.'
+    },
+    parameter_descriptions={
+        'metadata': 'The sample metadata defining the groupings.',
+        'columns': ('The metadata columns to test. Defaults to every '
+                    'categorical column.'),
+        'permutations': 'The number of permutations per column.',
+        'batch_size': ('The number of permutations evaluated together as '
+                       'one matrix product.'),
+        'early_stopping': ('Stop permuting a column once its p-value is '
+                           'confidently above alpha.'),
+        'alpha': 'The significance level used for early stopping.',
+        'random_seed': 'The seed of the shared permutations.',
+        'n_jobs': 'The number of threads across which columns are tested.'
+    },
+    output_descriptions={
+        'results': ('The pseudo-F statistic, p-value, number of permutations '
+                    'performed and Benjamini-Hochberg q-value of each '
+                    'column.')
+    },
+    name='PERMANOVA across many metadata columns',
+    description=('Test each metadata column for association with a distance '
+                 'matrix using PERMANOVA. The squared distances are computed '
+                 'once, permutations are shared by all columns and '
+                 'evaluated in batches as matrix products, and permuting '
+                 'stops early for columns which are clearly not '
+                 'significant.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.training_set,
+    inputs={'table': FeatureTable[Frequency],
+            'reference': SampleData[TrainingMatrix]},
+    parameters={'target': MetadataColumn[Numeric | Categorical]},
+    outputs=[('training_set', SampleData[TrainingMatrix])],
+    input_descriptions={
+        'table': 'The feature table to convert.',
+        'reference': ('A training matrix whose feature ordering is reused, '
+                      'for instance to align a test set with the set a '
+                      'model was trained on.')
+    },
+    parameter_descriptions={
+        'target': ('The value to predict. Samples without a value are '
+                   'excluded.')
+    },
+    output_descriptions={
+        'training_set': ('A float32 samples by features CSR matrix, the '
+                         'aligned target and the feature ordering, stored as '
+                         'memory-mappable .npy arrays.')
+    },
+    name='Export a sparse training matrix',
+    description=('Convert a feature table and a metadata column into a '
+                 'matrix ready for scikit-learn in a single pass. The arrays '
+                 'can be memory mapped directly by a training job.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.predict_trait,
+    inputs={'table': FeatureTable[Frequency]},
+    parameters={'target': MetadataColumn[Numeric | Categorical],
+                'estimator': Str % Choices(sorted(ESTIMATORS)),
+                'n_estimators': Int % Range(1, None),
+                'cv': Int % Range(2, None),
+                'min_prevalence': Float % Range(0, 1, inclusive_end=True),
+                'random_seed': Int,
+                'cache_dir': Str,
+                'n_jobs': Int % Range(1, None)},
+    outputs=[('predictions', SampleData[TraitPredictions]),
+             ('report', CrossValidationReport)],
+    input_descriptions={
+        'table': 'The feature table to predict from.'
+    },
+    parameter_descriptions={
+        'target': ('The host trait to predict. Numeric columns are '
+                   'regressed and categorical columns are classified.'),
+        'estimator': 'The ensemble estimator to train.',
+        'n_estimators': 'The number of trees in the ensemble.',
+        'cv': 'The number of cross-validation folds.',
+        'min_prevalence': ('The fraction of a fold\'s training samples in '
+                           'which a feature must be present to be used.'),
+        'random_seed': 'The seed of the fold assignment and the estimator.',
+        'cache_dir': ('A directory in which per-fold preprocessing is kept '
+                      'and reused by later runs over the same data.'),
+        'n_jobs': 'The number of processes across which folds are run.'
+    },
+    output_descriptions={
+        'predictions': ('The out-of-fold prediction for every sample and the '
+                        'fold in which it was held out.'),
+        'report': ('The accuracy, or R-squared and mean absolute error, of '
+                   'each fold alongside its preprocessing, training and '
+                   'prediction wall times.')
+    },
+    name='Cross-validated prediction of a host trait',
+    description=('Predict a host trait such as age or BMI from the '
+                 'microbiome with k-fold cross-validation. Relative '
+                 'abundances are computed once and shared read-only by '
+                 'worker processes, each of which runs whole folds.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.trim_and_collapse,
+    inputs={'table': FeatureTable[Frequency]},
+    parameters={'length': Int % Range(1, None)},
+    outputs=[('collapsed_table', FeatureTable[Frequency])],
+    input_descriptions={
+        'table': 'A feature table whose feature IDs are sequences.'
+    },
+    parameter_descriptions={
+        'length': ('The length to trim feature sequences to. Features '
+                   'shorter than this are removed.')
+    },
+    output_descriptions={
+        'collapsed_table': ('The table with features collapsed by their '
+                            'trimmed sequence and counts summed.')
+    },
+    name='Trim sequence features and collapse duplicates',
+    description=('Harmonize tables of sOTUs sequenced at different read '
+                 'lengths, such as 150 and 100 nucleotides, by trimming '
+                 'feature sequences to a common length and summing features '
+                 'which become identical.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.feature_network,
+    inputs={'table': FeatureTable[Frequency]},
+    parameters={'method': Str % Choices(NETWORK_METHODS),
+                'threshold': Float % Range(0, 1, inclusive_end=True),
+                'min_prevalence': Float % Range(0, 1, inclusive_end=True),
+                'max_memory_mb': Int % Range(1, None),
+                'n_jobs': Int % Range(1, None)},
+    outputs=[('network', FeatureNetwork)],
+    input_descriptions={
+        'table': 'The feature table.'
+    },
+    parameter_descriptions={
+        'method': ('The association measure: Spearman correlation, or the '
+                   'proportionality rho of clr transformed abundances with '
+                   'a pseudocount of one.'),
+        'threshold': ('The absolute association at or above which a pair of '
+                      'features is reported.'),
+        'min_prevalence': ('The fraction of samples in which a feature must '
+                           'be present to be included.'),
+        'max_memory_mb': ('The approximate memory available for blocks of '
+                          'associations, across all threads.'),
+        'n_jobs': 'The number of threads across which blocks are computed.'
+    },
+    output_descriptions={
+        'network': 'The pairs of features associated above the threshold.'
+    },
+    name='Feature co-occurrence network',
+    description=('Compute the association among all pairs of prevalent '
+                 'features from blocks of sparse matrix products, keeping '
+                 'only pairs above a threshold, so the full feature by '
+                 'feature matrix is never held in memory.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.top_features,
+    inputs={'table': FeatureTable[Frequency]},
+    parameters={'k': Int % Range(1, None),
+                'relative_frequency': Bool},
+    outputs=[('top_features', SampleData[TopFeatures])],
+    input_descriptions={
+        'table': ('The feature table, such as one collapsed to a taxonomic '
+                  'level.')
+    },
+    parameter_descriptions={
+        'k': 'The number of features to report per sample.',
+        'relative_frequency': ('Whether to report relative rather than '
+                               'absolute abundances.')
+    },
+    output_descriptions={
+        'top_features': ('The most abundant features of each sample, one '
+                         'row per sample and rank.')
+    },
+    name='Most abundant features per sample',
+    description=('Select the k most abundant features of every sample '
+                 'without sorting the whole table. Samples with fewer than '
+                 'k features report all of them.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.fingerprint_table,
+    inputs={'table': FeatureTable[Frequency | RelativeFrequency |
+                                  PresenceAbsence]},
+    parameters={'block_size': Int % Range(1, None),
+                'max_blocks': Int % Range(0, None)},
+    outputs=[('fingerprint', TableFingerprint)],
+    input_descriptions={
+        'table': 'The feature table to fingerprint.'
+    },
+    parameter_descriptions={
+        'block_size': 'The number of bytes hashed at a time.',
+        'max_blocks': ('The number of evenly spaced blocks of each sparse '
+                       'matrix array to hash. Zero hashes every block.')
+    },
+    output_descriptions={
+        'fingerprint': ('The fingerprint of the table, its dimensions, and '
+                        'the version of this plugin.')
+    },
+    name='Fingerprint a feature table',
+    description=('Compute a structural hash of a table, covering its shape, '
+                 'IDs and sample totals in full and its counts in sampled '
+                 'blocks, so that large tables can be identified in audits '
+                 'and used as cache keys without hashing every byte.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.score_contaminants,
+    inputs={'table': FeatureTable[Frequency]},
+    parameters={'metadata': Metadata,
+                'concentration_column': Str,
+                'control_column': Str,
+                'control_value': Str,
+                'plate_column': Str,
+                'threshold': Float % Range(0, 1, inclusive_end=True),
+                'n_jobs': Int % Range(1, None)},
+    outputs=[('filtered_table', FeatureTable[Frequency]),
+             ('scores', FeatureData[ContaminantScores])],
+    input_descriptions={
+        'table': 'The feature table, including any negative controls.'
+    },
+    parameter_descriptions={
+        'metadata': 'The sample metadata.',
+        'concentration_column': ('The column of DNA concentrations, which '
+                                 'enables the frequency score.'),
+        'control_column': ('The column identifying negative controls, which '
+                           'enables the prevalence score.'),
+        'control_value': ('The value of the control column, compared '
+                          'without regard to case, marking negative '
+                          'controls.'),
+        'plate_column': ('The column of plates. Plates are scored '
+                         'independently and each feature keeps its lowest '
+                         'score.'),
+        'threshold': ('Features scoring below this are considered '
+                      'contaminants.'),
+        'n_jobs': 'The number of processes across which plates are scored.'
+    },
+    output_descriptions={
+        'filtered_table': 'The table without the contaminant features.',
+        'scores': ('The frequency, prevalence and combined score of each '
+                   'feature. Features without a score are kept.')
+    },
+    name='Score features for contamination',
+    description=('Score every feature for contamination as decontam does. '
+                 'The frequency score tests whether a feature\'s frequency '
+                 'is inversely proportional to DNA concentration, and the '
+                 'prevalence score whether it is more prevalent in negative '
+                 'controls than in samples. When both are available, the '
+                 'lower is used. All features are fit at once from sums '
+                 'over the sparse table. See Davis et al. 2018, '
+                 'https://doi.org/10.1186/s40168-018-0605-2')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.well_leakage,
+    inputs={'table': FeatureTable[Frequency]},
+    parameters={'metadata': Metadata,
+                'plate_column': Str,
+                'well_column': Str,
+                'threshold': Float % Range(0, None),
+                'n_jobs': Int % Range(1, None)},
+    outputs=[('leakage', SampleData[WellLeakage])],
+    input_descriptions={
+        'table': 'The feature table.'
+    },
+    parameter_descriptions={
+        'metadata': 'The sample metadata, including the plate map.',
+        'plate_column': 'The column of plates.',
+        'well_column': 'The column of wells, such as A1 or H12.',
+        'threshold': ('The excess similarity to neighboring wells, over the '
+                      'rest of the plate, above which a sample is flagged.'),
+        'n_jobs': 'The number of processes across which plates are scored.'
+    },
+    output_descriptions={
+        'leakage': ('The similarity of each sample to its neighboring wells '
+                    'and to the rest of its plate, and whether it is '
+                    'flagged.')
+    },
+    name='Well-to-well leakage',
+    description=('Estimate well-to-well leakage from the cosine similarity '
+                 'of each sample to its adjacent wells, weighting corners '
+                 'less than edges, relative to its similarity to the other '
+                 'wells of its plate. Samples without a plate and well are '
+                 'omitted.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.qc_gate,
+    inputs={'table': FeatureTable[Frequency],
+            'blooms': FeatureData[Sequence],
+            'contaminant_scores': FeatureData[ContaminantScores]},
+    parameters={'min_depth': Int % Range(0, None),
+                'max_bloom_fraction': Float % Range(0, 1, inclusive_end=True),
+                'max_singleton_ratio': Float % Range(0, 1,
+                                                     inclusive_end=True),
+                'max_private_fraction': Float % Range(0, 1,
+                                                      inclusive_end=True),
+                'max_contaminant_fraction': Float % Range(
+                    0, 1, inclusive_end=True)},
+    outputs=[('pruned_table', FeatureTable[Frequency]),
+             ('report', SampleData[QCReport])],
+    input_descriptions={
+        'table': 'The feature table of sOTUs.',
+        'blooms': ('Bloom sequences. A feature is a bloom when one of the '
+                   'two sequences is a prefix of the other.'),
+        'contaminant_scores': ('Contaminant scores, of which the features '
+                               'flagged as contaminants are counted.')
+    },
+    parameter_descriptions={
+        'min_depth': 'The fewest reads a passing sample can have.',
+        'max_bloom_fraction': ('The largest fraction of reads a passing '
+                               'sample can have from blooms.'),
+        'max_singleton_ratio': ('The largest fraction of features a passing '
+                                'sample can have observed once.'),
+        'max_private_fraction': ('The largest fraction of reads a passing '
+                                 'sample can have from features seen in no '
+                                 'other sample, a proxy for chimeras.'),
+        'max_contaminant_fraction': ('The largest fraction of reads a '
+                                     'passing sample can have from '
+                                     'contaminants.')
+    },
+    output_descriptions={
+        'pruned_table': 'The table of passing samples.',
+        'report': 'The quality metrics of every sample and whether it passed.'
+    },
+    name='Sample quality gate',
+    description=('Compute quality metrics for every sample in one pass over '
+                 'the table, and remove the samples failing any of them '
+                 'before costlier steps such as rarefaction and diversity. '
+                 'If every sample fails, the error counts the samples '
+                 'failing each limit.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.stratify,
+    inputs={'table': FeatureTable[Frequency]},
+    parameters={'metadata': Metadata,
+                'column': Str,
+                'steps': List[Str % Choices(STEPS)],
+                'min_depth': Int % Range(0, None),
+                'sampling_depth': Int % Range(1, None),
+                'control_column': Str,
+                'concentration_column': Str,
+                'plate_column': Str,
+                'random_seed': Int,
+                'n_jobs': Int % Range(1, None)},
+    outputs=[('strata', StratifiedFeatureTables),
+             ('merged_table', FeatureTable[Frequency])],
+    input_descriptions={
+        'table': 'The feature table.'
+    },
+    parameter_descriptions={
+        'metadata': 'The sample metadata.',
+        'column': ('The column, such as body site, whose values define the '
+                   'strata. Samples without a value are dropped.'),
+        'steps': ('The steps applied to every stratum, in order: qc-gate '
+                  'with min-depth, remove-contaminants with the control, '
+                  'concentration and plate columns, and rarefy to '
+                  'sampling-depth.'),
+        'min_depth': 'The minimum depth of the qc-gate step.',
+        'sampling_depth': 'The depth of the rarefy step.',
+        'control_column': ('The negative control column of the '
+                           'remove-contaminants step.'),
+        'concentration_column': ('The DNA concentration column of the '
+                                 'remove-contaminants step.'),
+        'plate_column': 'The plate column of the remove-contaminants step.',
+        'random_seed': 'The seed of the rarefy step.',
+        'n_jobs': 'The number of processes across which strata are run.'
+    },
+    output_descriptions={
+        'strata': 'The processed table of each stratum.',
+        'merged_table': 'The processed strata merged into one table.'
+    },
+    name='Process strata independently',
+    description=('Partition a table by a metadata column and apply the '
+                 'same steps to each partition concurrently, rather than '
+                 'filtering and processing each partition in turn.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.host_trajectories,
+    inputs={'table': FeatureTable[Frequency]},
+    parameters={'metadata': Metadata,
+                'host_column': Str,
+                'time_column': Str,
+                'metric': Str % Choices(PAIRED_METRICS)},
+    outputs=[('distances', ConsecutiveDistances),
+             ('volatility', HostVolatility)],
+    input_descriptions={
+        'table': 'The feature table.'
+    },
+    parameter_descriptions={
+        'metadata': 'The sample metadata.',
+        'host_column': 'The column identifying the host of each sample.',
+        'time_column': ('The numeric column of each sample\'s timepoint. '
+                        'Samples without a host or timepoint, or without '
+                        'any counts, are ignored.'),
+        'metric': 'The beta diversity metric.'
+    },
+    output_descriptions={
+        'distances': ('The distance between each pair of consecutive '
+                      'timepoints of each host.'),
+        'volatility': ('The number of timepoints, duration and summary of '
+                       'consecutive distances of each host with more than '
+                       'one timepoint.')
+    },
+    name='Per-host trajectories',
+    description=('Compute the beta diversity between consecutive timepoints '
+                 'of each host directly from the table, rather than every '
+                 'pairwise distance, and summarize the volatility of each '
+                 'host.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.within_group_distances,
+    inputs={'table': FeatureTable[Frequency]},
+    parameters={'metadata': Metadata,
+                'column': Str,
+                'metric': Str % Choices(PAIRED_METRICS),
+                'max_memory_mb': Int % Range(1, None),
+                'n_jobs': Int % Range(1, None)},
+    outputs=[('distance_matrix', GroupedDistanceMatrix)],
+    input_descriptions={
+        'table': 'The feature table.'
+    },
+    parameter_descriptions={
+        'metadata': 'The sample metadata.',
+        'column': ('The column, such as country or household, within whose '
+                   'groups distances are computed. Samples without a value '
+                   'are omitted.'),
+        'metric': 'The beta diversity metric.',
+        'max_memory_mb': ('The approximate memory available to each process '
+                          'for a group. Larger groups are computed in '
+                          'batches of pairs.'),
+        'n_jobs': 'The number of processes across which groups are computed.'
+    },
+    output_descriptions={
+        'distance_matrix': ('The distances among the samples of each group, '
+                            'stored block by block.')
+    },
+    name='Within-group beta diversity',
+    description=('Compute beta diversity only among samples sharing a '
+                 'metadata value, so that cost and storage grow with the '
+                 'sum of the squared group sizes rather than the square of '
+                 'the number of samples.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.similar_pairs,
+    inputs={'table': FeatureTable[Frequency | PresenceAbsence]},
+    parameters={'threshold': Float % Range(0, 1, inclusive_end=True),
+                'n_hashes': Int % Range(1, None),
+                'bands': Int % Range(1, None),
+                'max_bucket_size': Int % Range(2, None),
+                'seed': Int},
+    outputs=[('pairs', SimilarSamplePairs)],
+    input_descriptions={
+        'table': 'The feature table.'
+    },
+    parameter_descriptions={
+        'threshold': ('The Jaccard similarity of features present at or '
+                      'above which a pair is reported.'),
+        'n_hashes': 'The length of each sample\'s MinHash signature.',
+        'bands': ('The number of bands the signatures are split into, which '
+                  'must divide n-hashes. More bands find pairs of lower '
+                  'similarity at the cost of more candidates to verify.'),
+        'max_bucket_size': ('Buckets holding more samples than this are '
+                            'skipped rather than expanded into pairs.'),
+        'seed': 'The seed of the hash functions.'
+    },
+    output_descriptions={
+        'pairs': ('The pairs found, with their estimated and exact Jaccard '
+                  'similarity.')
+    },
+    name='Find highly similar pairs of samples',
+    description=('Find pairs of samples sharing most of their features, '
+                 'such as members of a household, without comparing every '
+                 'pair. Samples are sketched with MinHash, candidate pairs '
+                 'are those whose sketches agree over a band, and only '
+                 'candidates are compared exactly. Pairs above the '
+                 'threshold can be missed, with a probability that falls '
+                 'as bands increase.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.prune_tree,
+    inputs={'tree': Phylogeny[Rooted],
+            'table': FeatureTable[Frequency | RelativeFrequency |
+                                  PresenceAbsence]},
+    parameters={},
+    outputs=[('pruned_tree', Phylogeny[Rooted])],
+    input_descriptions={
+        'tree': 'The reference tree.',
+        'table': ('The feature table, every feature of which must be a tip '
+                  'of the tree.')
+    },
+    parameter_descriptions={},
+    output_descriptions={
+        'pruned_tree': ('The subtree induced by the features of the table, '
+                        'without nodes left with a single child.')
+    },
+    name='Prune a tree to the features of a table',
+    description=('Reduce a reference tree to the features of a table. Only '
+                 'the paths from those features to the root are visited, '
+                 'so the cost follows the size of the subtree rather than '
+                 'of the reference. The reference is parsed once per '
+                 'artifact and kept, by UUID, for later pruning and '
+                 "Faith's phylogenetic diversity in the same session.")
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.faith_pd,
+    inputs={'table': FeatureTable[Frequency | RelativeFrequency |
+                                  PresenceAbsence | PackedPresenceAbsence],
+            'phylogeny': Phylogeny[Rooted]},
+    parameters={'max_memory_mb': Int % Range(1, None),
+                'n_jobs': Int % Range(1, None)},
+    outputs=[('alpha_diversity', SampleData[AlphaDiversity])],
+    input_descriptions={
+        'table': ('The feature table, every feature of which must be a tip '
+                  'of the tree.'),
+        'phylogeny': 'The rooted tree whose branch lengths are summed.'
+    },
+    parameter_descriptions={
+        'max_memory_mb': ('An approximate bound, in megabytes, on the '
+                          'presence bits held at once across all threads.'),
+        'n_jobs': 'The number of threads across which sample blocks are run.'
+    },
+    output_descriptions={
+        'alpha_diversity': "The Faith's phylogenetic diversity of each sample."
+    },
+    name="Faith's phylogenetic diversity of every sample",
+    description=("Compute Faith's phylogenetic diversity, the total length "
+                 'of the branches between the features observed in a '
+                 'sample and the root, for all samples at once. Presence '
+                 'is packed eight samples to a byte and combined up the '
+                 'tree one level at a time, so each branch is visited once '
+                 'per block of samples rather than once per sample, and a '
+                 'packed table\'s bits are used as they are stored. The '
+                 'tree is parsed once per artifact and kept, by UUID, for '
+                 'later calls in the same session.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.pack_presence,
+    inputs={'table': FeatureTable[Frequency | RelativeFrequency |
+                                  PresenceAbsence]},
+    parameters={},
+    outputs=[('packed_table', FeatureTable[PackedPresenceAbsence])],
+    input_descriptions={'table': 'The feature table to pack.'},
+    parameter_descriptions={},
+    output_descriptions={
+        'packed_table': ('The presence and absence of each feature, eight '
+                         'samples to a byte.')
+    },
+    name='Pack a feature table into presence bits',
+    description=('Reduce a feature table to the presence and absence of '
+                 'each feature, stored as one bit per sample. Jaccard '
+                 'distances, prevalence filtering and Faith\'s '
+                 'phylogenetic diversity need no more than this, at a '
+                 'fraction of the memory of the counts.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.filter_prevalence,
+    inputs={'table': FeatureTable[PackedPresenceAbsence]},
+    parameters={'min_prevalence': Float % Range(0, 1, inclusive_end=True),
+                'max_prevalence': Float % Range(0, 1, inclusive_end=True)},
+    outputs=[('filtered_table', FeatureTable[PackedPresenceAbsence])],
+    input_descriptions={'table': 'The packed feature table to filter.'},
+    parameter_descriptions={
+        'min_prevalence': ('The fraction of samples in which a feature must '
+                           'at least be present to be kept.'),
+        'max_prevalence': ('The fraction of samples in which a feature may '
+                           'at most be present to be kept.')
+    },
+    output_descriptions={
+        'filtered_table': 'The table restricted to the kept features.'
+    },
+    name='Filter features by prevalence',
+    description=('Keep the features present in a range of fractions of the '
+                 'samples, counting the set bits of each packed row.')
+)
+
+plugin.methods.register_function(
+    function=q2_american_gut.jaccard_distances,
+    inputs={'table': FeatureTable[PackedPresenceAbsence]},
+    parameters={'max_memory_mb': Int % Range(1, None)},
+    outputs=[('distance_matrix', DistanceMatrix)],
+    input_descriptions={'table': 'The packed feature table.'},
+    parameter_descriptions={
+        'max_memory_mb': ('An approximate bound, in megabytes, on the '
+                          'intermediate arrays held at once.')
+    },
+    output_descriptions={
+        'distance_matrix': 'The Jaccard distances among all samples.'
+    },
+    name='Jaccard distances from presence bits',
+    description=('Compute the Jaccard distance between every pair of '
+                 'samples by counting the set bits shared by their packed '
+                 'rows, eight features to a byte.')
+)
+
+importlib.import_module('q2_american_gut._transformer')
@@ -0,0 +1,148 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import unittest
+
+import biom
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import qiime2
+from qiime2.plugin.testing import TestPluginBase
+from scipy.spatial.distance import pdist
+
+from q2_american_gut import within_group_distances, BlockDistances
+from q2_american_gut._blockdist import pair_batches
+from q2_american_gut._format import BlockDistancesFormat
+
+
+class PairBatchesTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def test_matches_triu(self):
+        for n in (0, 1, 2, 7):
+            for size in (1, 4, 100):
+                batches = list(pair_batches(n, size))
+                i, j = np.triu_indices(n, k=1)
+                npt.assert_array_equal(
+                    np.concatenate([a for a, _ in batches] + [[]]), i)
+                npt.assert_array_equal(
+                    np.concatenate([b for _, b in batches] + [[]]), j)
+
+    def test_batch_size(self):
+        # whole rows are kept together, so only a single row may exceed it
+        lengths = [len(i) for i, _ in pair_batches(10, 12)]
+        self.assertEqual(lengths, [9, 8, 7, 6 + 5, 4 + 3 + 2 + 1])
+        self.assertEqual([len(i) for i, _ in pair_batches(10, 5)],
+                         [9, 8, 7, 6, 5, 4, 3 + 2, 1])
+
+
+class WithinGroupDistancesTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        counts = rng.poisson(2, size=(10, 14)).astype(float)
+        counts[rng.rand(10, 14) < 0.5] = 0
+        # two empty samples of one group
+        counts[:, [3, 6]] = 0
+        self.counts = counts
+        self.samples = ['S%d' % i for i in range(14)]
+        self.table = biom.Table(counts, ['F%d' % i for i in range(10)],
+                                self.samples)
+        self.site = np.array(['gut', 'oral', 'skin'] * 4 + [np.nan, 'gut'],
+                             dtype=object)
+        self.metadata = qiime2.Metadata(pd.DataFrame(
+            {'site': self.site},
+            index=pd.Index(self.samples, name='sample-id')))
+
+    def _check(self, obs, metric):
+        self.assertEqual(obs.groups, ['gut', 'oral', 'skin'])
+        for group in obs.groups:
+            members = np.flatnonzero(self.site == group)
+            dense = self.counts[:, members].T
+            if metric == 'jaccard':
+                dense = dense > 0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                exp = pdist(dense, metric)
+            dm = obs.group(group)
+            self.assertEqual(list(dm.ids),
+                             [self.samples[i] for i in members])
+            npt.assert_allclose(dm.condensed_form(), exp)
+
+    def test_matches_pdist(self):
+        for metric in ('braycurtis', 'jaccard'):
+            self._check(within_group_distances(
+                self.table, self.metadata, 'site', metric), metric)
+
+    def test_pairwise_path_matches_pdist(self):
+        # without memory for a dense group every pair is computed sparsely
+        for metric in ('braycurtis', 'jaccard'):
+            self._check(within_group_distances(
+                self.table, self.metadata, 'site', metric, max_memory_mb=0),
+                metric)
+
+    def test_empty_samples(self):
+        for max_memory_mb in (0, 256):
+            obs = within_group_distances(self.table, self.metadata, 'site',
+                                         'jaccard', max_memory_mb)
+            self.assertEqual(obs.distance('S3', 'S6'), 0.)
+            obs = within_group_distances(self.table, self.metadata, 'site',
+                                         'braycurtis', max_memory_mb)
+            self.assertTrue(np.isnan(obs.distance('S3', 'S6')))
+
+    def test_pool_matches_serial(self):
+        serial = within_group_distances(self.table, self.metadata, 'site')
+        pooled = within_group_distances(self.table, self.metadata, 'site',
+                                        n_jobs=2)
+        npt.assert_array_equal(serial.distances, pooled.distances)
+
+    def test_invalid(self):
+        with self.assertRaisesRegex(ValueError, 'Unknown metric'):
+            within_group_distances(self.table, self.metadata, 'site',
+                                   'euclidean')
+        with self.assertRaisesRegex(ValueError, "'body'"):
+            within_group_distances(self.table, self.metadata, 'body')
+
+
+class BlockDistancesTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        self.data = BlockDistances(['a', 'b', 'c', 'd', 'e'], ['g1', 'g2'],
+                                   [0, 3, 5], [0.1, 0.2, 0.3, 0.4])
+
+    def test_distance(self):
+        self.assertEqual(self.data.distance('a', 'c'), 0.2)
+        self.assertEqual(self.data.distance('c', 'b'), 0.3)
+        self.assertEqual(self.data.distance('e', 'd'), 0.4)
+        self.assertEqual(self.data.distance('d', 'd'), 0.)
+        self.assertTrue(np.isnan(self.data.distance('a', 'e')))
+
+    def test_invalid(self):
+        with self.assertRaisesRegex(ValueError, 'one offset per group'):
+            BlockDistances(['a', 'b'], ['g1'], [0, 1, 2], [])
+        with self.assertRaisesRegex(ValueError, 'do not span'):
+            BlockDistances(['a', 'b'], ['g1'], [0, 1], [])
+        with self.assertRaisesRegex(ValueError, 'Expected 1 distances'):
+            BlockDistances(['a', 'b'], ['g1'], [0, 2], [0.1, 0.2])
+
+    def test_round_trip(self):
+        ff = self.get_transformer(BlockDistances, BlockDistancesFormat)(
+            self.data)
+        ff.validate()
+        obs = self.get_transformer(BlockDistancesFormat, BlockDistances)(ff)
+        self.assertEqual(list(obs.ids), list(self.data.ids))
+        self.assertEqual(obs.groups, self.data.groups)
+        npt.assert_array_equal(obs.offsets, self.data.offsets)
+        npt.assert_array_equal(obs.distances, self.data.distances)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import unittest
+
+import biom
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pandas.testing as pdt
+import qiime2
+import scipy.sparse as ss
+from qiime2.plugin.testing import TestPluginBase
+from scipy.stats import f, fisher_exact
+
+from q2_american_gut import score_contaminants
+from q2_american_gut._decontam import frequency_scores, prevalence_scores
+from q2_american_gut._format import ContaminantScoresFormat
+
+
+class DecontamTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        n = 24
+        self.concentration = rng.uniform(0.5, 20, size=n)
+        counts = rng.poisson(50, size=(6, n)).astype(float)
+        # a contaminant is abundant where little DNA was extracted
+        counts[0] = 10 / self.concentration
+        counts[2, rng.rand(n) < 0.5] = 0
+        counts[4] = 0
+        counts[4, 3] = 7
+        counts[5] = 0
+        self.is_control = np.zeros(n, dtype=bool)
+        self.is_control[:5] = True
+        counts[1, 5:] = 0
+        counts[1, 5:8] = 3
+        self.counts = counts
+        self.samples = ['S%d' % i for i in range(n)]
+        self.table = biom.Table(counts, ['F%d' % i for i in range(6)],
+                                self.samples)
+        self.metadata = qiime2.Metadata(pd.DataFrame(
+            {'concentration': self.concentration,
+             'control': np.where(self.is_control, 'True', 'false'),
+             'plate': ['p1', 'p2'] * (n // 2)},
+            index=pd.Index(self.samples, name='sample-id')))
+
+    def _frequency(self, counts, concentration):
+        scores = []
+        relative = counts / np.where(counts.sum(axis=0), counts.sum(axis=0),
+                                     1)
+        for row in relative:
+            present = row > 0
+            if present.sum() < 2:
+                scores.append(np.nan)
+                continue
+            y = np.log(row[present])
+            shifted = y + np.log(concentration[present])
+            constant = ((y - y.mean()) ** 2).sum()
+            inverse = ((shifted - shifted.mean()) ** 2).sum()
+            scores.append(f.cdf(inverse / constant, present.sum() - 1,
+                                present.sum() - 1))
+        return np.array(scores)
+
+    def _prevalence(self, counts, is_control):
+        scores = []
+        for row in counts > 0:
+            if not row.any():
+                scores.append(np.nan)
+                continue
+            table = [[(row & is_control).sum(), (~row & is_control).sum()],
+                     [(row & ~is_control).sum(), (~row & ~is_control).sum()]]
+            scores.append(fisher_exact(table, alternative='greater')[1])
+        return np.array(scores)
+
+    def test_frequency_scores(self):
+        obs = frequency_scores(ss.csr_matrix(self.counts),
+                               self.concentration)
+        npt.assert_allclose(obs, self._frequency(self.counts,
+                                                 self.concentration))
+        self.assertLess(obs[0], 0.01)
+        self.assertTrue(np.isnan(obs[4:]).all())
+
+    def test_prevalence_scores(self):
+        obs = prevalence_scores(ss.csr_matrix(self.counts), self.is_control)
+        npt.assert_allclose(obs, self._prevalence(self.counts,
+                                                  self.is_control))
+        self.assertLess(obs[1], 0.01)
+        self.assertTrue(np.isnan(obs[5]))
+
+    def test_prevalence_without_controls(self):
+        obs = prevalence_scores(ss.csr_matrix(self.counts),
+                                np.zeros(24, dtype=bool))
+        self.assertTrue(np.isnan(obs).all())
+
+    def test_score_contaminants(self):
+        filtered, scores = score_contaminants(
+            self.table, self.metadata, 'concentration', 'control', 'true')
+        samples = ~self.is_control
+        npt.assert_allclose(scores['frequency-score'], self._frequency(
+            self.counts[:, samples], self.concentration[samples]))
+        npt.assert_allclose(scores['prevalence-score'],
+                            self._prevalence(self.counts, self.is_control))
+        npt.assert_allclose(scores['score'],
+                            np.fmin(scores['frequency-score'],
+                                    scores['prevalence-score']))
+        self.assertEqual(list(scores.index[scores['contaminant']]),
+                         ['F0', 'F1'])
+        self.assertEqual(list(filtered.ids(axis='observation')),
+                         ['F2', 'F3', 'F4', 'F5'])
+
+    def test_plates_keep_lowest_score(self):
+        _, scores = score_contaminants(self.table, self.metadata,
+                                       'concentration',
+                                       plate_column='plate')
+        plates = [np.arange(0, 24, 2), np.arange(1, 24, 2)]
+        per_plate = [self._frequency(self.counts[:, p],
+                                     self.concentration[p])
+                     for p in plates]
+        npt.assert_allclose(scores['frequency-score'],
+                            np.fmin(*per_plate))
+        self.assertTrue(scores['prevalence-score'].isnull().all())
+
+    def test_pool_matches_serial(self):
+        serial = score_contaminants(self.table, self.metadata,
+                                    'concentration', 'control',
+                                    plate_column='plate')[1]
+        pooled = score_contaminants(self.table, self.metadata,
+                                    'concentration', 'control',
+                                    plate_column='plate', n_jobs=2)[1]
+        pdt.assert_frame_equal(serial, pooled)
+
+    def test_no_columns(self):
+        with self.assertRaisesRegex(ValueError, 'must be given'):
+            score_contaminants(self.table, self.metadata)
+
+    def test_unknown_column(self):
+        with self.assertRaisesRegex(ValueError, "'dna'"):
+            score_contaminants(self.table, self.metadata, 'dna')
+
+    def test_round_trip(self):
+        _, scores = score_contaminants(self.table, self.metadata,
+                                       'concentration', 'control')
+        ff = self.get_transformer(pd.DataFrame, ContaminantScoresFormat)(
+            scores)
+        ff.validate()
+        back = self.get_transformer(ContaminantScoresFormat,
+                                    pd.DataFrame)(ff)
+        pdt.assert_frame_equal(back, scores, check_dtype=False)
+        md = self.get_transformer(ContaminantScoresFormat,
+                                  qiime2.Metadata)(ff)
+        self.assertEqual(list(md.to_dataframe()['contaminant'][:2]),
+                         ['True', 'True'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import unittest
+
+import biom
+import h5py
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import qiime2
+from qiime2.plugin.testing import TestPluginBase
+from q2_types.feature_table import BIOMV210Format
+
+from q2_american_gut import extract_samples
+from q2_american_gut._extract import read_samples
+from q2_american_gut._hdf5 import iter_sample_blocks, read_columns
+
+
+class ExtractTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        counts = rng.poisson(1, size=(6, 9)).astype(float)
+        counts[:, 4] = 0
+        counts[5] = 0
+        counts[5, 8] = 3
+        self.counts = counts
+        self.table = biom.Table(counts, ['F%d' % i for i in range(6)],
+                                ['S%d' % i for i in range(9)])
+        self.path = os.path.join(self.temp_dir.name, 'table.biom')
+        with h5py.File(self.path, 'w') as h5:
+            self.table.to_hdf5(h5, 'test')
+
+    def test_read_columns(self):
+        positions = [7, 2, 3, 2, 0]
+        with h5py.File(self.path, 'r') as h5:
+            obs = read_columns(h5, positions)
+        npt.assert_array_equal(obs.toarray(), self.counts[:, positions])
+
+    def test_read_columns_none(self):
+        with h5py.File(self.path, 'r') as h5:
+            self.assertEqual(read_columns(h5, []).shape, (6, 0))
+
+    def test_iter_sample_blocks(self):
+        with h5py.File(self.path, 'r') as h5:
+            blocks = list(iter_sample_blocks(h5, 4))
+        self.assertEqual([list(ids) for ids, _ in blocks],
+                         [['S0', 'S1', 'S2', 'S3'], ['S4', 'S5', 'S6', 'S7'],
+                          ['S8']])
+        npt.assert_array_equal(
+            np.hstack([block.toarray() for _, block in blocks]), self.counts)
+
+    def test_iter_sample_blocks_invalid(self):
+        with h5py.File(self.path, 'r') as h5:
+            with self.assertRaisesRegex(ValueError, 'positive'):
+                list(iter_sample_blocks(h5, 0))
+
+    def test_read_samples(self):
+        with h5py.File(self.path, 'r') as h5:
+            obs = read_samples(h5, ['S8', 'S1'], False)
+        self.assertEqual(list(obs.ids()), ['S8', 'S1'])
+        npt.assert_array_equal(obs.matrix_data.toarray(),
+                               self.counts[:, [8, 1]])
+
+    def test_read_samples_filter_empty_features(self):
+        with h5py.File(self.path, 'r') as h5:
+            obs = read_samples(h5, ['S4'], True)
+            self.assertEqual(obs.shape, (0, 1))
+            obs = read_samples(h5, ['S4', 'S8'], True)
+        self.assertIn('F5', obs.ids(axis='observation'))
+        self.assertTrue((obs.matrix_data.getnnz(axis=1) > 0).all())
+
+    def test_read_samples_missing(self):
+        with h5py.File(self.path, 'r') as h5:
+            with self.assertRaisesRegex(ValueError, '2 samples.*S10, S11'):
+                read_samples(h5, ['S1', 'S10', 'S11'])
+
+    def test_extract_samples(self):
+        metadata = qiime2.Metadata(pd.DataFrame(
+            index=pd.Index(['S3', 'S0'], name='sample-id')))
+        obs = extract_samples(BIOMV210Format(self.path, mode='r'), metadata)
+        exp = self.table.sort_order(['S3', 'S0'])
+        exp = exp.filter(lambda v, i, md: v.sum() > 0, axis='observation',
+                         inplace=False)
+        self.assertEqual(obs, exp)
+
+
+if __name__ == '__main__':
+    unittest.main()
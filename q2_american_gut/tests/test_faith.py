@@ -0,0 +1,73 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import io
+import unittest
+
+import biom
+import numpy as np
+import numpy.testing as npt
+import pandas.testing as pdt
+import skbio
+from qiime2.plugin.testing import TestPluginBase
+from skbio.diversity.alpha import faith_pd as skbio_faith_pd
+
+from q2_american_gut import ArrayTree, PackedPresence, faith_pd, pack_presence
+from q2_american_gut.tests.test_tree import NEWICK
+
+
+class FaithPDTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        self.skbio_tree = skbio.TreeNode.read(io.StringIO(NEWICK))
+        self.tree = ArrayTree.from_treenode(self.skbio_tree)
+        rng = np.random.RandomState(0)
+        # the tips but h, and 21 samples of which two are empty
+        self.features = list('gabfcde')
+        dense = rng.poisson(1, size=(7, 21)).astype(float)
+        dense[rng.rand(7, 21) < 0.5] = 0
+        dense[:, [3, 17]] = 0
+        self.dense = dense
+        self.samples = ['S%d' % i for i in range(21)]
+        self.table = biom.Table(dense, self.features, self.samples)
+
+    def _expected(self):
+        return [skbio_faith_pd(self.dense[:, i].astype(int), self.features,
+                               self.skbio_tree)
+                for i in range(len(self.samples))]
+
+    def test_matches_skbio(self):
+        obs = faith_pd(pack_presence(self.table), self.tree)
+        self.assertEqual(list(obs.index), self.samples)
+        self.assertEqual(obs.index.name, 'sample-id')
+        self.assertEqual(obs.name, 'faith_pd')
+        npt.assert_allclose(obs, self._expected())
+        self.assertEqual(obs['S3'], 0.)
+
+    def test_blocks_and_threads(self):
+        exp = faith_pd(pack_presence(self.table), self.tree)
+        # a single byte of samples at a time
+        for n_jobs in (1, 3):
+            obs = faith_pd(pack_presence(self.table), self.tree,
+                           max_memory_mb=0, n_jobs=n_jobs)
+            pdt.assert_series_equal(obs, exp)
+
+    def test_unknown_features(self):
+        table = biom.Table(np.ones((2, 2)), ['a', 'x'], ['S0', 'S1'])
+        with self.assertRaisesRegex(ValueError, '1 features.*x'):
+            faith_pd(pack_presence(table), self.tree)
+
+    def test_no_samples(self):
+        packed = PackedPresence(np.zeros((2, 0), dtype=np.uint8), ['a', 'b'],
+                                [])
+        self.assertEqual(len(faith_pd(packed, self.tree)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import hashlib
+import unittest
+from unittest import mock
+
+import biom
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_american_gut import fingerprint_table
+from q2_american_gut._fingerprint import array_fingerprint, table_fingerprint
+from q2_american_gut._format import TableFingerprintFormat
+
+
+class ArrayFingerprintTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        self.array = np.arange(1000, dtype=np.float64)
+
+    def test_deterministic(self):
+        a, hashed = array_fingerprint([self.array])
+        b, _ = array_fingerprint([self.array.copy()])
+        self.assertEqual(a, b)
+        self.assertEqual(hashed, self.array.nbytes)
+
+    def test_dtype_and_shape(self):
+        key, _ = array_fingerprint([self.array])
+        self.assertNotEqual(
+            key, array_fingerprint([self.array.view(np.int64)])[0])
+        self.assertNotEqual(
+            key, array_fingerprint([self.array.reshape(10, 100)])[0])
+
+    def test_non_contiguous(self):
+        strided = np.arange(2000, dtype=np.float64)[::2]
+        self.assertEqual(array_fingerprint([strided])[0],
+                         array_fingerprint([strided.copy()])[0])
+
+    def test_sampled_blocks(self):
+        key, hashed = array_fingerprint([self.array], block_size=800,
+                                        max_blocks=3)
+        self.assertEqual(hashed, 3 * 800)
+        changed = self.array.copy()
+        # the second of ten blocks is not among the three sampled
+        changed[150] += 1
+        self.assertEqual(array_fingerprint([changed], 800, 3)[0], key)
+        changed[-1] += 1
+        self.assertNotEqual(array_fingerprint([changed], 800, 3)[0], key)
+
+    def test_fallback_hash(self):
+        with mock.patch('q2_american_gut._fingerprint.xxhash', None):
+            key, _ = array_fingerprint([self.array])
+        algorithm, digest = key.split(':')
+        self.assertEqual(algorithm, 'sha1')
+        exp = hashlib.sha1(b'<f8(1000,)')
+        exp.update(self.array.tobytes())
+        self.assertEqual(digest, exp.hexdigest())
+
+    def test_invalid_block_size(self):
+        with self.assertRaisesRegex(ValueError, 'positive'):
+            array_fingerprint([self.array], block_size=0)
+
+
+class TableFingerprintTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        self.counts = rng.poisson(2, size=(10, 6)).astype(float)
+        self.table = biom.Table(self.counts, ['F%d' % i for i in range(10)],
+                                ['S%d' % i for i in range(6)])
+
+    def test_equal_tables(self):
+        self.assertEqual(table_fingerprint(self.table)[0],
+                         table_fingerprint(self.table.copy())[0])
+
+    def test_changes(self):
+        key, _ = table_fingerprint(self.table)
+        counts = self.counts.copy()
+        counts[3, 2] += 1
+        changed = biom.Table(counts, self.table.ids(axis='observation'),
+                             self.table.ids())
+        self.assertNotEqual(table_fingerprint(changed)[0], key)
+        renamed = biom.Table(self.counts,
+                             self.table.ids(axis='observation'),
+                             ['S%d' % i for i in range(1, 7)])
+        self.assertNotEqual(table_fingerprint(renamed)[0], key)
+
+    def test_fingerprint_table(self):
+        obs = fingerprint_table(self.table, max_blocks=0)
+        self.assertEqual(obs.loc['fingerprint', 'value'],
+                         table_fingerprint(self.table, max_blocks=None)[0])
+        self.assertEqual(obs.loc['n-samples', 'value'], '6')
+        self.assertEqual(obs.loc['n-nonzero', 'value'],
+                         str(self.table.matrix_data.nnz))
+        self.assertEqual(obs.index.name, 'field')
+
+    def test_round_trip(self):
+        obs = fingerprint_table(self.table)
+        ff = self.get_transformer(pd.DataFrame, TableFingerprintFormat)(obs)
+        ff.validate()
+        back = self.get_transformer(TableFingerprintFormat, pd.DataFrame)(ff)
+        pdt.assert_frame_equal(back, obs)
+
+
+if __name__ == '__main__':
+    unittest.main()
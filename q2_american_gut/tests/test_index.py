@@ -0,0 +1,162 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import io
+import os
+import unittest
+import uuid
+import zipfile
+
+import biom
+import h5py
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pandas.testing as pdt
+import qiime2
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_american_gut import (SampleArtifactIndex, index_samples,
+                             fetch_samples)
+from q2_american_gut._format import SampleIndexDirFmt
+from q2_american_gut._index import member_range, open_table, artifact_type
+
+
+def write_qza(path, table=None, semantic_type='FeatureTable[Frequency]',
+              compression=zipfile.ZIP_DEFLATED):
+    """A minimal artifact holding a table, enough for the index to read"""
+    artifact_id = str(uuid.uuid4())
+    with zipfile.ZipFile(path, 'w', compression=compression) as zf:
+        zf.writestr('%s/metadata.yaml' % artifact_id,
+                    'uuid: %s\ntype: %s\nformat: BIOMV210DirFmt\n'
+                    % (artifact_id, semantic_type))
+        if table is not None:
+            with io.BytesIO() as buf:
+                with h5py.File(buf, 'w') as h5:
+                    table.to_hdf5(h5, 'test')
+                zf.writestr('%s/data/feature-table.biom' % artifact_id,
+                            buf.getvalue())
+    return artifact_id
+
+
+class IndexTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        self.dir = os.path.join(self.temp_dir.name, 'artifacts')
+        os.makedirs(self.dir)
+        self.a = biom.Table(np.array([[1., 0., 2.], [0., 3., 4.]]),
+                            ['F0', 'F1'], ['S0', 'S1', 'S2'])
+        self.b = biom.Table(np.array([[5., 6.], [7., 0.]]),
+                            ['F1', 'F2'], ['S3', 'S4'])
+        self.uuid_a = write_qza(os.path.join(self.dir, 'a.qza'), self.a)
+        self.uuid_b = write_qza(os.path.join(self.dir, 'b.qza'), self.b,
+                                compression=zipfile.ZIP_STORED)
+        self.uuid_tree = write_qza(os.path.join(self.dir, 'tree.qza'),
+                                   semantic_type='Phylogeny[Rooted]')
+
+    def test_index(self):
+        index = index_samples(self.dir)
+        self.assertEqual(len(index), 5)
+        self.assertEqual(index.locate('S1'), [(self.uuid_a, 1)])
+        self.assertEqual(index.locate('S4'), [(self.uuid_b, 1)])
+        self.assertEqual(index.locate('missing'), [])
+        self.assertEqual(index.artifacts.loc[self.uuid_a, 'offset'], -1)
+        self.assertGreater(index.artifacts.loc[self.uuid_b, 'offset'], 0)
+        self.assertEqual(index.artifacts.loc[self.uuid_tree, 'type'],
+                         'Phylogeny[Rooted]')
+        self.assertEqual(index.artifacts.loc[self.uuid_tree, 'n-samples'], 0)
+
+    def test_fetch_across_artifacts(self):
+        index = index_samples(self.dir)
+        samples = qiime2.Metadata(pd.DataFrame(
+            index=pd.Index(['S4', 'S0', 'S2'], name='sample-id')))
+        obs = fetch_samples(index, samples)
+        self.assertEqual(list(obs.ids()), ['S4', 'S0', 'S2'])
+        self.assertEqual(list(obs.ids(axis='observation')),
+                         ['F1', 'F2', 'F0'])
+        npt.assert_array_equal(obs.matrix_data.toarray(),
+                               [[6., 0., 4.], [0., 0., 0.], [0., 1., 2.]])
+
+    def test_fetch_missing(self):
+        index = index_samples(self.dir)
+        with self.assertRaisesRegex(KeyError, '1 samples'):
+            index.fetch(['S0', 'S9'])
+
+    def test_fetch_first_indexed_duplicate(self):
+        write_qza(os.path.join(self.dir, 'c.qza'),
+                  biom.Table(np.array([[9.]]), ['F0'], ['S0']))
+        index = index_samples(self.dir)
+        self.assertEqual(len(index.locate('S0')), 2)
+        obs = index.fetch(['S0'])
+        npt.assert_array_equal(obs.matrix_data.toarray(), [[1.], [0.]])
+
+    def test_update_only_reads_new_artifacts(self):
+        index = SampleArtifactIndex()
+        self.assertEqual(index.update(self.dir), 3)
+        self.assertEqual(index.update(self.dir), 0)
+        write_qza(os.path.join(self.dir, 'c.qza'),
+                  biom.Table(np.array([[9.]]), ['F0'], ['S5']))
+        self.assertEqual(index.update(self.dir), 1)
+        self.assertEqual(len(index), 6)
+
+    def test_update_drops_removed(self):
+        index = index_samples(self.dir)
+        os.remove(os.path.join(self.dir, 'a.qza'))
+        index.update(self.dir)
+        self.assertEqual(sorted(index.samples.index), ['S3', 'S4'])
+        self.assertNotIn(self.uuid_a, index.artifacts.index)
+
+    def test_update_moved(self):
+        index = index_samples(self.dir)
+        moved = os.path.join(self.temp_dir.name, 'moved')
+        os.rename(self.dir, moved)
+        self.assertEqual(index.update(moved), 0)
+        self.assertEqual(index.fetch(['S3']).shape, (2, 1))
+
+    def test_member_range(self):
+        path = os.path.join(self.dir, 'b.qza')
+        member = '%s/data/feature-table.biom' % self.uuid_b
+        with zipfile.ZipFile(path) as zf:
+            offset, size = member_range(path, zf, member)
+            expected = zf.read(member)
+            self.assertEqual(artifact_type(zf), 'FeatureTable[Frequency]')
+        with open(path, 'rb') as fh:
+            fh.seek(offset)
+            self.assertEqual(fh.read(size), expected)
+
+        path = os.path.join(self.dir, 'a.qza')
+        member = '%s/data/feature-table.biom' % self.uuid_a
+        with zipfile.ZipFile(path) as zf:
+            self.assertEqual(member_range(path, zf, member)[0], -1)
+
+    def test_open_table(self):
+        path = os.path.join(self.dir, 'b.qza')
+        member = '%s/data/feature-table.biom' % self.uuid_b
+        with zipfile.ZipFile(path) as zf:
+            offset, size = member_range(path, zf, member)
+        with open_table(path, offset, size) as stored:
+            self.assertEqual(biom.Table.from_hdf5(stored), self.b)
+        with open_table(path) as decompressed:
+            self.assertEqual(biom.Table.from_hdf5(decompressed), self.b)
+
+    def test_round_trip(self):
+        index = index_samples(self.dir)
+        ff = self.get_transformer(SampleArtifactIndex, SampleIndexDirFmt)(
+            index)
+        obs = self.get_transformer(SampleIndexDirFmt, SampleArtifactIndex)(
+            ff)
+        pdt.assert_frame_equal(obs.samples, index.samples,
+                               check_dtype=False)
+        pdt.assert_frame_equal(obs.artifacts, index.artifacts,
+                               check_dtype=False)
+        self.assertEqual(obs.fetch(['S1']), index.fetch(['S1']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import unittest
+
+import biom
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pandas.testing as pdt
+import qiime2
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_american_gut import well_leakage
+from q2_american_gut._format import WellLeakageFormat
+from q2_american_gut._leakage import parse_wells, well_adjacency
+
+
+class WellTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def test_parse_wells(self):
+        rows, columns = parse_wells(['A1', 'h12', ' B 03 ', 'AA2'])
+        npt.assert_array_equal(rows, [0, 7, 1, 26])
+        npt.assert_array_equal(columns, [0, 11, 2, 1])
+
+    def test_parse_invalid_well(self):
+        with self.assertRaisesRegex(ValueError, "'12A'"):
+            parse_wells(['A1', '12A'])
+
+    def test_adjacency(self):
+        # B2 surrounded by A1, A2, B1 and C3
+        rows, columns = parse_wells(['B2', 'A1', 'A2', 'B1', 'C3', 'D4'])
+        adjacency = well_adjacency(rows, columns).toarray()
+        diagonal = 2 ** -.5
+        npt.assert_allclose(adjacency[0], [0, diagonal, 1, 1, diagonal, 0])
+        npt.assert_allclose(adjacency, adjacency.T)
+        npt.assert_allclose(adjacency[5], [0, 0, 0, 0, diagonal, 0])
+
+    def test_shared_well(self):
+        rows, columns = parse_wells(['A1', 'B1', 'A01'])
+        with self.assertRaisesRegex(ValueError, 'share a well'):
+            well_adjacency(rows, columns)
+
+
+class WellLeakageTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        self.wells = ['A1', 'A2', 'A3', 'B1', 'B2', 'B3', 'C1', 'C2', 'A1',
+                      'A2', 'H12']
+        self.plates = ['p1'] * 8 + ['p2'] * 2 + [np.nan]
+        self.samples = ['S%d' % i for i in range(11)]
+        counts = rng.poisson(3, size=(7, 11)).astype(float)
+        # A2 leaks into its neighbors on the first plate
+        counts[6, [0, 1, 2, 3, 4, 5]] = [40, 80, 40, 40, 40, 40]
+        self.counts = counts
+        self.table = biom.Table(counts, ['F%d' % i for i in range(7)],
+                                self.samples)
+        self.metadata = qiime2.Metadata(pd.DataFrame(
+            {'plate': self.plates, 'well': self.wells},
+            index=pd.Index(self.samples, name='sample-id')))
+
+    def _expected(self, on_plate):
+        profiles = self.counts[:, on_plate].T
+        profiles = profiles / np.linalg.norm(profiles, axis=1)[:, None]
+        similarity = profiles @ profiles.T
+        rows, columns = parse_wells(np.asarray(self.wells)[on_plate])
+        neighbor, plate = [], []
+        for i in range(len(on_plate)):
+            dr, dc = np.abs(rows - rows[i]), np.abs(columns - columns[i])
+            adjacent = (np.maximum(dr, dc) == 1)
+            weights = np.where(dr + dc == 1, 1., 2 ** -.5)[adjacent]
+            neighbor.append((similarity[i, adjacent] * weights).sum() /
+                            weights.sum() if adjacent.any() else np.nan)
+            background = ~adjacent
+            background[i] = False
+            plate.append(similarity[i, background].mean()
+                         if background.any() else np.nan)
+        return np.array(neighbor), np.array(plate)
+
+    def test_matches_pairwise(self):
+        obs = well_leakage(self.table, self.metadata, 'plate', 'well')
+        self.assertEqual(list(obs.index), self.samples[:10])
+        neighbor, plate = self._expected(np.arange(8))
+        npt.assert_allclose(obs['neighbor-similarity'][:8], neighbor)
+        npt.assert_allclose(obs['plate-similarity'][:8], plate)
+        npt.assert_allclose(obs['excess'], obs['neighbor-similarity'] -
+                            obs['plate-similarity'])
+        self.assertEqual(list(obs['n-neighbors'][:3]), [3, 5, 3])
+
+    def test_plate_without_background(self):
+        obs = well_leakage(self.table, self.metadata, 'plate', 'well')
+        # the two wells of the second plate are each other's only neighbor
+        self.assertEqual(list(obs['n-neighbors'][8:]), [1, 1])
+        self.assertTrue(obs['plate-similarity'][8:].isnull().all())
+        self.assertFalse(obs['flagged'][8:].any())
+
+    def test_pool_matches_serial(self):
+        serial = well_leakage(self.table, self.metadata, 'plate', 'well')
+        pooled = well_leakage(self.table, self.metadata, 'plate', 'well',
+                              n_jobs=2)
+        pdt.assert_frame_equal(serial, pooled)
+
+    def test_no_wells(self):
+        metadata = qiime2.Metadata(pd.DataFrame(
+            {'plate': [np.nan] * 11, 'well': self.wells},
+            index=pd.Index(self.samples, name='sample-id')))
+        with self.assertRaisesRegex(ValueError, 'No sample'):
+            well_leakage(self.table, metadata, 'plate', 'well')
+
+    def test_unknown_column(self):
+        with self.assertRaisesRegex(ValueError, "'row'"):
+            well_leakage(self.table, self.metadata, 'plate', 'row')
+
+    def test_round_trip(self):
+        obs = well_leakage(self.table, self.metadata, 'plate', 'well')
+        ff = self.get_transformer(pd.DataFrame, WellLeakageFormat)(obs)
+        ff.validate()
+        back = self.get_transformer(WellLeakageFormat, pd.DataFrame)(ff)
+        pdt.assert_frame_equal(back, obs, check_dtype=False)
+        md = self.get_transformer(WellLeakageFormat, qiime2.Metadata)(ff)
+        self.assertEqual(list(md.to_dataframe()['well'][:2]), ['A1', 'A2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import asyncio
+import os
+import unittest
+
+import biom
+import h5py
+import numpy as np
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_american_gut._loader import TableLoader, read_table
+from q2_american_gut.tests.test_index import write_qza
+
+
+class LoaderTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        self.tables = {}
+        for i in range(5):
+            table = biom.Table(np.array([[float(i), 1.], [2., 0.]]),
+                               ['F0', 'F1'], ['S%d.0' % i, 'S%d.1' % i])
+            path = os.path.join(self.temp_dir.name, 'table-%d.qza' % i)
+            write_qza(path, table)
+            self.tables[path] = table
+
+    def test_read_table(self):
+        path = sorted(self.tables)[2]
+        self.assertEqual(read_table(path), self.tables[path])
+
+        biom_path = os.path.join(self.temp_dir.name, 'table.biom')
+        with h5py.File(biom_path, 'w') as h5:
+            self.tables[path].to_hdf5(h5, 'test')
+        self.assertEqual(read_table(biom_path), self.tables[path])
+
+    def test_iterate(self):
+        loaded = dict(TableLoader(self.tables, max_concurrency=2))
+        self.assertEqual(loaded, self.tables)
+
+    def test_async_iterate(self):
+        async def load():
+            loaded = []
+            async for path, table in TableLoader(self.tables,
+                                                 max_concurrency=3):
+                loaded.append((path, table))
+            return loaded
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loaded = dict(loop.run_until_complete(load()))
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+        self.assertEqual(loaded, self.tables)
+
+    def test_error_raised(self):
+        missing = os.path.join(self.temp_dir.name, 'missing.qza')
+        with self.assertRaises(OSError):
+            list(TableLoader(list(self.tables) + [missing]))
+
+    def test_empty(self):
+        self.assertEqual(list(TableLoader([])), [])
+
+    def test_invalid_concurrency(self):
+        with self.assertRaisesRegex(ValueError, 'positive'):
+            TableLoader(self.tables, max_concurrency=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import unittest
+
+import biom
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pandas.testing as pdt
+import qiime2
+import scipy.sparse as ss
+from qiime2.plugin.testing import TestPluginBase
+from scipy.spatial.distance import braycurtis, jaccard
+
+from q2_american_gut import host_trajectories
+from q2_american_gut._format import (ConsecutiveDistancesFormat,
+                                     HostVolatilityFormat)
+from q2_american_gut._longitudinal import paired_distances
+
+
+class PairedDistancesTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        dense = rng.poisson(2, size=(6, 10)).astype(float)
+        dense[rng.rand(6, 10) < 0.4] = 0
+        self.dense = dense
+        self.a = np.array([0, 1, 2, 5, 3])
+        self.b = np.array([1, 4, 2, 0, 5])
+
+    def test_braycurtis(self):
+        obs = paired_distances(ss.csr_matrix(self.dense), self.a, self.b)
+        exp = [braycurtis(self.dense[i], self.dense[j])
+               for i, j in zip(self.a, self.b)]
+        npt.assert_allclose(obs, exp)
+
+    def test_jaccard(self):
+        obs = paired_distances(ss.csr_matrix(self.dense), self.a, self.b,
+                               'jaccard')
+        exp = [jaccard(self.dense[i] > 0, self.dense[j] > 0)
+               for i, j in zip(self.a, self.b)]
+        npt.assert_allclose(obs, exp)
+
+    def test_empty_samples(self):
+        matrix = ss.csr_matrix(np.array([[0., 0.], [0., 0.], [1., 0.]]))
+        npt.assert_array_equal(
+            paired_distances(matrix, [0, 0], [1, 2], 'jaccard'), [0., 1.])
+        obs = paired_distances(matrix, [0, 0], [1, 2])
+        self.assertTrue(np.isnan(obs[0]))
+        self.assertEqual(obs[1], 1.)
+
+    def test_unknown_metric(self):
+        with self.assertRaisesRegex(ValueError, 'Unknown metric'):
+            paired_distances(ss.csr_matrix(self.dense), self.a, self.b,
+                             'euclidean')
+
+
+class HostTrajectoriesTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        self.counts = rng.poisson(4, size=(5, 9)).astype(float)
+        self.samples = ['S%d' % i for i in range(9)]
+        self.table = biom.Table(self.counts, ['F%d' % i for i in range(5)],
+                                self.samples)
+        self.metadata = qiime2.Metadata(pd.DataFrame(
+            {'host': ['h1', 'h2', 'h1', 'h1', 'h2', 'h3', 'h2', np.nan,
+                      'h4'],
+             'day': ['5', '1', '1', '2', '3', '1', 'unknown', '2', '7']},
+            index=pd.Index(self.samples, name='sample-id')))
+
+    def test_trajectories(self):
+        pairs, volatility = host_trajectories(self.table, self.metadata,
+                                              'host', 'day')
+        self.assertEqual(list(pairs.index), ['h1', 'h1', 'h2'])
+        self.assertEqual(list(pairs['sample-a']), ['S2', 'S3', 'S1'])
+        self.assertEqual(list(pairs['sample-b']), ['S3', 'S0', 'S4'])
+        exp = [braycurtis(self.counts[:, i], self.counts[:, j])
+               for i, j in ((2, 3), (3, 0), (1, 4))]
+        npt.assert_allclose(pairs['distance'], exp)
+
+        # hosts with one timepoint have no volatility
+        self.assertEqual(list(volatility.index), ['h1', 'h2'])
+        h1 = volatility.loc['h1']
+        self.assertEqual(h1['n-timepoints'], 3)
+        self.assertEqual(h1['duration'], 4)
+        self.assertAlmostEqual(h1['mean-distance'], np.mean(exp[:2]))
+        self.assertAlmostEqual(h1['sd-distance'], np.std(exp[:2], ddof=1))
+        self.assertAlmostEqual(h1['max-distance'], max(exp[:2]))
+        self.assertAlmostEqual(h1['distance-per-time'], sum(exp[:2]) / 4)
+        self.assertTrue(np.isnan(volatility.loc['h2', 'sd-distance']))
+
+    def test_empty_samples_ignored(self):
+        self.counts[:, 3] = 0
+        table = biom.Table(self.counts, ['F%d' % i for i in range(5)],
+                           self.samples)
+        pairs, volatility = host_trajectories(table, self.metadata, 'host',
+                                              'day')
+        self.assertEqual(list(pairs['sample-a']), ['S2', 'S1'])
+        self.assertEqual(list(pairs['sample-b']), ['S0', 'S4'])
+        self.assertFalse(volatility.isnull().any().drop('sd-distance').any())
+        self.assertEqual(volatility.loc['h1', 'n-timepoints'], 2)
+
+    def test_no_trajectories(self):
+        metadata = qiime2.Metadata(pd.DataFrame(
+            {'host': ['h%d' % i for i in range(9)], 'day': ['1'] * 9},
+            index=pd.Index(self.samples, name='sample-id')))
+        with self.assertRaisesRegex(ValueError, 'more than one timepoint'):
+            host_trajectories(self.table, metadata, 'host', 'day')
+
+    def test_unknown_column(self):
+        with self.assertRaisesRegex(ValueError, "'visit'"):
+            host_trajectories(self.table, self.metadata, 'host', 'visit')
+
+    def test_round_trip(self):
+        pairs, volatility = host_trajectories(self.table, self.metadata,
+                                              'host', 'day', 'jaccard')
+        ff = self.get_transformer(pd.DataFrame, ConsecutiveDistancesFormat)(
+            pairs)
+        ff.validate()
+        back = self.get_transformer(ConsecutiveDistancesFormat,
+                                    pd.DataFrame)(ff)
+        pdt.assert_frame_equal(back, pairs, check_dtype=False)
+
+        ff = self.get_transformer(pd.DataFrame, HostVolatilityFormat)(
+            volatility)
+        ff.validate()
+        back = self.get_transformer(HostVolatilityFormat, pd.DataFrame)(ff)
+        pdt.assert_frame_equal(back, volatility, check_dtype=False)
+
+    def test_volatility_as_metadata(self):
+        _, volatility = host_trajectories(self.table, self.metadata, 'host',
+                                          'day')
+        ff = self.get_transformer(pd.DataFrame, HostVolatilityFormat)(
+            volatility)
+        md = self.get_transformer(HostVolatilityFormat, qiime2.Metadata)(ff)
+        df = md.to_dataframe()
+        self.assertEqual(df.index.name, 'id')
+        self.assertEqual(list(df.index), ['h1', 'h2'])
+        self.assertEqual(list(df.columns), list(volatility.columns))
+
+
+if __name__ == '__main__':
+    unittest.main()
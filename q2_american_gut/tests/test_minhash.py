@@ -0,0 +1,151 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import unittest
+from unittest import mock
+
+import biom
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pandas.testing as pdt
+import scipy.sparse as ss
+from qiime2.plugin.testing import TestPluginBase
+from scipy.spatial.distance import pdist, squareform
+
+from q2_american_gut import similar_pairs
+from q2_american_gut import _minhash
+from q2_american_gut._format import SimilarSamplePairsFormat
+from q2_american_gut._minhash import lsh_candidates, minhash_signatures
+
+
+class MinHashTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        dense = (rng.rand(12, 200) < 0.3).astype(float)
+        # a near copy of the first sample, and an empty sample
+        dense[1] = dense[0]
+        dense[1, :10] = 1 - dense[1, :10]
+        dense[5] = 0
+        self.dense = dense
+        self.jaccard = 1 - squareform(pdist(dense[[0, 1, 2, 3]] > 0,
+                                            'jaccard'))
+
+    def test_signatures_estimate_jaccard(self):
+        signatures = minhash_signatures(ss.csr_matrix(self.dense), 2048)
+        self.assertEqual(signatures.shape, (12, 2048))
+        self.assertEqual(signatures.dtype, np.uint64)
+        for i in range(4):
+            for j in range(i + 1, 4):
+                estimate = (signatures[i] == signatures[j]).mean()
+                self.assertAlmostEqual(estimate, self.jaccard[i, j],
+                                       delta=0.05)
+
+    def test_empty_rows(self):
+        signatures = minhash_signatures(ss.csr_matrix(self.dense))
+        self.assertTrue((signatures[5] == _minhash._EMPTY).all())
+        self.assertFalse((signatures[0] == _minhash._EMPTY).any())
+
+    def test_blocks_match(self):
+        matrix = ss.csr_matrix(self.dense)
+        exp = minhash_signatures(matrix, 64, seed=3)
+        with mock.patch.object(_minhash, '_BLOCK_CELLS', 1):
+            npt.assert_array_equal(minhash_signatures(matrix, 64, seed=3),
+                                   exp)
+
+    def test_seed(self):
+        matrix = ss.csr_matrix(self.dense)
+        npt.assert_array_equal(minhash_signatures(matrix, seed=1),
+                               minhash_signatures(matrix, seed=1))
+        self.assertFalse(np.array_equal(minhash_signatures(matrix, seed=1),
+                                        minhash_signatures(matrix, seed=2)))
+
+    def test_candidates(self):
+        signatures = minhash_signatures(ss.csr_matrix(self.dense), 128)
+        candidates = lsh_candidates(signatures, 32)
+        self.assertIn([0, 1], candidates.tolist())
+        self.assertNotIn(5, candidates)
+        self.assertTrue((candidates[:, 0] < candidates[:, 1]).all())
+        self.assertEqual(len(np.unique(candidates, axis=0)),
+                         len(candidates))
+
+    def test_duplicates_over_bucket_size(self):
+        signatures = np.zeros((4, 4), dtype=np.uint64)
+        self.assertEqual(len(lsh_candidates(signatures, 2)), 6)
+        self.assertEqual(len(lsh_candidates(signatures, 2, 3)), 0)
+
+    def test_no_candidates(self):
+        signatures = np.arange(8, dtype=np.uint64).reshape(2, 4)
+        self.assertEqual(lsh_candidates(signatures, 2).shape, (0, 2))
+
+    def test_bands_must_divide(self):
+        signatures = np.zeros((2, 10), dtype=np.uint64)
+        with self.assertRaisesRegex(ValueError, '10 hashes.*3 bands'):
+            lsh_candidates(signatures, 3)
+
+
+class SimilarPairsTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(1)
+        dense = rng.poisson(1, size=(20, 40)).astype(float)
+        # households of samples sharing most of their features
+        dense[:, 1] = dense[:, 0]
+        dense[:3, 1] = 0
+        dense[:, 7] = dense[:, 6] * 2
+        dense[:, 9] = 0
+        self.dense = dense
+        self.samples = ['S%d' % i for i in range(40)]
+        self.table = biom.Table(dense, ['F%d' % i for i in range(20)],
+                                self.samples)
+
+    def test_matches_pdist(self):
+        # a single row per band misses a pair of similarity s with
+        # probability (1 - s) ** 128
+        obs = similar_pairs(self.table, 0.6, n_hashes=128, bands=128)
+        similarity = 1 - squareform(pdist(self.dense.T > 0, 'jaccard'))
+        i, j = np.triu_indices(40, k=1)
+        keep = similarity[i, j] >= 0.6
+        exp = sorted(zip(np.asarray(self.samples)[i[keep]],
+                         np.asarray(self.samples)[j[keep]]))
+        self.assertIn(('S0', 'S1'), exp)
+        self.assertIn(('S6', 'S7'), exp)
+        self.assertEqual(sorted(zip(obs.index, obs['sample-b'])), exp)
+
+        lookup = {s: n for n, s in enumerate(self.samples)}
+        a = [lookup[s] for s in obs.index]
+        b = [lookup[s] for s in obs['sample-b']]
+        npt.assert_allclose(obs['similarity'], similarity[a, b])
+        self.assertTrue(obs['similarity'].is_monotonic_decreasing)
+
+    def test_no_pairs(self):
+        obs = similar_pairs(self.table, 1.)
+        self.assertEqual(list(obs.index), ['S6'])
+        obs = similar_pairs(biom.Table(np.eye(3), ['F0', 'F1', 'F2'],
+                                       ['S0', 'S1', 'S2']))
+        self.assertEqual(len(obs), 0)
+        self.assertEqual(list(obs.columns), ['sample-b',
+                                             'estimated-similarity',
+                                             'similarity'])
+
+    def test_round_trip(self):
+        obs = similar_pairs(self.table, 0.6, bands=64)
+        ff = self.get_transformer(pd.DataFrame, SimilarSamplePairsFormat)(
+            obs)
+        ff.validate()
+        back = self.get_transformer(SimilarSamplePairsFormat,
+                                    pd.DataFrame)(ff)
+        pdt.assert_frame_equal(back, obs, check_dtype=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
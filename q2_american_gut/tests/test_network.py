@@ -0,0 +1,108 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import unittest
+
+import biom
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pandas.testing as pdt
+from qiime2.plugin.testing import TestPluginBase
+from scipy.stats import spearmanr
+
+from q2_american_gut import feature_network
+from q2_american_gut._format import FeatureNetworkFormat
+
+
+class FeatureNetworkTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        counts = rng.poisson(4, size=(9, 25)).astype(float)
+        counts[rng.rand(9, 25) < 0.3] = 0
+        counts[1] = counts[0] * 2 + rng.poisson(1, size=25)
+        counts[8] = 0
+        counts[8, 0] = 1
+        self.counts = counts
+        self.features = ['F%d' % i for i in range(9)]
+        self.table = biom.Table(counts, self.features,
+                                ['S%d' % i for i in range(25)])
+
+    def _pairs(self, network):
+        return {(a, b): v for a, b, v in
+                zip(network.index, network['feature-b'],
+                    network['association'])}
+
+    def _expected(self, matrix, threshold):
+        n = len(matrix)
+        return {(self.features[a], self.features[b]): matrix[a, b]
+                for a in range(n) for b in range(a + 1, n)
+                if abs(matrix[a, b]) >= threshold}
+
+    def test_spearman_matches_scipy(self):
+        obs = feature_network(self.table, 'spearman', threshold=0.2,
+                              min_prevalence=0.1)
+        kept = self.counts[:8]
+        exp = self._expected(spearmanr(kept, axis=1)[0], 0.2)
+        obs = self._pairs(obs)
+        self.assertEqual(sorted(obs), sorted(exp))
+        npt.assert_allclose([obs[p] for p in sorted(obs)],
+                            [exp[p] for p in sorted(exp)])
+
+    def test_rho(self):
+        obs = feature_network(self.table, 'rho', threshold=0.1,
+                              min_prevalence=0.1)
+        logged = np.log1p(self.counts[:8])
+        clr = logged - logged.mean(axis=0)
+        n = len(clr)
+        rho = np.array([[1 - np.var(clr[a] - clr[b]) /
+                         (np.var(clr[a]) + np.var(clr[b]))
+                         for b in range(n)] for a in range(n)])
+        exp = self._expected(rho, 0.1)
+        obs = self._pairs(obs)
+        self.assertEqual(sorted(obs), sorted(exp))
+        npt.assert_allclose([obs[p] for p in sorted(obs)],
+                            [exp[p] for p in sorted(exp)])
+
+    def test_blocks_and_threads(self):
+        whole = feature_network(self.table, threshold=0.2)
+        # a tiny memory cap makes every block a single row
+        blocked = feature_network(self.table, threshold=0.2,
+                                  max_memory_mb=0, n_jobs=2)
+        self.assertEqual(self._pairs(whole).keys(),
+                         self._pairs(blocked).keys())
+        npt.assert_allclose(sorted(self._pairs(whole).values()),
+                            sorted(self._pairs(blocked).values()))
+
+    def test_constant_feature_has_no_edges(self):
+        counts = self.counts.copy()
+        counts[2] = 3
+        table = biom.Table(counts, self.features, self.table.ids())
+        obs = feature_network(table, threshold=0., min_prevalence=0.5)
+        self.assertNotIn('F2', set(obs.index) | set(obs['feature-b']))
+
+    def test_too_few_features(self):
+        with self.assertRaisesRegex(ValueError, 'Fewer than two'):
+            feature_network(self.table, min_prevalence=1.1)
+
+    def test_unknown_method(self):
+        with self.assertRaisesRegex(ValueError, 'Unknown method'):
+            feature_network(self.table, 'pearson')
+
+    def test_round_trip(self):
+        obs = feature_network(self.table, threshold=0.2)
+        ff = self.get_transformer(pd.DataFrame, FeatureNetworkFormat)(obs)
+        ff.validate()
+        back = self.get_transformer(FeatureNetworkFormat, pd.DataFrame)(ff)
+        pdt.assert_frame_equal(back, obs, check_dtype=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import unittest
+
+import biom
+import numpy as np
+import numpy.testing as npt
+from qiime2.plugin.testing import TestPluginBase
+from scipy.spatial.distance import pdist, squareform
+
+from q2_american_gut import (PackedPresence, pack_presence,
+                             filter_prevalence, jaccard_distances)
+from q2_american_gut._format import PackedPresenceFormat
+
+
+class PackedPresenceTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        dense = rng.poisson(1, size=(20, 13)).astype(float)
+        dense[rng.rand(20, 13) < 0.4] = 0
+        # two empty samples and an absent feature
+        dense[:, [4, 9]] = 0
+        dense[3] = 0
+        self.dense = dense
+        self.features = ['F%d' % i for i in range(20)]
+        self.samples = ['S%d' % i for i in range(13)]
+        self.table = biom.Table(dense, self.features, self.samples)
+        self.packed = pack_presence(self.table)
+
+    def test_pack(self):
+        self.assertEqual(self.packed.shape, (20, 13))
+        self.assertEqual(self.packed.bits.shape, (20, 2))
+        npt.assert_array_equal(
+            np.unpackbits(self.packed.bits, axis=1)[:, :13], self.dense > 0)
+        self.assertEqual(list(self.packed.sample_ids), self.samples)
+
+    def test_to_table(self):
+        obs = self.packed.to_table()
+        self.assertEqual(list(obs.ids()), self.samples)
+        self.assertEqual(list(obs.ids(axis='observation')), self.features)
+        npt.assert_array_equal(obs.matrix_data.toarray(),
+                               (self.dense > 0).astype(float))
+
+    def test_invalid_shape(self):
+        with self.assertRaisesRegex(ValueError, r'\(2, 2\).*\(2, 1\)'):
+            PackedPresence(np.zeros((2, 1)), ['F0', 'F1'],
+                           ['S%d' % i for i in range(9)])
+
+    def test_prevalence(self):
+        npt.assert_array_equal(self.packed.prevalence(),
+                               (self.dense > 0).sum(axis=1))
+
+    def test_filter_prevalence(self):
+        prevalence = (self.dense > 0).mean(axis=1)
+        obs = filter_prevalence(self.packed, 0.2, 0.5)
+        keep = (prevalence >= 0.2) & (prevalence <= 0.5)
+        self.assertEqual(list(obs.feature_ids),
+                         list(np.asarray(self.features)[keep]))
+        npt.assert_array_equal(obs.bits, self.packed.bits[keep])
+
+    def test_filter_prevalence_removes_all(self):
+        with self.assertRaisesRegex(ValueError, 'No feature'):
+            filter_prevalence(self.packed, 0.95)
+
+    def test_jaccard_matches_pdist(self):
+        exp = squareform(pdist(self.dense.T > 0, 'jaccard'))
+        for max_memory_mb in (0, 256):
+            obs = jaccard_distances(self.packed, max_memory_mb)
+            self.assertEqual(list(obs.ids), self.samples)
+            npt.assert_allclose(obs.data, exp)
+        # two empty samples are identical
+        self.assertEqual(obs['S4', 'S9'], 0.)
+        self.assertEqual(obs['S4', 'S0'], 1.)
+
+    def test_jaccard_of_no_features(self):
+        packed = PackedPresence(np.zeros((0, 1), dtype=np.uint8), [],
+                                ['S0', 'S1'])
+        npt.assert_array_equal(jaccard_distances(packed).data,
+                               np.zeros((2, 2)))
+
+    def test_round_trip(self):
+        ff = self.get_transformer(PackedPresence, PackedPresenceFormat)(
+            self.packed)
+        ff.validate()
+        obs = self.get_transformer(PackedPresenceFormat, PackedPresence)(ff)
+        npt.assert_array_equal(obs.bits, self.packed.bits)
+        self.assertEqual(list(obs.feature_ids), self.features)
+        self.assertEqual(list(obs.sample_ids), self.samples)
+
+    def test_from_table_transformer(self):
+        obs = self.get_transformer(biom.Table, PackedPresence)(self.table)
+        npt.assert_array_equal(obs.bits, self.packed.bits)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pandas.testing as pdt
+import qiime2
+import skbio
+from qiime2.plugin.testing import TestPluginBase
+from scipy.spatial.distance import pdist, squareform
+from skbio.stats.distance import permanova as skbio_permanova
+
+from q2_american_gut import permanova
+from q2_american_gut._format import PermanovaResultsFormat
+from q2_american_gut._permanova import within_sums, _restrict, _test
+
+
+def _within(squared, labels):
+    within = 0.
+    for group in np.unique(labels):
+        members = labels == group
+        within += squared[np.ix_(members, members)].sum() / members.sum()
+    return within / 2
+
+
+class WithinSumsTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        self.squared = squareform(pdist(rng.rand(40, 3))) ** 2
+        base = np.arange(40) % 7
+        self.labels = np.array([rng.permutation(base) for _ in range(5)])
+
+    def test_matches_loop(self):
+        exp = [_within(self.squared, labels) for labels in self.labels]
+        npt.assert_allclose(within_sums(self.squared, self.labels), exp)
+
+    def test_chunked_rows(self):
+        # the product is built a row at a time when the cap is tiny
+        npt.assert_allclose(within_sums(self.squared, self.labels,
+                                        max_cells=1),
+                            within_sums(self.squared, self.labels))
+
+
+class RestrictTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def test_restrict(self):
+        permutations = np.array([[3, 0, 2, 1], [1, 2, 3, 0]])
+        obs = _restrict(permutations, np.array([0, 2, 3]), 4)
+        npt.assert_array_equal(obs, [[2, 0, 1], [1, 2, 0]])
+
+
+class PermanovaTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        self.ids = ['S%d' % i for i in range(30)]
+        coords = rng.rand(30, 4)
+        coords[:10] += 0.5
+        self.dm = skbio.DistanceMatrix(squareform(pdist(coords)),
+                                       ids=self.ids)
+        site = np.array(['gut'] * 10 + ['oral'] * 10 + ['skin'] * 10,
+                        dtype=object)
+        noise = rng.choice(['a', 'b'], size=30).astype(object)
+        noise[[2, 5, 11]] = np.nan
+        self.metadata = qiime2.Metadata(pd.DataFrame(
+            {'site': site, 'noise': noise, 'single': ['x'] * 30,
+             'age': np.arange(30.)},
+            index=pd.Index(self.ids, name='sample-id')))
+
+    def test_matches_skbio(self):
+        obs = permanova(self.dm, self.metadata, ['site', 'noise'],
+                        permutations=199, early_stopping=False)
+        md = self.metadata.to_dataframe()
+        for column in ('site', 'noise'):
+            values = md[column].dropna()
+            exp = skbio_permanova(self.dm.filter(values.index), values,
+                                  permutations=199)
+            res = obs.loc[column]
+            self.assertAlmostEqual(res['test statistic'],
+                                   exp['test statistic'])
+            self.assertEqual(res['sample size'], exp['sample size'])
+            self.assertEqual(res['number of groups'],
+                             exp['number of groups'])
+            self.assertEqual(res['number of permutations'], 199)
+            # the permutations differ, so only the conclusion must agree
+            self.assertEqual(res['p-value'] <= 0.05, exp['p-value'] <= 0.05)
+
+    def test_p_value_matches_permutations(self):
+        labels = np.arange(30) // 10
+        squared = self.dm.data ** 2
+        rng = np.random.RandomState(0)
+        permutations = np.array([rng.permutation(30) for _ in range(50)])
+        stat, p, performed = _test(squared, labels, permutations, 7, 0.05,
+                                   False)
+        n, k = 30, 3
+        total = squared.sum() / (2 * n)
+
+        def pseudo_f(labels):
+            within = _within(squared, labels)
+            return ((total - within) / (k - 1)) / (within / (n - k))
+
+        self.assertAlmostEqual(stat, pseudo_f(labels))
+        exceeded = sum(pseudo_f(labels[perm]) >= stat - 1e-12
+                       for perm in permutations)
+        self.assertEqual(performed, 50)
+        self.assertAlmostEqual(p, (exceeded + 1) / 51)
+
+    def test_early_stopping(self):
+        obs = permanova(self.dm, self.metadata, ['noise'],
+                        permutations=999, batch_size=50)
+        self.assertLess(obs.loc['noise', 'number of permutations'], 999)
+        self.assertGreater(obs.loc['noise', 'p-value'], 0.05)
+
+    def test_single_group(self):
+        obs = permanova(self.dm, self.metadata, ['single'])
+        self.assertEqual(obs.loc['single', 'number of groups'], 1)
+        self.assertTrue(np.isnan(obs.loc['single', 'p-value']))
+        self.assertEqual(obs.loc['single', 'number of permutations'], 0)
+
+    def test_no_permutations(self):
+        obs = permanova(self.dm, self.metadata, ['site'], permutations=0)
+        self.assertTrue(np.isnan(obs.loc['site', 'p-value']))
+        self.assertFalse(np.isnan(obs.loc['site', 'test statistic']))
+
+    def test_default_columns_are_categorical(self):
+        obs = permanova(self.dm, self.metadata, permutations=9)
+        self.assertEqual(sorted(obs.index), ['noise', 'single', 'site'])
+
+    def test_pool_matches_serial(self):
+        serial = permanova(self.dm, self.metadata, ['site', 'noise'],
+                           permutations=99)
+        pooled = permanova(self.dm, self.metadata, ['site', 'noise'],
+                           permutations=99, n_jobs=2)
+        pdt.assert_frame_equal(serial, pooled)
+
+    def test_unknown_column(self):
+        with self.assertRaisesRegex(ValueError, 'not present.*diet'):
+            permanova(self.dm, self.metadata, ['site', 'diet'])
+
+    def test_round_trip(self):
+        obs = permanova(self.dm, self.metadata, ['site', 'noise'],
+                        permutations=99)
+        ff = self.get_transformer(pd.DataFrame, PermanovaResultsFormat)(obs)
+        ff.validate()
+        back = self.get_transformer(PermanovaResultsFormat,
+                                    pd.DataFrame)(ff)
+        pdt.assert_frame_equal(back, obs, check_dtype=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
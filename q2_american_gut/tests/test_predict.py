@@ -0,0 +1,141 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import unittest
+
+import biom
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pandas.testing as pdt
+import qiime2
+import scipy.sparse as ss
+from qiime2.plugin.testing import TestPluginBase
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import KFold
+
+from q2_american_gut import predict_trait
+from q2_american_gut._format import (TraitPredictionsFormat,
+                                     CrossValidationReportFormat)
+
+
+class PredictTraitTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        counts = rng.poisson(3, size=(12, 40)).astype(float)
+        counts[rng.rand(12, 40) < 0.5] = 0
+        counts[11] = 0
+        counts[11, 0] = 1
+        self.counts = counts
+        self.samples = ['S%d' % i for i in range(40)]
+        self.table = biom.Table(counts, ['F%d' % i for i in range(12)],
+                                self.samples)
+        self.index = pd.Index(self.samples, name='sample-id')
+        self.age = qiime2.NumericMetadataColumn(
+            pd.Series(counts[0] * 2. + rng.rand(40), index=self.index,
+                      name='age'))
+        self.diet = qiime2.CategoricalMetadataColumn(
+            pd.Series(np.where(counts[1] > 2, 'meat', 'plant'),
+                      index=self.index, name='diet'))
+
+    def test_matches_estimator(self):
+        predictions, _ = predict_trait(self.table, self.age, cv=4,
+                                       n_estimators=10)
+        X = ss.csr_matrix(
+            (self.counts / self.counts.sum(axis=0)).T.astype(np.float32))
+        y = self.age.to_series().values
+        exp = np.empty(40)
+        folds = KFold(4, shuffle=True, random_state=0).split(y, y)
+        for train, test in folds:
+            estimator = RandomForestRegressor(n_estimators=10,
+                                              random_state=0, n_jobs=1)
+            estimator.fit(X[train], y[train])
+            exp[test] = estimator.predict(X[test])
+        npt.assert_allclose(predictions['prediction'], exp, rtol=1e-5)
+        npt.assert_array_equal(predictions['truth'], y)
+
+    def test_categorical(self):
+        predictions, report = predict_trait(self.table, self.diet, cv=3,
+                                            n_estimators=10)
+        self.assertEqual(set(predictions['prediction']), {'meat', 'plant'})
+        self.assertEqual(sorted(predictions['fold'].unique()), [0, 1, 2])
+        self.assertIn('accuracy', report.columns)
+        self.assertNotIn('r2', report.columns)
+        self.assertEqual(report['n-test'].sum(), 40)
+
+    def test_report_columns(self):
+        _, report = predict_trait(self.table, self.age, cv=2, n_estimators=5)
+        self.assertEqual(list(report.columns),
+                         ['n-train', 'n-test', 'n-features',
+                          'preprocess-seconds', 'fit-seconds',
+                          'predict-seconds', 'r2', 'mae'])
+        _, report = predict_trait(self.table, self.diet, cv=2,
+                                  n_estimators=5)
+        self.assertEqual(list(report.columns)[-1], 'accuracy')
+        self.assertEqual(report.index.name, 'fold')
+
+    def test_min_prevalence(self):
+        _, report = predict_trait(self.table, self.age, cv=2,
+                                  n_estimators=5, min_prevalence=0.3)
+        self.assertTrue((report['n-features'] < 12).all())
+
+    def test_pool_matches_serial(self):
+        serial = predict_trait(self.table, self.age, cv=3, n_estimators=5)
+        pooled = predict_trait(self.table, self.age, cv=3, n_estimators=5,
+                               n_jobs=2)
+        pdt.assert_frame_equal(serial[0], pooled[0])
+        pdt.assert_frame_equal(serial[1][['n-train', 'n-features', 'r2']],
+                               pooled[1][['n-train', 'n-features', 'r2']])
+
+    def test_cache(self):
+        cache_dir = os.path.join(self.temp_dir.name, 'cache')
+        first, _ = predict_trait(self.table, self.age, cv=3, n_estimators=5,
+                                 min_prevalence=0.2, cache_dir=cache_dir)
+        self.assertEqual(len(os.listdir(cache_dir)), 3)
+        second, _ = predict_trait(self.table, self.age, cv=3,
+                                  n_estimators=5, min_prevalence=0.2,
+                                  cache_dir=cache_dir)
+        self.assertEqual(len(os.listdir(cache_dir)), 3)
+        pdt.assert_frame_equal(first, second)
+        predict_trait(self.table, self.age, cv=3, n_estimators=5,
+                      min_prevalence=0.4, cache_dir=cache_dir)
+        self.assertEqual(len(os.listdir(cache_dir)), 6)
+
+    def test_invalid_cv(self):
+        with self.assertRaisesRegex(ValueError, 'between 2 and.*40'):
+            predict_trait(self.table, self.age, cv=41)
+
+    def test_round_trip(self):
+        predictions, report = predict_trait(self.table, self.age, cv=2,
+                                            n_estimators=5)
+        ff = self.get_transformer(pd.DataFrame, TraitPredictionsFormat)(
+            predictions)
+        ff.validate()
+        obs = self.get_transformer(TraitPredictionsFormat, pd.DataFrame)(ff)
+        pdt.assert_frame_equal(obs, predictions, check_dtype=False)
+        md = self.get_transformer(TraitPredictionsFormat,
+                                  qiime2.Metadata)(ff)
+        self.assertEqual(list(md.to_dataframe().columns),
+                         ['truth', 'prediction', 'fold'])
+
+        ff = self.get_transformer(pd.DataFrame, CrossValidationReportFormat)(
+            report)
+        ff.validate()
+        obs = self.get_transformer(CrossValidationReportFormat,
+                                   pd.DataFrame)(ff)
+        # the fold index is read back as the IDs it is written as
+        self.assertEqual(list(obs.index), ['0', '1'])
+        obs.index = obs.index.astype(int)
+        pdt.assert_frame_equal(obs, report, check_dtype=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
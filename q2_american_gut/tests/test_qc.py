@@ -0,0 +1,111 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import unittest
+
+import biom
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pandas.testing as pdt
+import qiime2
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_american_gut import qc_gate
+from q2_american_gut._format import QCReportFormat
+from q2_american_gut._qc import bloom_mask, sample_qc
+
+
+class BloomMaskTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def test_prefixes(self):
+        ids = ['ACGTACGT', 'acgt', 'ACGA', 'TTTT', 'ACGTACGTAA', 'A']
+        obs = bloom_mask(ids, ['ACGTAC', 'GG'])
+        npt.assert_array_equal(obs, [True, True, False, False, True, True])
+
+    def test_no_blooms(self):
+        npt.assert_array_equal(bloom_mask(['ACGT'], []), [False])
+
+
+class QCTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        self.counts = np.array([[500., 0., 1., 0.],
+                                [700., 2., 1., 0.],
+                                [0., 1., 1., 0.],
+                                [300., 0., 0., 0.],
+                                [0., 0., 900., 0.]])
+        self.features = ['ACGTA', 'ACGTC', 'TTTTA', 'GGGGA', 'CCCCA']
+        self.samples = ['S0', 'S1', 'S2', 'S3']
+        self.table = biom.Table(self.counts, self.features, self.samples)
+        self.blooms = pd.Series(['TTTTAGG'], index=['bloom'])
+        self.scores = pd.DataFrame(
+            {'contaminant': ['False', 'True', 'False', 'True', 'False']},
+            index=pd.Index(self.features, name='feature-id'))
+
+    def test_sample_qc(self):
+        blooms = np.array([False, False, True, False, False])
+        contaminants = np.array([False, True, False, True, False])
+        obs = sample_qc(self.table, blooms, contaminants)
+        depth = self.counts.sum(axis=0)
+        npt.assert_array_equal(obs['depth'], depth)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            npt.assert_allclose(obs['bloom-fraction'],
+                                self.counts[2] / depth)
+            npt.assert_allclose(obs['contaminant-fraction'],
+                                self.counts[[1, 3]].sum(axis=0) / depth)
+            npt.assert_allclose(obs['singleton-ratio'],
+                                [0., 1 / 2, 3 / 4, np.nan])
+            # GGGGA and CCCCA are each seen in one sample
+            npt.assert_allclose(obs['private-fraction'],
+                                [300. / 1500, 0., 900. / 903, np.nan])
+
+    def test_without_masks(self):
+        obs = sample_qc(self.table)
+        self.assertTrue(obs['bloom-fraction'].isnull().all())
+        self.assertTrue(obs['contaminant-fraction'].isnull().all())
+
+    def test_qc_gate(self):
+        # S1 fails on singletons, S2 on private reads and S3 is empty
+        pruned, report = qc_gate(self.table, self.blooms, self.scores,
+                                 min_depth=3, max_bloom_fraction=0.5,
+                                 max_singleton_ratio=0.4,
+                                 max_private_fraction=0.5)
+        self.assertEqual(list(report['contaminant-fraction'][:2]),
+                         [1000. / 1500, 2. / 3])
+        self.assertEqual(list(report['passed']), [True, False, False, False])
+        self.assertEqual(list(pruned.ids()), ['S0'])
+        self.assertEqual(list(pruned.ids(axis='observation')),
+                         ['ACGTA', 'ACGTC', 'GGGGA'])
+
+    def test_empty_samples_fail_without_a_depth_limit(self):
+        _, report = qc_gate(self.table, min_depth=0)
+        self.assertEqual(list(report['passed']), [True, True, True, False])
+
+    def test_every_sample_fails(self):
+        with self.assertRaisesRegex(
+                ValueError, r'Of 4 samples.*depth >= 2000: 4, '
+                            r'singleton-ratio <= 0.1: 2, .*'
+                            r'contaminant-fraction <= 1.0: 0'):
+            qc_gate(self.table, min_depth=2000, max_singleton_ratio=0.1)
+
+    def test_round_trip(self):
+        _, report = qc_gate(self.table, self.blooms, min_depth=3)
+        ff = self.get_transformer(pd.DataFrame, QCReportFormat)(report)
+        ff.validate()
+        back = self.get_transformer(QCReportFormat, pd.DataFrame)(ff)
+        pdt.assert_frame_equal(back, report, check_dtype=False)
+        md = self.get_transformer(QCReportFormat, qiime2.Metadata)(ff)
+        self.assertEqual(list(md.to_dataframe()['passed']),
+                         ['True', 'True', 'True', 'False'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import unittest
+
+import biom
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pandas.testing as pdt
+import qiime2
+import scipy.sparse as ss
+from qiime2.plugin.testing import TestPluginBase
+from scipy.stats import kruskal, rankdata
+
+from q2_american_gut import rank_test
+from q2_american_gut._format import RankTestResultsFormat
+from q2_american_gut._rank import sparse_ranks, benjamini_hochberg
+
+
+class SparseRanksTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def test_matches_rankdata(self):
+        dense = np.array([[0., 3., 0., 1., 3., 2.],
+                          [5., 5., 5., 5., 5., 5.],
+                          [0., 0., 0., 0., 0., 0.],
+                          [0., 0., 4., 0., 4., 1.]])
+        ranks, zero_rank, ties = sparse_ranks(ss.csr_matrix(dense))
+        for i, row in enumerate(dense):
+            exp = rankdata(row)
+            npt.assert_allclose(ranks[i].toarray().ravel()[row > 0],
+                                exp[row > 0])
+            if (row == 0).any():
+                self.assertEqual(zero_rank[i], exp[row == 0][0])
+            _, t = np.unique(row, return_counts=True)
+            self.assertEqual(ties[i], (t ** 3 - t).sum())
+
+    def test_negative(self):
+        with self.assertRaisesRegex(ValueError, 'nonnegative'):
+            sparse_ranks(ss.csr_matrix([[1., -1.]]))
+
+
+class BenjaminiHochbergTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def test_adjusted(self):
+        # as by R's p.adjust(p, method='BH')
+        p = [0.01, 0.04, 0.03, 0.005, 0.5]
+        npt.assert_allclose(benjamini_hochberg(p),
+                            [0.025, 0.05, 0.05, 0.025, 0.5])
+
+    def test_nan(self):
+        obs = benjamini_hochberg([np.nan, 0.02, 0.04, np.nan])
+        npt.assert_allclose(obs, [np.nan, 0.04, 0.04, np.nan])
+        self.assertTrue(np.isnan(benjamini_hochberg([np.nan])).all())
+
+
+class RankTestTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        counts = rng.poisson(2, size=(7, 30)).astype(float)
+        counts[rng.rand(7, 30) < 0.4] = 0
+        counts[:, :10] += np.arange(7)[:, None]
+        self.counts = counts
+        self.samples = ['S%d' % i for i in range(30)]
+        self.table = biom.Table(counts, ['F%d' % i for i in range(7)],
+                                self.samples)
+        site = np.array(['gut'] * 10 + ['oral'] * 10 + ['skin'] * 10,
+                        dtype=object)
+        sex = np.array(['f', 'm'] * 15, dtype=object)
+        sex[[1, 4, 7]] = np.nan
+        rare = np.array(['a'] * 28 + ['b'] * 2, dtype=object)
+        self.metadata = qiime2.Metadata(pd.DataFrame(
+            {'site': site, 'sex': sex, 'rare': rare,
+             'age': np.arange(30.)},
+            index=pd.Index(self.samples, name='sample-id')))
+
+    def _expected(self, values):
+        rows = []
+        keep = pd.notnull(values)
+        for row in self.counts[:, keep]:
+            groups = [row[values[keep] == g]
+                      for g in sorted(set(values[keep]))]
+            rows.append(kruskal(*groups))
+        return np.array(rows)
+
+    def test_matches_kruskal(self):
+        obs = rank_test(self.table, self.metadata, ['site', 'sex'])
+        for column in ('site', 'sex'):
+            values = self.metadata.to_dataframe()[column].values
+            exp = self._expected(values)
+            res = obs[obs['variable'] == column]
+            npt.assert_allclose(res['statistic'], exp[:, 0])
+            npt.assert_allclose(res['p-value'], exp[:, 1])
+            npt.assert_allclose(res['q-value'],
+                                benjamini_hochberg(exp[:, 1]))
+        self.assertEqual(
+            list(obs['n-samples'].unique()), [30, 27])
+        self.assertEqual(list(obs['n-groups'].unique()), [3, 2])
+
+    def test_pool_matches_serial(self):
+        serial = rank_test(self.table, self.metadata, ['site', 'sex'])
+        pooled = rank_test(self.table, self.metadata, ['site', 'sex'],
+                           n_jobs=2)
+        pdt.assert_frame_equal(serial, pooled)
+
+    def test_nothing_kept_between_calls(self):
+        # the same samples are missing from both tables, so a ranking kept
+        # from the first call would be reused for the second
+        rank_test(self.table, self.metadata, ['sex'])
+        self.counts = self.counts[::-1].copy()
+        self.table = biom.Table(self.counts, ['F%d' % i for i in range(7)],
+                                self.samples)
+        obs = rank_test(self.table, self.metadata, ['sex'])
+        exp = self._expected(self.metadata.to_dataframe()['sex'].values)
+        npt.assert_allclose(obs['statistic'], exp[:, 0])
+
+    def test_default_columns_are_categorical(self):
+        obs = rank_test(self.table, self.metadata, min_group_size=3)
+        self.assertEqual(list(obs['variable'].unique()), ['site', 'sex'])
+
+    def test_small_groups_excluded(self):
+        with self.assertRaisesRegex(ValueError, 'at least two groups'):
+            rank_test(self.table, self.metadata, ['rare'], min_group_size=3)
+        obs = rank_test(self.table, self.metadata, ['rare'],
+                        min_group_size=2)
+        self.assertEqual(obs['n-groups'].iloc[0], 2)
+
+    def test_single_group(self):
+        metadata = qiime2.Metadata(pd.DataFrame(
+            {'site': ['gut'] * 30},
+            index=pd.Index(self.samples, name='sample-id')))
+        with self.assertRaisesRegex(ValueError, 'at least two groups'):
+            rank_test(self.table, metadata, ['site'])
+
+    def test_constant_feature(self):
+        counts = self.counts.copy()
+        counts[0] = 0
+        table = biom.Table(counts, ['F%d' % i for i in range(7)],
+                           self.samples)
+        obs = rank_test(table, self.metadata, ['site'])
+        self.assertTrue(np.isnan(obs['p-value'].iloc[0]))
+        self.assertFalse(np.isnan(obs['q-value'].iloc[1:]).any())
+
+    def test_unknown_column(self):
+        with self.assertRaisesRegex(ValueError, 'not present.*diet'):
+            rank_test(self.table, self.metadata, ['site', 'diet'])
+
+    def test_round_trip(self):
+        obs = rank_test(self.table, self.metadata, ['site'])
+        ff = self.get_transformer(pd.DataFrame, RankTestResultsFormat)(obs)
+        ff.validate()
+        back = self.get_transformer(RankTestResultsFormat, pd.DataFrame)(ff)
+        pdt.assert_frame_equal(back, obs, check_dtype=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
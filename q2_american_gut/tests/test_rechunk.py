@@ -0,0 +1,103 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import unittest
+
+import biom
+import h5py
+import numpy as np
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_american_gut import rechunk_table
+from q2_american_gut._hdf5 import write_table, hdf5plugin
+
+
+class WriteTableTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        counts = rng.poisson(0.5, size=(40, 30)).astype(float)
+        counts[:, 3] = 0
+        self.table = biom.Table(
+            counts, ['F%d' % i for i in range(40)],
+            ['10317.%d' % i for i in range(30)],
+            [{'taxonomy': ['k__A', 'p__%d' % i]} for i in range(40)])
+
+    def _write(self, **kwargs):
+        path = os.path.join(self.temp_dir.name, 'table.biom')
+        with h5py.File(path, 'w') as h5:
+            write_table(self.table, h5, 'test', **kwargs)
+        return path
+
+    def test_round_trip(self):
+        for compression in ('gzip', 'lzf', 'none'):
+            path = self._write(chunk_size=16, compression=compression)
+            with h5py.File(path, 'r') as h5:
+                self.assertEqual(biom.Table.from_hdf5(h5), self.table)
+                data = h5['sample/matrix/data']
+                self.assertEqual(data.chunks, (16, ))
+                self.assertEqual(data.compression,
+                                 None if compression == 'none'
+                                 else compression)
+
+    def test_chunk_larger_than_data(self):
+        path = self._write(chunk_size=2 ** 20)
+        with h5py.File(path, 'r') as h5:
+            self.assertEqual(h5['sample/matrix/data'].chunks,
+                             (self.table.nnz, ))
+
+    def test_empty_table(self):
+        for table in (biom.Table(np.zeros((3, 4)), ['F0', 'F1', 'F2'],
+                                 ['S0', 'S1', 'S2', 'S3']),
+                      biom.Table(np.zeros((0, 0)), [], [])):
+            self.table = table
+            path = self._write()
+            with h5py.File(path, 'r') as h5:
+                self.assertEqual(biom.Table.from_hdf5(h5), table)
+                self.assertEqual(len(h5['sample/matrix/data']), 0)
+
+    def test_invalid_chunk_size(self):
+        with self.assertRaisesRegex(ValueError, 'positive'):
+            self._write(chunk_size=0)
+
+    def test_unknown_compression(self):
+        with self.assertRaisesRegex(ValueError, 'Unknown compression'):
+            self._write(compression='zstd')
+
+    @unittest.skipIf(hdf5plugin is None, 'hdf5plugin is not installed')
+    def test_plugin_codecs(self):
+        for compression in ('blosc-lz4', 'lz4'):
+            path = self._write(compression=compression)
+            with h5py.File(path, 'r') as h5:
+                self.assertEqual(biom.Table.from_hdf5(h5), self.table)
+
+
+class RechunkTableTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        self.table = biom.Table(np.array([[0., 1., 2.], [3., 0., 0.]]),
+                                ['F0', 'F1'], ['S0', 'S1', 'S2'])
+
+    def test_rechunk_table(self):
+        ff = rechunk_table(self.table, chunk_size=2, compression='gzip')
+        with h5py.File(str(ff), 'r') as h5:
+            self.assertEqual(biom.Table.from_hdf5(h5), self.table)
+            self.assertEqual(h5['observation/matrix/indices'].chunks, (2, ))
+
+    def test_plugin_codecs_rejected(self):
+        for compression in ('blosc-lz4', 'lz4'):
+            with self.assertRaisesRegex(ValueError, 'gzip, lzf, none'):
+                rechunk_table(self.table, compression=compression)
+
+
+if __name__ == '__main__':
+    unittest.main()
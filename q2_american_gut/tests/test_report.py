@@ -0,0 +1,179 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import time
+import unittest
+
+import biom
+import matplotlib
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import qiime2
+import skbio
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_american_gut import participant_reports
+from q2_american_gut._report import (collapse_by_taxonomy, _participant_dir,
+                                     _STALE_SECONDS)
+
+
+class CollapseTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        self.table = biom.Table(np.array([[1., 0., 2.],
+                                          [3., 1., 0.],
+                                          [0., 5., 1.]]),
+                                ['F0', 'F1', 'F2'], ['S0', 'S1', 'S2'])
+        self.taxonomy = pd.Series(['k__A; p__B; c__C', 'k__A; p__B; c__D',
+                                   'k__A; p__E'], index=['F0', 'F1', 'F2'])
+
+    def test_collapse(self):
+        taxa, counts = collapse_by_taxonomy(self.table, self.taxonomy, 2)
+        npt.assert_array_equal(taxa, ['k__A;p__B', 'k__A;p__E'])
+        npt.assert_array_equal(counts.toarray(), [[4., 1., 2.],
+                                                  [0., 5., 1.]])
+
+    def test_collapse_beyond_depth(self):
+        taxa, counts = collapse_by_taxonomy(self.table, self.taxonomy, 7)
+        npt.assert_array_equal(taxa, ['k__A;p__B;c__C', 'k__A;p__B;c__D',
+                                      'k__A;p__E'])
+        npt.assert_array_equal(counts.toarray(),
+                               self.table.matrix_data.toarray())
+
+    def test_missing_taxonomy(self):
+        with self.assertRaisesRegex(ValueError, '1 features'):
+            collapse_by_taxonomy(self.table, self.taxonomy[:2], 2)
+
+
+class ParticipantReportsTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        ids = ['10317.%d' % i for i in range(12)]
+        self.table = biom.Table(rng.poisson(5, size=(8, 12)).astype(float),
+                                ['F%d' % i for i in range(8)], ids)
+        self.taxonomy = pd.Series(['k__A; p__P%d; g__G%d' % (i % 3, i)
+                                   for i in range(8)],
+                                  index=['F%d' % i for i in range(8)])
+        self.alpha = pd.Series(rng.rand(12), index=ids, name='shannon')
+        coords = pd.DataFrame(rng.rand(12, 2), index=ids,
+                              columns=['PC1', 'PC2'])
+        self.pcoa = skbio.OrdinationResults(
+            'PCoA', 'Principal Coordinate Analysis',
+            pd.Series([2., 1.], index=['PC1', 'PC2']), coords,
+            proportion_explained=pd.Series([0.6, 0.3],
+                                           index=['PC1', 'PC2']))
+        # the last participant is not part of the reference
+        self.samples = qiime2.Metadata(pd.DataFrame(
+            {'round': ['1', '1', '2']},
+            index=pd.Index(['10317.0', '10317.5', '10317.99'],
+                           name='sample-id')))
+
+    def _render(self, output_dir, **kwargs):
+        os.makedirs(output_dir)
+        participant_reports(output_dir, self.table, self.taxonomy,
+                            self.alpha, self.pcoa, self.samples, **kwargs)
+
+    def _report_dir(self, output_dir, sample_id):
+        return _participant_dir(os.path.join(output_dir, 'participants'),
+                                sample_id)
+
+    def test_reports(self):
+        output_dir = os.path.join(self.temp_dir.name, 'out')
+        self._render(output_dir, max_taxa=3)
+
+        with open(os.path.join(output_dir, 'index.html')) as fh:
+            index = fh.read()
+        for sample_id in ('10317.0', '10317.5', '10317.99'):
+            self.assertIn(sample_id, index)
+        self.assertEqual(
+            sorted(os.listdir(self._report_dir(output_dir, '10317.0'))),
+            ['.complete', 'alpha.png', 'index.html', 'pcoa.png', 'taxa.png'])
+        with open(os.path.join(self._report_dir(output_dir, '10317.99'),
+                               'index.html')) as fh:
+            self.assertIn('not present in the reference', fh.read())
+
+    def test_backend_unchanged(self):
+        backend = matplotlib.get_backend()
+        self._render(os.path.join(self.temp_dir.name, 'out'), n_jobs=1)
+        self.assertEqual(matplotlib.get_backend(), backend)
+
+    def test_pool_matches_serial(self):
+        serial = os.path.join(self.temp_dir.name, 'serial')
+        pooled = os.path.join(self.temp_dir.name, 'pooled')
+        self._render(serial, n_jobs=1)
+        self._render(pooled, n_jobs=2)
+        for sample_id in ('10317.0', '10317.5', '10317.99'):
+            self.assertEqual(
+                sorted(os.listdir(self._report_dir(serial, sample_id))),
+                sorted(os.listdir(self._report_dir(pooled, sample_id))))
+
+    def test_cache_reused_for_same_inputs(self):
+        cache_dir = os.path.join(self.temp_dir.name, 'cache')
+        self._render(os.path.join(self.temp_dir.name, 'a'),
+                     cache_dir=cache_dir)
+        keys = os.listdir(cache_dir)
+        self.assertEqual(len(keys), 1)
+        taxa = os.path.join(_participant_dir(
+            os.path.join(cache_dir, keys[0]), '10317.0'), 'taxa.png')
+        mtime = os.stat(taxa).st_mtime_ns
+
+        self._render(os.path.join(self.temp_dir.name, 'b'),
+                     cache_dir=cache_dir)
+        self.assertEqual(os.listdir(cache_dir), keys)
+        self.assertEqual(os.stat(taxa).st_mtime_ns, mtime)
+        self.assertTrue(os.path.exists(os.path.join(
+            self._report_dir(os.path.join(self.temp_dir.name, 'b'),
+                             '10317.0'), 'taxa.png')))
+
+    def test_cache_keeps_partials_of_other_runs(self):
+        cache_dir = os.path.join(self.temp_dir.name, 'cache')
+        self._render(os.path.join(self.temp_dir.name, 'a'),
+                     cache_dir=cache_dir)
+        render_root = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+        # one left by an interrupted run, one by a run still rendering
+        stale = os.path.join(render_root, '.partial-stale')
+        active = os.path.join(render_root, '.partial-active')
+        os.makedirs(stale)
+        os.makedirs(active)
+        old = time.time() - 2 * _STALE_SECONDS
+        os.utime(stale, (old, old))
+
+        self._render(os.path.join(self.temp_dir.name, 'b'),
+                     cache_dir=cache_dir)
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(active))
+
+    def test_cache_not_reused_for_other_parameters(self):
+        cache_dir = os.path.join(self.temp_dir.name, 'cache')
+        self._render(os.path.join(self.temp_dir.name, 'a'),
+                     cache_dir=cache_dir, max_taxa=3)
+        self._render(os.path.join(self.temp_dir.name, 'b'),
+                     cache_dir=cache_dir, max_taxa=4)
+        self._render(os.path.join(self.temp_dir.name, 'c'),
+                     cache_dir=cache_dir, max_taxa=4, taxonomic_level=2)
+        self.assertEqual(len(os.listdir(cache_dir)), 3)
+
+    def test_cache_not_reused_for_other_table(self):
+        cache_dir = os.path.join(self.temp_dir.name, 'cache')
+        self._render(os.path.join(self.temp_dir.name, 'a'),
+                     cache_dir=cache_dir)
+        self.table = self.table.copy()
+        self.table.matrix_data[0, 0] += 1
+        self._render(os.path.join(self.temp_dir.name, 'b'),
+                     cache_dir=cache_dir)
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import threading
+import unittest
+
+import biom
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_american_gut._server import ReferenceServer, ReferenceClient
+
+
+class ReferenceServerTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        counts = rng.poisson(2, size=(6, 8)).astype(float)
+        counts[rng.rand(6, 8) < 0.3] = 0
+        counts[:, 7] = 0
+        self.counts = counts
+        self.samples = ['S%d' % i for i in range(8)]
+        self.features = ['F%d' % i for i in range(6)]
+        self.table = biom.Table(counts, self.features, self.samples)
+        self.alpha = pd.Series(np.arange(8.), index=self.samples)
+        self.server = ReferenceServer(
+            os.path.join(self.temp_dir.name, 'ag.sock'), self.table,
+            self.alpha)
+
+    def tearDown(self):
+        self.server.server_close()
+        super().tearDown()
+
+    def _cosine(self, vector):
+        depths = self.counts.sum(axis=0)
+        depths[depths == 0] = 1
+        profiles = (self.counts / depths).T
+        norms = np.linalg.norm(profiles, axis=1)
+        norms[norms == 0] = 1
+        return profiles @ vector / norms / (np.linalg.norm(vector) or 1.)
+
+    def test_fetch(self):
+        result = self.server.answer([{'op': 'fetch', 'sample': 'S2'}])[0]
+        column = self.counts[:, 2] / self.counts[:, 2].sum()
+        self.assertEqual(result['result'],
+                         {f: v for f, v in zip(self.features, column) if v})
+
+    def test_neighbors_of_vector(self):
+        vector = {'F0': 3., 'F4': 1., 'unknown': 5.}
+        result = self.server.answer([{'op': 'neighbors', 'vector': vector,
+                                      'k': 3}])[0]['result']
+        exp = self._cosine(np.array([3., 0, 0, 0, 1., 0]))
+        order = np.argsort(-exp, kind='mergesort')[:3]
+        self.assertEqual([s for s, _ in result],
+                         [self.samples[i] for i in order])
+        npt.assert_allclose([v for _, v in result], exp[order])
+
+    def test_neighbors_of_sample(self):
+        result = self.server.answer([{'op': 'neighbors', 'sample': 'S1',
+                                      'k': 100}])[0]['result']
+        self.assertEqual(len(result), 7)
+        self.assertNotIn('S1', [s for s, _ in result])
+        exp = self._cosine(self.counts[:, 1] / self.counts[:, 1].sum())
+        npt.assert_allclose(sorted((v for _, v in result), reverse=True),
+                            [v for _, v in result])
+        npt.assert_allclose(result[0][1], np.delete(exp, 1).max())
+
+    def test_invalid_k(self):
+        for k in (0, -2, 2.5, '3', True):
+            request = {'op': 'neighbors', 'sample': 'S1', 'k': k}
+            response = self.server.answer([request])[0]
+            self.assertRegex(response['error'], 'positive integer')
+
+    def test_errors_are_per_request(self):
+        responses = self.server.answer([
+            {'op': 'neighbors', 'sample': 'missing'},
+            {'op': 'neighbors', 'sample': 'S0', 'k': 2},
+            {'op': 'neighbors', 'vector': {'F0': 'many'}},
+            {'op': 'neighbors', 'vector': {'F0': -1}},
+            {'op': 'neighbors', 'vector': ['F0']},
+            {'op': 'fetch', 'sample': 'missing'},
+            {'op': 'fetch', 'sample': 'S0'},
+            {'op': 'unknown'},
+            'not a request'])
+        self.assertEqual([('result' in r) for r in responses],
+                         [False, True, False, False, False, False, True,
+                          False, False])
+        self.assertRegex(responses[0]['error'], 'KeyError.*missing')
+        self.assertEqual(len(responses[1]['result']), 2)
+        self.assertRegex(responses[2]['error'], 'numbers')
+        self.assertRegex(responses[3]['error'], 'nonnegative')
+        self.assertRegex(responses[7]['error'], 'Unknown op')
+        for response in responses:
+            self.assertIn('latency_ms', response)
+
+    def test_percentile(self):
+        responses = self.server.answer([
+            {'op': 'percentile', 'alpha': 2.},
+            {'op': 'percentile', 'feature': 'F0', 'value': 0.},
+            {'op': 'percentile', 'feature': 'F0', 'value': 1.1}])
+        self.assertEqual(responses[0]['result'], 25.)
+        self.assertEqual(responses[1]['result'], 0.)
+        self.assertEqual(responses[2]['result'], 100.)
+
+    def test_stats(self):
+        self.server.answer([{'op': 'fetch', 'sample': 'S0'},
+                            {'op': 'neighbors', 'sample': 'S0'},
+                            {'op': 'fetch', 'sample': 'missing'}])
+        stats = self.server.answer([{'op': 'stats'}])[0]['result']
+        self.assertEqual(stats['fetch']['count'], 1)
+        self.assertEqual(stats['neighbors']['count'], 1)
+        self.assertEqual(stats['error']['count'], 1)
+
+    def test_client(self):
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        try:
+            with ReferenceClient(self.server.server_address) as client:
+                message = client.query([{'op': 'fetch', 'sample': 'S3'},
+                                        {'op': 'neighbors', 'sample': 'S3',
+                                         'k': -2}])
+        finally:
+            self.server.shutdown()
+            thread.join()
+        self.assertIn('latency_ms', message)
+        self.assertIn('result', message['responses'][0])
+        self.assertIn('error', message['responses'][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import unittest
+
+import biom
+import h5py
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pandas.testing as pdt
+import qiime2
+import scipy.sparse as ss
+from qiime2.plugin.testing import TestPluginBase
+from q2_types.feature_table import BIOMV210Format
+
+from q2_american_gut import (FeatureSketch, sketch_quantiles, merge_sketches,
+                             summarize_sketch)
+from q2_american_gut._format import (QuantileSketchFormat,
+                                     FeatureQuantilesFormat)
+
+
+def _random_counts(n_features, n_samples, seed):
+    rng = np.random.RandomState(seed)
+    counts = rng.poisson(3, size=(n_features, n_samples)).astype(float)
+    counts[rng.rand(n_features, n_samples) < 0.5] = 0
+    return counts
+
+
+class FeatureSketchTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        self.counts = _random_counts(6, 200, 0)
+        self.ids = ['F%d' % i for i in range(6)]
+
+    def test_quantiles_within_relative_accuracy(self):
+        sketch = FeatureSketch(self.ids, 0.01)
+        sketch.update(ss.csc_matrix(self.counts))
+        qs = [0., 0.1, 0.5, 0.9, 1.]
+        obs = sketch.quantiles(qs)
+
+        self.assertEqual(list(obs.index), self.ids)
+        self.assertEqual(list(obs.columns), ['q%s' % q for q in qs])
+        ranks = np.floor(np.array(qs) * (self.counts.shape[1] - 1))
+        exp = np.sort(self.counts, axis=1)[:, ranks.astype(int)]
+        npt.assert_array_equal(obs.values == 0, exp == 0)
+        nonzero = exp > 0
+        npt.assert_array_less(
+            np.abs(obs.values[nonzero] - exp[nonzero]) / exp[nonzero], 0.0101)
+
+    def test_update_in_blocks(self):
+        whole = FeatureSketch(self.ids, 0.05)
+        whole.update(ss.csc_matrix(self.counts))
+        blocked = FeatureSketch(self.ids, 0.05)
+        for start in range(0, 200, 30):
+            blocked.update(ss.csc_matrix(self.counts[:, start:start + 30]))
+        self.assertEqual(whole, blocked)
+        self.assertEqual(blocked.n_samples, 200)
+
+    def test_merge_disjoint_samples(self):
+        a = FeatureSketch(self.ids, 0.05)
+        a.update(ss.csc_matrix(self.counts[:, :120]))
+        b = FeatureSketch(self.ids, 0.05)
+        b.update(ss.csc_matrix(self.counts[:, 120:]))
+        whole = FeatureSketch(self.ids, 0.05)
+        whole.update(ss.csc_matrix(self.counts))
+        self.assertEqual(a.merge(b), whole)
+        self.assertEqual(merge_sketches([a, b]), whole)
+
+    def test_merge_different_features(self):
+        a = FeatureSketch(['F0', 'F1'], 0.05)
+        a.update(ss.csc_matrix([[1., 2.], [0., 3.]]))
+        b = FeatureSketch(['F1', 'F2'], 0.05)
+        b.update(ss.csc_matrix([[4.], [5.]]))
+        merged = a.merge(b)
+        self.assertEqual(list(merged.feature_ids), ['F0', 'F1', 'F2'])
+        self.assertEqual(merged.n_samples, 3)
+        npt.assert_array_equal(
+            np.asarray(merged.counts.sum(axis=1)).ravel(), [2, 2, 1])
+
+    def test_merge_different_accuracy(self):
+        with self.assertRaisesRegex(ValueError, 'relative accuracies'):
+            FeatureSketch(self.ids, 0.01).merge(FeatureSketch(self.ids, 0.02))
+
+    def test_empty_samples(self):
+        sketch = FeatureSketch(['F0'], 0.01)
+        sketch.update(ss.csc_matrix((1, 4)))
+        self.assertEqual(sketch.n_samples, 4)
+        npt.assert_array_equal(sketch.quantiles([0.5, 1]).values, [[0, 0]])
+
+    def test_invalid_accuracy(self):
+        for alpha in (0, 1, -0.5):
+            with self.assertRaisesRegex(ValueError, 'relative_accuracy'):
+                FeatureSketch(self.ids, alpha)
+
+    def test_negative_values(self):
+        sketch = FeatureSketch(['F0'], 0.01)
+        with self.assertRaisesRegex(ValueError, 'Negative'):
+            sketch.update(ss.csc_matrix([[-1.]]))
+
+    def test_invalid_quantiles(self):
+        with self.assertRaisesRegex(ValueError, 'within'):
+            FeatureSketch(self.ids, 0.01).quantiles([1.5])
+
+
+class SketchActionTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        self.counts = _random_counts(5, 50, 1)
+        self.table = biom.Table(self.counts, ['F%d' % i for i in range(5)],
+                                ['S%d' % i for i in range(50)])
+        path = os.path.join(self.temp_dir.name, 'table.biom')
+        with h5py.File(path, 'w') as h5:
+            self.table.to_hdf5(h5, 'test')
+        self.table_fmt = BIOMV210Format(path, mode='r')
+
+    def test_sketch_quantiles_block_size(self):
+        whole = sketch_quantiles(self.table_fmt, 0.01, False, 1000)
+        blocked = sketch_quantiles(self.table_fmt, 0.01, False, 7)
+        self.assertEqual(whole, blocked)
+        self.assertEqual(whole.n_samples, 50)
+
+    def test_sketch_quantiles_relative_frequency(self):
+        sketch = sketch_quantiles(self.table_fmt, 0.01, True, 10)
+        obs = sketch.quantiles([1]).values.ravel()
+        depths = self.counts.sum(axis=0)
+        depths[depths == 0] = 1
+        exp = (self.counts / depths).max(axis=1)
+        npt.assert_allclose(obs, exp, rtol=0.0101)
+
+    def test_summarize_sketch(self):
+        sketch = sketch_quantiles(self.table_fmt, 0.01, False, 10)
+        summary = summarize_sketch(sketch)
+        self.assertEqual(list(summary.columns),
+                         ['prevalence', 'q0.25', 'q0.5', 'q0.75'])
+        npt.assert_allclose(summary['prevalence'],
+                            (self.counts > 0).mean(axis=1))
+
+
+class SketchTransformerTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def test_sketch_round_trip(self):
+        sketch = FeatureSketch(['F0', 'F1'], 0.02)
+        sketch.update(ss.csc_matrix([[1., 0., 40.], [0., 2.5, 0.]]))
+        to_format = self.get_transformer(FeatureSketch, QuantileSketchFormat)
+        from_format = self.get_transformer(QuantileSketchFormat,
+                                           FeatureSketch)
+        ff = to_format(sketch)
+        ff.validate()
+        obs = from_format(ff)
+        self.assertEqual(obs, sketch)
+        self.assertEqual(obs.key_min, sketch.key_min)
+
+    def test_feature_quantiles_round_trip(self):
+        df = pd.DataFrame({'prevalence': [0.5, 1.], 'q0.5': [0., 2.]},
+                          index=pd.Index(['10317.1', 'F1'],
+                                         name='feature-id'),
+                          columns=['prevalence', 'q0.5'])
+        ff = self.get_transformer(pd.DataFrame, FeatureQuantilesFormat)(df)
+        ff.validate()
+        obs = self.get_transformer(FeatureQuantilesFormat, pd.DataFrame)(ff)
+        pdt.assert_frame_equal(obs, df)
+        md = self.get_transformer(FeatureQuantilesFormat,
+                                  qiime2.Metadata)(ff)
+        self.assertEqual(list(md.to_dataframe().index), ['10317.1', 'F1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import unittest
+
+import biom
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import qiime2
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_american_gut import stratify, StratifiedTables
+from q2_american_gut._format import StratifiedFeatureTablesDirFmt
+
+
+class StratifyTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        counts = rng.poisson(30, size=(8, 12)).astype(float)
+        counts[:, 4] = 1
+        counts[7, :6] = 0
+        self.counts = counts
+        self.samples = ['S%d' % i for i in range(12)]
+        self.table = biom.Table(counts, ['F%d' % i for i in range(8)],
+                                self.samples)
+        site = np.array(['gut', 'oral', 'skin'] * 4, dtype=object)
+        site[[2, 11]] = np.nan
+        self.site = site
+        self.metadata = qiime2.Metadata(pd.DataFrame(
+            {'site': site, 'control': ['false'] * 12},
+            index=pd.Index(self.samples, name='sample-id')))
+
+    def test_no_steps(self):
+        stratified, merged = stratify(self.table, self.metadata, 'site')
+        self.assertEqual([name for name, _ in stratified],
+                         ['gut', 'oral', 'skin'])
+        for name, table in stratified:
+            ids = [s for s, v in zip(self.samples, self.site) if v == name]
+            exp = self.table.filter(ids, inplace=False).remove_empty(
+                axis='observation', inplace=False)
+            self.assertEqual(table, exp)
+        self.assertEqual(sorted(merged.ids()),
+                         sorted(set(self.samples) - {'S2', 'S11'}))
+        npt.assert_array_equal(
+            merged.sort_order(self.samples[:2]).sum(axis='sample')[:2],
+            self.counts[:, :2].sum(axis=0))
+
+    def test_qc_gate_and_rarefy(self):
+        stratified, merged = stratify(self.table, self.metadata, 'site',
+                                      ['qc-gate', 'rarefy'], min_depth=100,
+                                      sampling_depth=150)
+        self.assertNotIn('S4', merged.ids())
+        npt.assert_array_equal(merged.sum(axis='sample'),
+                               np.full(len(merged.ids()), 150.))
+        self.assertEqual(stratified.summary().loc['oral', 'n-samples'], 3)
+
+    def test_stratum_emptied(self):
+        # the only blank fails quality control, leaving its stratum empty
+        site = self.site.copy()
+        site[4] = 'blank'
+        metadata = qiime2.Metadata(pd.DataFrame(
+            {'site': site}, index=pd.Index(self.samples, name='sample-id')))
+        stratified, merged = stratify(self.table, metadata, 'site',
+                                      ['qc-gate'], min_depth=100)
+        self.assertTrue(stratified['blank'].is_empty())
+        self.assertEqual(stratified.summary().loc['blank', 'n-samples'], 0)
+        self.assertNotIn('S4', merged.ids())
+
+        ff = self.get_transformer(StratifiedTables,
+                                  StratifiedFeatureTablesDirFmt)(stratified)
+        obs = self.get_transformer(StratifiedFeatureTablesDirFmt,
+                                   StratifiedTables)(ff)
+        self.assertTrue(obs['blank'].is_empty())
+        self.assertEqual(obs['gut'], stratified['gut'])
+
+    def test_every_stratum_emptied(self):
+        with self.assertRaisesRegex(ValueError, 'Every stratum'):
+            stratify(self.table, self.metadata, 'site', ['qc-gate'],
+                     min_depth=10 ** 6)
+
+    def test_pool_matches_serial(self):
+        serial, _ = stratify(self.table, self.metadata, 'site', ['rarefy'],
+                             sampling_depth=150)
+        pooled, _ = stratify(self.table, self.metadata, 'site', ['rarefy'],
+                             sampling_depth=150, n_jobs=2)
+        for (a, x), (b, y) in zip(serial, pooled):
+            self.assertEqual(a, b)
+            self.assertEqual(x, y)
+
+    def test_invalid(self):
+        with self.assertRaisesRegex(ValueError, 'Unknown steps: dedupe'):
+            stratify(self.table, self.metadata, 'site', ['dedupe'])
+        with self.assertRaisesRegex(ValueError, 'requires a control'):
+            stratify(self.table, self.metadata, 'site',
+                     ['remove-contaminants'])
+        with self.assertRaisesRegex(ValueError, "'body'"):
+            stratify(self.table, self.metadata, 'body')
+
+    def test_no_values(self):
+        metadata = qiime2.Metadata(pd.DataFrame(
+            {'site': [np.nan] * 12},
+            index=pd.Index(self.samples, name='sample-id')))
+        with self.assertRaisesRegex(ValueError, 'No sample'):
+            stratify(self.table, metadata, 'site')
+
+    def test_round_trip(self):
+        stratified, _ = stratify(self.table, self.metadata, 'site')
+        ff = self.get_transformer(StratifiedTables,
+                                  StratifiedFeatureTablesDirFmt)(stratified)
+        ff.validate()
+        obs = self.get_transformer(StratifiedFeatureTablesDirFmt,
+                                   StratifiedTables)(ff)
+        self.assertEqual([name for name, _ in obs],
+                         ['gut', 'oral', 'skin'])
+        for (_, x), (_, y) in zip(obs, stratified):
+            self.assertEqual(x, y)
+
+
+class StratifiedTablesTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def test_merge(self):
+        a = biom.Table(np.array([[1., 2.]]), ['F0'], ['S0', 'S1'])
+        b = biom.Table(np.array([[3.]]), ['F1'], ['S2'])
+        empty = biom.Table(np.zeros((0, 0)), [], [])
+        tables = StratifiedTables([('a', a), ('empty', empty), ('b', b)])
+        self.assertEqual(len(tables), 3)
+        self.assertIs(tables['b'], b)
+        merged = tables.merge()
+        self.assertEqual(list(merged.ids()), ['S0', 'S1', 'S2'])
+        npt.assert_array_equal(merged.sum(axis='observation'), [3., 3.])
+
+    def test_merge_all_empty(self):
+        empty = biom.Table(np.zeros((0, 0)), [], [])
+        with self.assertRaisesRegex(ValueError, 'Every stratum'):
+            StratifiedTables([('a', empty)]).merge()
+
+
+if __name__ == '__main__':
+    unittest.main()
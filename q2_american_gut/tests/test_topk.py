@@ -0,0 +1,108 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import unittest
+from unittest import mock
+
+import biom
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pandas.testing as pdt
+import scipy.sparse as ss
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_american_gut import top_features
+from q2_american_gut._format import TopFeaturesFormat
+from q2_american_gut._topk import column_top_k
+
+
+class ColumnTopKTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        # distinct values so the selection is unambiguous
+        dense = rng.permutation(300).reshape(20, 15) + 1.
+        dense[rng.rand(20, 15) < 0.6] = 0
+        dense[:, 4] = 0
+        dense[:, 7] = 0
+        dense[3, 7] = 5.
+        self.dense = dense
+
+    def _expected(self, k):
+        expected = []
+        for col in range(self.dense.shape[1]):
+            rows = np.flatnonzero(self.dense[:, col])
+            rows = rows[np.argsort(-self.dense[rows, col])][:k]
+            expected.extend((col, row, rank + 1, self.dense[row, col])
+                            for rank, row in enumerate(rows))
+        return [np.array(x) for x in zip(*expected)]
+
+    def _check(self, k):
+        obs = column_top_k(ss.csr_matrix(self.dense), k)
+        for o, e in zip(obs, self._expected(k)):
+            npt.assert_array_equal(o, e)
+
+    def test_matches_sort(self):
+        for k in (1, 3, 20, 50):
+            self._check(k)
+
+    def test_batches(self):
+        with mock.patch('q2_american_gut._topk._BATCH_CELLS', 5):
+            self._check(3)
+
+    def test_no_columns(self):
+        cols, rows, ranks, values = column_top_k(ss.csc_matrix((3, 0)), 2)
+        self.assertEqual((len(cols), len(rows), len(ranks), len(values)),
+                         (0, 0, 0, 0))
+
+    def test_empty_matrix(self):
+        cols, _, _, _ = column_top_k(ss.csc_matrix((3, 4)), 2)
+        self.assertEqual(len(cols), 0)
+
+    def test_invalid_k(self):
+        for k in (0, -2):
+            with self.assertRaisesRegex(ValueError, 'positive'):
+                column_top_k(ss.csr_matrix(self.dense), k)
+
+
+class TopFeaturesTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        self.table = biom.Table(np.array([[1., 0., 6.],
+                                          [3., 0., 2.],
+                                          [0., 0., 4.]]),
+                                ['F0', 'F1', 'F2'], ['S0', 'S1', 'S2'])
+
+    def test_relative(self):
+        obs = top_features(self.table, k=2)
+        exp = pd.DataFrame({'rank': [1, 2, 1, 2],
+                            'feature-id': ['F1', 'F0', 'F0', 'F2'],
+                            'abundance': [0.75, 0.25, 0.5, 1 / 3]},
+                           index=pd.Index(['S0', 'S0', 'S2', 'S2'],
+                                          name='sample-id'),
+                           columns=['rank', 'feature-id', 'abundance'])
+        pdt.assert_frame_equal(obs, exp, check_dtype=False)
+
+    def test_absolute(self):
+        obs = top_features(self.table, k=1, relative_frequency=False)
+        self.assertEqual(list(obs['abundance']), [3., 6.])
+
+    def test_round_trip(self):
+        obs = top_features(self.table, k=2)
+        ff = self.get_transformer(pd.DataFrame, TopFeaturesFormat)(obs)
+        ff.validate()
+        back = self.get_transformer(TopFeaturesFormat, pd.DataFrame)(ff)
+        pdt.assert_frame_equal(back, obs, check_dtype=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
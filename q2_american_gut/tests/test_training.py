@@ -0,0 +1,118 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import unittest
+
+import biom
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import qiime2
+import scipy.sparse as ss
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_american_gut import SparseTrainingSet, training_set
+from q2_american_gut._format import TrainingMatrixDirFmt
+from q2_american_gut._training import build_training_set
+
+
+class BuildTrainingSetTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        self.counts = np.array([[1., 0., 2., 0.],
+                                [0., 3., 4., 0.],
+                                [5., 0., 0., 6.]])
+        self.table = biom.Table(self.counts, ['F0', 'F1', 'F2'],
+                                ['S0', 'S1', 'S2', 'S3'])
+
+    def test_numeric(self):
+        target = pd.Series([0.5, np.nan, 2., 3.],
+                           index=['S3', 'S1', 'S0', 'S9'])
+        obs = build_training_set(self.table, target)
+        self.assertEqual(obs.sample_ids, ['S3', 'S0'])
+        self.assertEqual(obs.feature_ids, ['F0', 'F1', 'F2'])
+        self.assertEqual(obs.X.dtype, np.float32)
+        npt.assert_array_equal(obs.X.toarray(), self.counts[:, [3, 0]].T)
+        npt.assert_array_equal(obs.y, [0.5, 2.])
+        self.assertFalse(obs.is_categorical)
+
+    def test_categorical(self):
+        target = pd.Series(['b', 'a', 'b', 'a'],
+                           index=['S0', 'S1', 'S2', 'S3'])
+        obs = build_training_set(self.table, target)
+        self.assertEqual(obs.classes, ['a', 'b'])
+        npt.assert_array_equal(obs.y, [1, 0, 1, 0])
+        self.assertTrue(obs.is_categorical)
+
+    def test_feature_ids(self):
+        target = pd.Series([1., 2.], index=['S0', 'S2'])
+        obs = build_training_set(self.table, target, ['F2', 'F9', 'F0'])
+        self.assertEqual(obs.feature_ids, ['F2', 'F9', 'F0'])
+        npt.assert_array_equal(obs.X.toarray(), [[5., 0., 1.],
+                                                 [0., 0., 2.]])
+
+    def test_no_target(self):
+        with self.assertRaisesRegex(ValueError, 'No sample'):
+            build_training_set(self.table, pd.Series([1.], index=['S9']))
+
+
+class SparseTrainingSetTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        self.data = SparseTrainingSet(
+            ss.csr_matrix(np.array([[1., 0.], [0., 2.], [3., 4.]],
+                                   dtype=np.float32)),
+            np.array([0, 1, 0]), ['S0', 'S1', 'S2'], ['F0', 'F1'],
+            ['a', 'b'])
+
+    def test_shape_mismatch(self):
+        with self.assertRaisesRegex(ValueError, '2 samples'):
+            SparseTrainingSet(self.data.X, self.data.y[:2], ['S0', 'S1'],
+                              ['F0', 'F1'])
+        with self.assertRaisesRegex(ValueError, 'disagree'):
+            SparseTrainingSet(self.data.X, self.data.y[:2],
+                              ['S0', 'S1', 'S2'], ['F0', 'F1'])
+
+    def _round_trip(self, data):
+        ff = self.get_transformer(SparseTrainingSet, TrainingMatrixDirFmt)(
+            data)
+        ff.validate()
+        return self.get_transformer(TrainingMatrixDirFmt,
+                                    SparseTrainingSet)(ff)
+
+    def test_round_trip(self):
+        obs = self._round_trip(self.data)
+        npt.assert_array_equal(obs.X.toarray(), self.data.X.toarray())
+        npt.assert_array_equal(obs.y, self.data.y)
+        self.assertEqual(obs.sample_ids, self.data.sample_ids)
+        self.assertEqual(obs.feature_ids, self.data.feature_ids)
+        self.assertEqual(obs.classes, ['a', 'b'])
+
+    def test_round_trip_numeric(self):
+        data = SparseTrainingSet(self.data.X, np.array([0.5, 1., 2.]),
+                                 self.data.sample_ids, self.data.feature_ids)
+        obs = self._round_trip(data)
+        self.assertIsNone(obs.classes)
+        npt.assert_array_equal(obs.y, [0.5, 1., 2.])
+
+    def test_training_set_reuses_reference_features(self):
+        table = biom.Table(np.array([[1., 2.], [3., 4.]]), ['F1', 'F3'],
+                           ['S0', 'S1'])
+        target = qiime2.CategoricalMetadataColumn(
+            pd.Series(['a', 'b'], name='diet',
+                      index=pd.Index(['S0', 'S1'], name='sample-id')))
+        obs = training_set(table, target, self.data)
+        self.assertEqual(obs.feature_ids, ['F0', 'F1'])
+        npt.assert_array_equal(obs.X.toarray(), [[0., 1.], [0., 2.]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import io
+import os
+import unittest
+import uuid
+import zipfile
+from unittest import mock
+
+import biom
+import numpy as np
+import numpy.testing as npt
+import skbio
+from q2_types.tree import NewickFormat
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_american_gut import ArrayTree, load_tree, prune_tree
+from q2_american_gut import _tree
+from q2_american_gut._tree import read_newick
+
+
+NEWICK = ('((((a:1,b:2)i1:1,c:3)i2:1,(d:1,(e:2,f:1)i3:2)i4:3)i5:0.5,'
+          '(g:4,h:1)i6:2)root;')
+
+
+def write_phylogeny(path, newick=NEWICK):
+    """A minimal Phylogeny artifact, enough for load_tree to read"""
+    artifact_id = str(uuid.uuid4())
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('%s/metadata.yaml' % artifact_id,
+                    'uuid: %s\ntype: Phylogeny[Rooted]\n' % artifact_id)
+        zf.writestr('%s/data/tree.nwk' % artifact_id, newick)
+    return artifact_id
+
+
+class ArrayTreeTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        self.skbio_tree = skbio.TreeNode.read(io.StringIO(NEWICK))
+        self.tree = ArrayTree.from_treenode(self.skbio_tree)
+
+    def _assert_same(self, obs, exp):
+        names = sorted(tip.name for tip in exp.tips())
+        self.assertEqual(sorted(tip.name for tip in obs.tips()), names)
+        self.assertEqual(obs.count(), exp.count())
+        self.assertEqual(obs.compare_rfd(exp), 0)
+        npt.assert_allclose(obs.tip_tip_distances(names).data,
+                            exp.tip_tip_distances(names).data)
+
+    def test_from_treenode(self):
+        self.assertEqual(len(self.tree), 15)
+        self.assertEqual(self.tree.names[-1], 'root')
+        self.assertTrue((self.tree.parent[:-1] >
+                         np.arange(len(self.tree) - 1)).all())
+        self.assertEqual(self.tree.is_tip.sum(), 8)
+        self._assert_same(self.tree.to_treenode(), self.skbio_tree)
+
+    def test_heights(self):
+        height = dict(zip(self.tree.names, self.tree.heights()))
+        self.assertEqual(height['a'], 0)
+        self.assertEqual(height['i1'], 1)
+        self.assertEqual(height['i4'], 2)
+        self.assertEqual(height['root'], 4)
+
+    def test_induced_matches_shear(self):
+        for names in (['a', 'b', 'c', 'g', 'h'], ['a', 'e', 'f'],
+                      ['c', 'd', 'h'], ['b', 'e']):
+            obs = self.tree.induced(names).to_treenode()
+            self._assert_same(obs, self.skbio_tree.shear(names))
+            self.assertIsNone(obs.length)
+
+    def test_induced_without_collapse(self):
+        obs = self.tree.induced(['a', 'e'], collapse=False)
+        self.assertEqual(list(obs.names),
+                         ['a', 'i1', 'i2', 'e', 'i3', 'i4', 'i5', 'root'])
+        npt.assert_array_equal(obs.length, [1, 1, 1, 2, 2, 3, .5, 0])
+
+    def test_single_tip(self):
+        obs = self.tree.induced(['d'])
+        self.assertEqual(list(obs.names), ['d'])
+        npt.assert_array_equal(obs.parent, [-1])
+        npt.assert_array_equal(obs.length, [0])
+
+    def test_unknown_tips(self):
+        with self.assertRaisesRegex(ValueError, '2 features.*x, i1'):
+            self.tree.induced(['a', 'x', 'i1'])
+
+    def test_invalid(self):
+        with self.assertRaisesRegex(ValueError, 'disagree in length'):
+            ArrayTree([1, -1], [1.], ['a', 'b'])
+        with self.assertRaisesRegex(ValueError, 'must be the root'):
+            ArrayTree([-1, 0], [0., 1.], ['root', 'a'])
+
+    def test_save_load(self):
+        path = os.path.join(self.temp_dir.name, 'tree.npz')
+        self.tree.save(path)
+        obs = ArrayTree.load(path)
+        npt.assert_array_equal(obs.parent, self.tree.parent)
+        npt.assert_array_equal(obs.length, self.tree.length)
+        self.assertEqual(list(obs.names), list(self.tree.names))
+
+    def test_prune_tree(self):
+        table = biom.Table(np.ones((3, 2)), ['h', 'a', 'f'], ['S0', 'S1'])
+        self._assert_same(prune_tree(self.tree, table),
+                          self.skbio_tree.shear(['h', 'a', 'f']))
+
+
+class TreeCacheTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(_tree, '_TREES', type(_tree._TREES)())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_load_tree(self):
+        path = os.path.join(self.temp_dir.name, 'tree.qza')
+        artifact_id = write_phylogeny(path)
+        tree = load_tree(path)
+        self.assertEqual(tree.is_tip.sum(), 8)
+        self.assertIs(load_tree(path), tree)
+        self.assertEqual(list(_tree._TREES), [artifact_id])
+
+    def test_load_tree_cache_dir(self):
+        path = os.path.join(self.temp_dir.name, 'tree.qza')
+        cache_dir = os.path.join(self.temp_dir.name, 'cache')
+        artifact_id = write_phylogeny(path)
+        exp = load_tree(path, cache_dir)
+        self.assertEqual(os.listdir(cache_dir), ['%s.npz' % artifact_id])
+        # another process finds the tree already converted
+        _tree._TREES.clear()
+        with mock.patch.object(skbio.TreeNode, 'read') as read:
+            obs = load_tree(path, cache_dir)
+        read.assert_not_called()
+        npt.assert_array_equal(obs.parent, exp.parent)
+
+    def test_read_newick_by_uuid(self):
+        artifact_id = str(uuid.uuid4())
+        data_dir = os.path.join(self.temp_dir.name, artifact_id, 'data')
+        os.makedirs(data_dir)
+        path = os.path.join(data_dir, 'tree.nwk')
+        with open(path, 'w') as fh:
+            fh.write(NEWICK)
+        tree = read_newick(path)
+        self.assertIs(read_newick(path), tree)
+        self.assertEqual(list(_tree._TREES), [artifact_id])
+
+    def test_read_newick_outside_an_artifact(self):
+        path = os.path.join(self.temp_dir.name, 'tree.nwk')
+        with open(path, 'w') as fh:
+            fh.write(NEWICK)
+        tree = read_newick(path)
+        self.assertIsNot(read_newick(path), tree)
+        self.assertEqual(len(_tree._TREES), 0)
+
+    def test_bounded(self):
+        paths = []
+        for i in range(3):
+            paths.append(os.path.join(self.temp_dir.name, '%d.qza' % i))
+            write_phylogeny(paths[-1])
+        with mock.patch.object(_tree, '_MAX_TREES', 2):
+            first = load_tree(paths[0])
+            load_tree(paths[1])
+            # the first is used again, so the second is the one dropped
+            self.assertIs(load_tree(paths[0]), first)
+            load_tree(paths[2])
+        self.assertEqual(len(_tree._TREES), 2)
+        self.assertIs(load_tree(paths[0]), first)
+
+    def test_transformer(self):
+        ff = NewickFormat()
+        with open(str(ff), 'w') as fh:
+            fh.write(NEWICK)
+        obs = self.get_transformer(NewickFormat, ArrayTree)(ff)
+        self.assertEqual(obs.names[-1], 'root')
+        self.assertEqual(obs.is_tip.sum(), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
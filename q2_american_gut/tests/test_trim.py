@@ -0,0 +1,61 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2012-2018, American Gut Project development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import unittest
+
+import biom
+import numpy as np
+import numpy.testing as npt
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_american_gut import trim_and_collapse
+
+
+class TrimAndCollapseTests(TestPluginBase):
+    package = 'q2_american_gut.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        self.ids = ['ACGTAA', 'ACGTCC', 'TTGTA', 'ACG', 'TTGTAGG', 'ACGTA']
+        self.counts = rng.poisson(3, size=(6, 4)).astype(float)
+        self.table = biom.Table(self.counts, self.ids,
+                                ['S0', 'S1', 'S2', 'S3'])
+
+    def test_matches_biom_collapse(self):
+        obs = trim_and_collapse(self.table, 5)
+        long_enough = self.table.filter(lambda v, i, md: len(i) >= 5,
+                                        axis='observation', inplace=False)
+        exp = long_enough.collapse(lambda i, md: i[:5], axis='observation',
+                                   norm=False)
+        self.assertEqual(sorted(obs.ids(axis='observation')),
+                         sorted(exp.ids(axis='observation')))
+        obs = obs.sort_order(exp.ids(axis='observation'), axis='observation')
+        npt.assert_array_equal(obs.matrix_data.toarray(),
+                               exp.matrix_data.toarray())
+        self.assertEqual(list(obs.ids()), list(exp.ids()))
+
+    def test_first_appearance_order(self):
+        obs = trim_and_collapse(self.table, 4)
+        self.assertEqual(list(obs.ids(axis='observation')),
+                         ['ACGT', 'TTGT'])
+        npt.assert_array_equal(obs.matrix_data.toarray(),
+                               [self.counts[[0, 1, 5]].sum(axis=0),
+                                self.counts[[2, 4]].sum(axis=0)])
+
+    def test_length_of_longest(self):
+        obs = trim_and_collapse(self.table, 7)
+        self.assertEqual(list(obs.ids(axis='observation')), ['TTGTAGG'])
+        npt.assert_array_equal(obs.matrix_data.toarray(), self.counts[[4]])
+
+    def test_too_long(self):
+        with self.assertRaisesRegex(ValueError, '8 characters'):
+            trim_and_collapse(self.table, 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
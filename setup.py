@@ -24,7 +24,9 @@ setup(
     license='BSD-3-Clause',
     url="http://americangut.org",
     entry_points={
-        'qiime2.plugins': ['q2-american-gut=q2_american_gut.plugin_setup:plugin']
+        'qiime2.plugins': ['q2-american-gut=q2_american_gut.plugin_setup:plugin'],
+        'console_scripts': [
+            'ag-reference-server=q2_american_gut._server:main']
     },
     zip_safe=False,
 )